@@ -1,9 +1,17 @@
+import os
 import bitmex
 import json
 import pytz
 import time
+import numpy as np
+import pandas as pd
 from datetime import datetime, timedelta
 from BitmexTracker.DataManager import DataManager
+from BitmexTracker.TickStore import TickStore, to_nanoseconds
+from BitmexTracker.ExchangeSimulator import ExchangeSimulator, fill_forward, last_valid
+
+# bitmex bin sizes in seconds
+BIN_SIZES = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
 
 class BitmexProxy(DataManager):
 
@@ -11,18 +19,21 @@ class BitmexProxy(DataManager):
         enabled = False
         timestep = None
         now = None
+        duration = timedelta(days=1)
 
     @staticmethod
-    def init_as_backtest(initial_time=datetime.now(pytz.utc) - timedelta(days=1), timestep=timedelta(seconds=1)):
+    def init_as_backtest(initial_time=datetime.now(pytz.utc) - timedelta(days=1), timestep=timedelta(seconds=1), duration=timedelta(days=1)):
         """
 
                 :param initial_time: defaults to now() - 24h
                 :param timestep: defaults to 1 second
+                :param duration: time range loaded to tick store at once, defaults to 24h
                 :return:
                 """
         BitmexProxy.backtest.enabled = True
         BitmexProxy.backtest.timestep = timestep
         BitmexProxy.backtest.now = initial_time
+        BitmexProxy.backtest.duration = duration
 
     def now(self, freezed=False, *args, **kwargs):
         """
@@ -41,12 +52,14 @@ class BitmexProxy(DataManager):
 
     class result_proxy(object):
 
-        def __init__(self, real_bitmex):
+        def __init__(self, real_bitmex, exchange=None):
             self.res = None
             self.real_bitmex = real_bitmex
+            self.exchange = exchange
 
         def result(self):
-            return self.res
+            # same shape as bravado future result: (result, http response)
+            return self.res, None
 
     class position_proxy(result_proxy):
 
@@ -63,7 +76,7 @@ class BitmexProxy(DataManager):
 
             if not BitmexProxy.backtest.enabled:
                 return self.real_bitmex.Position.Position_updateLeverage(*args, **kwargs)
-            self.res = None
+            self.res = self.exchange.set_leverage(**kwargs)
             return self
 
         def Position_get(self, *args, **kwargs):
@@ -76,13 +89,13 @@ class BitmexProxy(DataManager):
 
             if not BitmexProxy.backtest.enabled:
                 return self.real_bitmex.Position.Position_get(*args, **kwargs)
-
+            self.res = [self.exchange.position()]
+            return self
 
     class order_proxy(result_proxy):
 
         def __init__(self, *args, **kwargs):
             BitmexProxy.result_proxy.__init__(self, *args, **kwargs)
-            self.orders = []
 
         def Order_new(self, *args, **kwargs):
 
@@ -94,8 +107,35 @@ class BitmexProxy(DataManager):
 
             if not BitmexProxy.backtest.enabled:
                 return self.real_bitmex.Order.Order_new(*args, **kwargs)
-            self.orders.append(kwargs)
-            self.res = None
+            self.res = self.exchange.new_order(**kwargs)
+            return self
+
+        def Order_newBulk(self, *args, **kwargs):
+
+            """
+                    Place orders in one request, applied in order.
+
+                    :param **kwargs: same as in bitmex api-connector, orders is json list of Order_new params
+                    """
+
+            if not BitmexProxy.backtest.enabled:
+                return self.real_bitmex.Order.Order_newBulk(*args, **kwargs)
+            orders = kwargs['orders']
+            orders = json.loads(orders) if isinstance(orders, str) else orders
+            self.res = [self.exchange.new_order(**order) for order in orders]
+            return self
+
+        def Order_cancel(self, *args, **kwargs):
+
+            """
+                    Cancel orders by orderID or clOrdID.
+
+                    :param **kwargs: same as in bitmex api-connector
+                    """
+
+            if not BitmexProxy.backtest.enabled:
+                return self.real_bitmex.Order.Order_cancel(*args, **kwargs)
+            self.res = self.exchange.cancel_orders(**kwargs)
             return self
 
         def Order_cancelAll(self, *args, **kwargs):
@@ -108,8 +148,7 @@ class BitmexProxy(DataManager):
 
             if not BitmexProxy.backtest.enabled:
                 return self.real_bitmex.Order.Order_cancelAll(*args, **kwargs)
-            self.orders = []
-            self.res = None
+            self.res = self.exchange.cancel_all(**kwargs)
             return self
 
         def Order_getOrders(self, *args, **kwargs):
@@ -122,18 +161,13 @@ class BitmexProxy(DataManager):
 
             if not BitmexProxy.backtest.enabled:
                 return self.real_bitmex.Order.Order_getOrders(*args, **kwargs)
-            if 'filter' in kwargs:
-                conditions = json.loads(kwargs['filter'])
-                self.res = [order for order in self.orders
-                            if all(cond in order and order[cond] == conditions[cond] for cond in conditions)]
-            self.res = self.orders
+            self.res = self.exchange.get_orders(**kwargs)
             return self
 
     class user_proxy(result_proxy):
 
         def __init__(self, *args, **kwargs):
             BitmexProxy.result_proxy.__init__(self, *args, **kwargs)
-            self.balances = {}
 
         def User_getWalletSummary(self, *args, **kwargs):
 
@@ -144,45 +178,95 @@ class BitmexProxy(DataManager):
                     """
 
             if not BitmexProxy.backtest.enabled:
-                return self.real_bitmex.Order.Order_getOrders(*args, **kwargs)
-            self.res = self.balances
+                return self.real_bitmex.User.User_getWalletSummary(*args, **kwargs)
+            self.res = self.exchange.wallet_summary()
             return self
 
-    def __init__(self, *args, **kwargs):
+        def User_getMargin(self, *args, **kwargs):
+
+            """
+                    Get margin status.
+
+                    :param **kwargs: same as in bitmex api-connector
+                    """
+
+            if not BitmexProxy.backtest.enabled:
+                return self.real_bitmex.User.User_getMargin(*args, **kwargs)
+            self.res = self.exchange.margin()
+            return self
+
+    class trade_proxy(result_proxy):
+
+        def __init__(self, proxy, *args, **kwargs):
+            BitmexProxy.result_proxy.__init__(self, *args, **kwargs)
+            self.proxy = proxy
+
+        def Trade_getBucketed(self, binSize='1m', partial=False, count=100, reverse=False, *args, **kwargs):
+
+            """
+                    Get trade buckets built from ticks replayed so far.
+
+                    :param **kwargs: same as in bitmex api-connector
+                    """
+
+            if not BitmexProxy.backtest.enabled:
+                return self.real_bitmex.Trade.Trade_getBucketed(*args, binSize=binSize, partial=partial, count=count,
+                                                                reverse=reverse, **kwargs)
+            candles = self.proxy.ohlcv(binSize, partial=partial)
+            candles = candles[::-1][:count] if reverse else candles[-count:]
+            # bitmex buckets are labeled by close time
+            seconds = BIN_SIZES[binSize]
+            self.res = [{'timestamp': datetime.fromtimestamp(c[0] / 1000 + seconds, pytz.utc), 'symbol': 'XBTUSD',
+                         'open': c[1], 'high': c[2], 'low': c[3], 'close': c[4], 'volume': c[5]} for c in candles]
+            return self
+
+    class ccxt_proxy(object):
+        """ccxt bitmex connector methods used by traders, register with clients.register_client(kind='ccxt')"""
+
+        def __init__(self, proxy):
+            self.proxy = proxy
+
+        def milliseconds(self):
+            return int(self.proxy.now(freezed=True).timestamp() * 1000)
+
+        def fetch_ohlcv(self, symbol='BTC/USD', timeframe='1m', since=None, limit=None, params={}):
+            candles = self.proxy.ohlcv(timeframe, partial=params.get('partial', True))
+            if since is not None:
+                newer = [c for c in candles if c[0] >= since]
+                # bitmex has no closed bar after `since` inside forming bar, last closed one is the closest answer
+                candles = newer if newer or not candles else candles[-1:]
+            return candles[:limit] if limit else candles
+
+    def __init__(self, *args, balance=1., **kwargs):
         DataManager.__init__(self, **kwargs)
         self.real_bitmex = bitmex.bitmex(*args, **kwargs)
-        self.Order = self.order_proxy(real_bitmex=self.real_bitmex)
-        self.Position = self.position_proxy(real_bitmex=self.real_bitmex)
-        self.User = self.user_proxy(real_bitmex=self.real_bitmex)
-
-    def update_balance(self, side, market_data, amount):
-        if side == 'Buy':
-            price = market_data['buy']
-            pass # TODO: update data returned by User_getWalletSummary
-        else:
-            price = market_data['sell']
-            pass  # TODO: update data returned by User_getWalletSummary
-
-    def execute_order(self, order, timestamp, market_data):
+        self.exchange = ExchangeSimulator(balance=balance)
+        self.Order = self.order_proxy(real_bitmex=self.real_bitmex, exchange=self.exchange)
+        self.Position = self.position_proxy(real_bitmex=self.real_bitmex, exchange=self.exchange)
+        self.User = self.user_proxy(real_bitmex=self.real_bitmex, exchange=self.exchange)
+        self.Trade = self.trade_proxy(self, real_bitmex=self.real_bitmex, exchange=self.exchange)
+        self.ccxt = self.ccxt_proxy(self)
+        self.tick_store = None
+        self.tick_store_range = None
+
+    def load_tick_store(self, time_from, time_to, verbose=False):
+        """
+                Opens tick store of time range, it is built from cached tickers, orderbooks and volumes on first use
 
-        if order['ordType'] == 'Market':
-            self.update_balance(order['side'], market_data, order['orderQty'])
-            self.logger.info('Market order executed {}'.format(timestamp))
-            return
-        elif order['ordType'] == 'Limit':
-            pass
-        elif order['ordType'] == 'Stop':
-            pass
-        elif order['ordType'] == 'StopLimit':
-            pass
-        elif order['ordType'] == 'MarketIfTouched':
-            pass
-        elif order['ordType'] == 'LimitIfTouched':
-            pass
-        elif order['ordType'] == 'MarketWithLeftOverAsLimit':
-            pass
-        elif order['ordType'] == 'Pegged':
-            pass
+                :param time_from:
+                :param time_to:
+                :param verbose: dafaults to False
+                :return: TickStore
+                """
+        cache_dir = '{}/{}/{}'.format(self.cached_data_dir, self.index_prefix.replace('.', '_'), self.cache_subdirs.ticks)
+        path = '{}/{}_{}'.format(cache_dir, time_from.strftime('%Y_%m_%d_%H_%M_%S'), time_to.strftime('%Y_%m_%d_%H_%M_%S'))
+        try:
+            self.tick_store = TickStore(path)
+        except FileNotFoundError:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.tick_store = TickStore.build(path, self.iter_TOV(time_from=time_from, time_to=time_to, verbose=verbose))
+        self.tick_store_range = (time_from, time_to)
+        return self.tick_store
 
     def tick(self):
         """
@@ -191,17 +275,87 @@ class BitmexProxy(DataManager):
                 :return: None
                 """
 
-        # get tickers, orderbooks and volumes between now and next timestamp
-        tov = self.get_TOV(time_from=self.backtest.now, time_to=self.backtest.now + self.backtest.timestep)
+        time_from = self.backtest.now
+        time_to = self.backtest.now + self.backtest.timestep
+        if self.tick_store is None or time_from < self.tick_store_range[0] or time_to > self.tick_store_range[1]:
+            self.load_tick_store(time_from, max(time_from + self.backtest.duration, time_to))
 
-        not_executed_orders = []
+        # get tickers, orderbooks and volumes between now and next timestamp, views of memory-mapped store
+        ticks = self.tick_store.range(time_from, time_to)
+        timestamps = ticks['timestamp']
+        n = len(timestamps)
+        if n == 0:
+            return
+        last = ticks['last'] if 'last' in ticks else np.full(n, np.nan)
+        volume = ticks['volume'] if 'volume' in ticks else np.zeros(n)
+
+        # stored buy side is ascending with best bid at depth - 1, sell side starts from best ask
+        rows = np.arange(n)
+        if 'asks' in ticks:
+            buy_depth = ticks['asks_depth']
+            bid = np.where(buy_depth > 0, ticks['asks'][rows, np.maximum(buy_depth - 1, 0), 0], np.nan)
+            buy_rows = last_valid(buy_depth > 0)
+        else:
+            bid = np.full(n, np.nan)
+        if 'bids' in ticks:
+            sell_depth = ticks['bids_depth']
+            ask = np.where(sell_depth > 0, ticks['bids'][:, 0, 0], np.nan)
+            sell_rows = last_valid(sell_depth > 0)
+        else:
+            ask = np.full(n, np.nan)
+
+        # tickers, orderbooks and volumes are rows of their own, replay skips ticks, so prices and book
+        # are carried forward as on_tick() carries them
+        exchange = self.exchange
+        last = fill_forward(last, exchange.last)
+        bid = fill_forward(bid, exchange.bids[0, 0] if len(exchange.bids) else np.nan)
+        ask = fill_forward(ask, exchange.asks[0, 0] if len(exchange.asks) else np.nan)
+        bid = np.where(np.isnan(bid), last, bid)
+        ask = np.where(np.isnan(ask), last, ask)
+
+        def book(i):
+            bids = asks = None
+            if 'asks' in ticks and buy_rows[i] >= 0:
+                j = buy_rows[i]
+                bids = ticks['asks'][j, :buy_depth[j]][::-1]
+            if 'bids' in ticks and sell_rows[i] >= 0:
+                j = sell_rows[i]
+                asks = ticks['bids'][j, :sell_depth[j]]
+            return bids, asks
+
+        # only ticks which trigger orders, funding or liquidation are applied one by one
+        self.exchange.replay(timestamps, last, bid, ask, np.nan_to_num(volume), book)
+
+    def ohlcv(self, timeframe='1m', partial=False):
+        """
+                OHLCV of replayed ticks of loaded tick store in ccxt format, from last price
 
-        # tick by tick scanning data
-        for timestamp, market_data in tov.iterrows():
-            not_executed_orders = [order for order in self.Order.orders
-                               if (not order['open']) or (not self.execute_order(order, timestamp, market_data))]
+                :param timeframe: bitmex bin, e.g. '1m' or '1h'
+                :param partial: include bar which is not closed yet
+                :return: list of [open time ms, open, high, low, close, volume]
+                """
+        if self.tick_store is None:
+            return []
+        now = to_nanoseconds(self.backtest.now)
+        end = np.searchsorted(self.tick_store.timestamps, now)
+        timestamps = self.tick_store.timestamps[:end]
+        last = self.tick_store.columns['last'][:end]
+        volume = self.tick_store.columns['volume'][:end] if 'volume' in self.tick_store.columns else np.zeros(end)
+        traded = ~np.isnan(last)
+        timestamps, last, volume = timestamps[traded], last[traded], np.nan_to_num(volume[traded])
+        if len(timestamps) == 0:
+            return []
+
+        period = BIN_SIZES[timeframe] * 10 ** 9
+        bins = timestamps // period
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        ends = np.r_[starts[1:], len(bins)]
+        candles = np.column_stack((bins[starts] * (period // 10 ** 6), last[starts], np.maximum.reduceat(last, starts),
+                                   np.minimum.reduceat(last, starts), last[ends - 1], np.add.reduceat(volume, starts)))
+        if not partial and bins[-1] == now // period:
+            candles = candles[:-1]
+        return [[int(c[0])] + c[1:].tolist() for c in candles]
 
-        self.Order.orders = not_executed_orders
 
 def main():
     # dm = DataManager(clean_cache=False)
@@ -1,14 +1,61 @@
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import Elasticsearch
 import utils
 import logging
 from logging.handlers import RotatingFileHandler
 import traceback
+import time
+import json
 import pytz
-import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
 from bitmex_websocket import BitMEXWebsocket
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+from BulkWriter import BulkWriter
+from RingBuffer import RingBuffer
+from OrderBook import OrderBook, aggregate
+
+
+class TrackerWebsocket(BitMEXWebsocket):
+    """
+            BitMEXWebsocket which applies orderBookL2 deltas to OrderBook arrays
+            instead of searching for every level in list of dicts.
+
+            Other tables are handled by BitMEXWebsocket, after that consumers waiting
+            in wait_for_changes() are woken up with names of changed tables.
+            """
+
+    def __init__(self, orderbook, *args, **kwargs):
+        self.orderbook = orderbook
+        self.changed = set()
+        self.changed_condition = Condition()
+        super().__init__(*args, **kwargs)
+
+    def _BitMEXWebsocket__on_message(self, *args):
+        # websocket-client passes (ws, message) or (message) depending on version
+        message = json.loads(args[-1])
+        table = message.get('table')
+        if table == 'orderBookL2' and 'action' in message:
+            # order book is read directly at snapshot time, nobody has to be woken up
+            self.orderbook.apply(message['action'], message['data'])
+            return
+
+        BitMEXWebsocket._BitMEXWebsocket__on_message(self, *args)
+        if table is not None and 'action' in message:
+            with self.changed_condition:
+                self.changed.add(table)
+                self.changed_condition.notify_all()
+
+    def wait_for_changes(self, timeout=None):
+        """Blocks until some table is changed, returns set of changed tables (empty on timeout)"""
+        with self.changed_condition:
+            if not self.changed:
+                self.changed_condition.wait(timeout)
+            changed = self.changed
+            self.changed = set()
+        return changed
+
+    def connected(self):
+        return self.ws.sock is not None and self.ws.sock.connected
+
 
 class BitmexTracker():
 
@@ -16,7 +63,7 @@ class BitmexTracker():
 
     def __init__(self, apikey=None, apisecret=None,
                  bitmex_address='wss://www.bitmex.com/realtime',
-                 es_address='elasticsearch:9200'):
+                 es_address='elasticsearch:9200', writers=1, snapshots_buffer=600):
 
         self.running_lock = Lock()
         self.data_lock = Lock()
@@ -28,8 +75,8 @@ class BitmexTracker():
         self.es_address = es_address
 
         self.written_trades_ids = {}
-        self.current_tick = datetime.now()
-        self.previous_tick = datetime.now()
+        self.current_tick = None
+        self.previous_tick = None
 
         self.orderbook_width = 100
 
@@ -39,117 +86,188 @@ class BitmexTracker():
         self.volume_pool = []
 
         self.ticker = None
-        self.asks = None
-        self.bids = None
+        self.orderbook = OrderBook()
         self.trades = None
         self.instrument = None
 
         self.ws_logger = None
         self.es_logger = None
 
+        self.writer = BulkWriter(self.es, self.setup_logger('ES writer'))
+
+        # snapshots are captured every second and persisted by writer threads
+        self.snapshots = RingBuffer(snapshots_buffer)
+        self.late_threshold = 0.5
+        self.late_snapshots = 0
+        self.missed_snapshots = 0
+        self.stats_interval = 60
+
+        # held while tracker runs, taken before any thread starts so writers never see it released
+        # before capture has begun; released on shutdown, then writers drain the buffer and exit
+        self.running_lock.acquire()
+
         self.es_thread = Thread(target=self.tick)
         self.es_thread.start()
 
+        self.writer_threads = [Thread(target=self.write_snapshots) for _ in range(writers)]
+        for thread in self.writer_threads:
+            thread.start()
+
     def tick(self):
+        """
+                Capture stage: takes snapshot of collected data at the beginning of every second
+                and puts it to ring buffer, writers persist it independently from ES latency.
+                """
 
         logger = self.setup_logger('ES')
 
-        self.running_lock.acquire()
+        stats_started = time.time()
 
         while self.running_lock.locked():
 
             try:
+                # sleep till the beginning of next second
+                time.sleep(1 - time.time() % 1)
+
+                now = datetime.now(pytz.utc)
+                self.current_tick = now.replace(microsecond=0)
+
+                if self.previous_tick is not None:
+                    self.missed_snapshots += max(int((self.current_tick - self.previous_tick).total_seconds()) - 1, 0)
+                if (now - self.current_tick).total_seconds() > self.late_threshold:
+                    self.late_snapshots += 1
 
-                self.current_tick = datetime.now(pytz.utc).replace(microsecond=0)
-                if (self.current_tick.second != self.previous_tick.second):
-
-                    self.data_lock.acquire()
-                    try:
-                        if self.ticker:
-                            ticker = self.ticker.copy()
-                        else:
-                            ticker = None
-
-                        # if self.trades:
-                        #     trades = self.trades.copy()
-                        # else:
-                        #     trades = None
-
-                        if self.instrument:
-                            instrument = self.instrument.copy()
-                        else:
-                            instrument = None
-
-                        asks = self.asks
-                        bids = self.bids
-                    finally:
-                        self.data_lock.release()  # release lock, no matter what
-
-                    if asks is None or bids is None or ticker is None or instrument is None:
-                        continue
-
-
-                    logger.info('Ticker at timestamp.second {}: \033[94m{}\033[0m'
-                                .format(self.current_tick.second, ticker))
-                    ticker['timestamp'] = self.current_tick
-                    self.es.create(index='{}.tickers'.format(self.index_prefix), id=utils.generate_nonce(),
-                                   doc_type='ticker', body=ticker)
-
-                    instrument['timestamp'] = self.current_tick
-                    self.es.create(index='{}.instrument'.format(self.index_prefix), id=utils.generate_nonce(),
-                                   doc_type='instrument', body=instrument)
-
-                    # Calculate average volume
-                    if instrument['volume'] != self.last_volume:
-                        if instrument['volume'] < self.last_volume:
-                            volume = instrument['volume']
-                            self.last_volume = instrument['volume']
-                        else:
-                            volume = instrument['volume'] - self.last_volume
-                        self.volume_pool.append(self.current_tick)
-                        for timestamp in self.volume_pool:
-                            self.es.create(index='{}.volumes'.format(self.index_prefix), id=utils.generate_nonce(),
-                                          doc_type='volume', body={'timestamp': timestamp, 'volume': volume/len(self.volume_pool)})
-                        self.volume_pool = []
-                    else:
-                        self.volume_pool.append(self.current_tick)
-                    self.last_volume = instrument['volume']
-
-                    for i in range(-1, -4, -1):
-
-                        # последовательное уменьшение разрешения, L2->L1->L0
-                        asks_frame = asks[-30*(-i):]
-                        bids_frame = bids[:30*(-i)]
-
-                        body = {
-                            'timestamp': self.current_tick,
-                            'bids': [tuple(x) for x in bids_frame.values],
-                            'asks': [tuple(x) for x in asks_frame.values]
-                        }
-                        self.es.create(index='{}.orderbooks.l{}'.format(self.index_prefix, -i - 1),
-                                       id=utils.generate_nonce(),
-                                       doc_type='orderbook', body=body)
-                        logger.info('Orderbook L{} at timestamp.second {}: ask \033[92m{}\033[0m, bid \033[91m{}\033[0m'
-                                    .format(-i - 1, self.current_tick.second, body['asks'][-1], body['bids'][0]))
-
-                        if self.current_tick.second % (10 ** (-i)) != 0:
-                            break
-
-                        bids['price'] = bids['price'].round(i)
-                        asks['price'] = asks['price'].round(i)
-
-                        asks = asks.groupby(['price']).agg({'size': np.sum}).reset_index()
-                        bids = bids.groupby(['price']).agg({'size': np.sum}).reset_index()
+                snapshot = self.take_snapshot()
+                if snapshot is not None:
+                    self.snapshots.put(snapshot)
+
+                if time.time() - stats_started >= self.stats_interval:
+                    logger.info('Snapshots: late {}, missed {}, dropped {}, queue depth {} (max {})'.format(
+                        self.late_snapshots, self.missed_snapshots, self.snapshots.dropped,
+                        len(self.snapshots), self.snapshots.max_depth))
+                    self.snapshots.max_depth = len(self.snapshots)
+                    stats_started = time.time()
 
                 self.previous_tick = self.current_tick
 
             except:
                 logger.error('\033[91m{}\033[0m'.format(traceback.format_exc()))
+
+    def take_snapshot(self):
+        self.data_lock.acquire()
+        try:
+            if self.ticker:
+                ticker = self.ticker.copy()
+            else:
+                ticker = None
+
+            # if self.trades:
+            #     trades = self.trades.copy()
+            # else:
+            #     trades = None
+
+            if self.instrument:
+                instrument = self.instrument.copy()
+            else:
+                instrument = None
+
+        finally:
+            self.data_lock.release()  # release lock, no matter what
+
+        # buy side is stored as asks and sell side as bids, as it always was in the indices
+        orderbook = self.orderbook.snapshot()
+        if orderbook is None or ticker is None or instrument is None:
+            return None
+        asks, bids = orderbook
+
+        ticker['timestamp'] = self.current_tick
+        instrument['timestamp'] = self.current_tick
+
+        # Calculate average volume, done here to keep order of snapshots
+        volumes = []
+        if instrument['volume'] != self.last_volume:
+            if instrument['volume'] < self.last_volume:
+                volume = instrument['volume']
+                self.last_volume = instrument['volume']
+            else:
+                volume = instrument['volume'] - self.last_volume
+            self.volume_pool.append(self.current_tick)
+            for timestamp in self.volume_pool:
+                volumes.append({'timestamp': timestamp, 'volume': volume/len(self.volume_pool)})
+            self.volume_pool = []
+        else:
+            self.volume_pool.append(self.current_tick)
+        self.last_volume = instrument['volume']
+
+        return {
+            'timestamp': self.current_tick,
+            'ticker': ticker,
+            'instrument': instrument,
+            'volumes': volumes,
+            'asks': asks,
+            'bids': bids,
+        }
+
+    def write_snapshots(self):
+        """Writer stage: drains ring buffer and sends documents to ES"""
+
+        logger = self.setup_logger('ES')
+
+        while self.running_lock.locked() or len(self.snapshots) != 0:
+            snapshot = self.snapshots.get(timeout=1)
+            if snapshot is None:
+                continue
+            try:
+                self.write_snapshot(snapshot, logger)
+            except:
+                logger.error('\033[91m{}\033[0m'.format(traceback.format_exc()))
                 try:
                     self.setup_es()
                 except:
                     logger.error('Reloading ES')
 
+    def write_snapshot(self, snapshot, logger):
+        current_tick = snapshot['timestamp']
+        ticker = snapshot['ticker']
+        asks = snapshot['asks']
+        bids = snapshot['bids']
+
+        logger.info('Ticker at timestamp.second {}: \033[94m{}\033[0m'
+                    .format(current_tick.second, ticker))
+        self.writer.add(index='{}.tickers'.format(self.index_prefix),
+                        doc_type='ticker', body=ticker)
+
+        self.writer.add(index='{}.instrument'.format(self.index_prefix),
+                        doc_type='instrument', body=snapshot['instrument'])
+
+        for volume in snapshot['volumes']:
+            self.writer.add(index='{}.volumes'.format(self.index_prefix),
+                            doc_type='volume', body=volume)
+
+        asks_prices, asks_sizes = asks
+        bids_prices, bids_sizes = bids
+
+        for i in range(-1, -4, -1):
+
+            # последовательное уменьшение разрешения, L2->L1->L0
+            depth = 30*(-i)
+
+            body = {
+                'timestamp': current_tick,
+                'bids': list(zip(bids_prices[:depth].tolist(), bids_sizes[:depth].tolist())),
+                'asks': list(zip(asks_prices[-depth:].tolist(), asks_sizes[-depth:].tolist()))
+            }
+            self.writer.add(index='{}.orderbooks.l{}'.format(self.index_prefix, -i - 1),
+                            doc_type='orderbook', body=body)
+            logger.info('Orderbook L{} at timestamp.second {}: ask \033[92m{}\033[0m, bid \033[91m{}\033[0m'
+                        .format(-i - 1, current_tick.second, body['asks'][-1], body['bids'][0]))
+
+            if current_tick.second % (10 ** (-i)) != 0:
+                break
+
+            asks_prices, asks_sizes = aggregate(asks_prices, asks_sizes, i)
+            bids_prices, bids_sizes = aggregate(bids_prices, bids_sizes, i)
+
     def get_ticker(self, logger):
         ticker = self.ws.get_ticker()
         self.data_lock.acquire()
@@ -166,28 +284,6 @@ class BitmexTracker():
         finally:
             self.data_lock.release()
 
-    def get_orderbook(self, logger):
-
-        while True:
-            try:
-                orderbook = self.ws.market_depth().copy()
-                ob = pd.DataFrame(orderbook)[['price','side','size']]
-                break
-            except Exception as err:
-                logger.error(str(err))
-                ob = None
-
-        if ob is not None:
-            bids = ob[ob['side'] == 'Sell'][['price', 'size']].sort_values('price')
-            asks = ob[ob['side'] == 'Buy'][['price', 'size']].sort_values('price')
-
-            self.data_lock.acquire()
-            try:
-                self.bids = bids
-                self.asks = asks
-            finally:
-                self.data_lock.release()  # release lock, no matter what
-
     def get_trades(self, logger):
         trades = self.ws.recent_trades()
         self.data_lock.acquire()
@@ -202,11 +298,13 @@ class BitmexTracker():
     def get_funds(self, logger):
         funds = self.ws.funds()
         logger.info("Funds: %s" % funds)
-        self.es.create(index='{}.funds'.format(self.index_prefix), id=utils.generate_nonce(),
-                       doc_type='funds', body=funds)
+        self.writer.add(index='{}.funds'.format(self.index_prefix),
+                        doc_type='funds', body=funds)
 
     def setup_es(self):
         self.es = Elasticsearch(self.es_address)
+        if getattr(self, 'writer', None) is not None:
+            self.writer.es = self.es
 
         utils.create_index(self.es, '{}.tickers'.format(self.index_prefix))
         utils.create_index(self.es, '{}.orderbooks.l2'.format(self.index_prefix))
@@ -222,26 +320,33 @@ class BitmexTracker():
 
         try:
             # Instantiating the WS will make it connect. Be sure to add your api_key/api_secret.
-            self.ws = BitMEXWebsocket(endpoint=self.bitmex_address, symbol="XBTUSD",
-                                 api_key=None, api_secret=None)
+            self.ws = TrackerWebsocket(self.orderbook, endpoint=self.bitmex_address, symbol="XBTUSD",
+                                       api_key=None, api_secret=None)
 
 
             self.ws.get_instrument()
 
             logger.info('WS connector loaded')
 
-            while self.ws.ws.sock.connected:
-                self.get_ticker(logger)
-                if self.ws.api_key:
+            while self.ws.connected():
+                # timeout only lets loop notice closed connection
+                changed = self.ws.wait_for_changes(timeout=1)
+                if changed & {'instrument', 'quote', 'trade'}:
+                    self.get_ticker(logger)
+                if 'instrument' in changed:
+                    self.get_instrument(logger)
+                if 'margin' in changed and self.ws.api_key:
                     self.get_funds(logger)
-                self.get_orderbook(logger)
-                self.get_instrument(logger)
-                # self.get_trades(logger)
+                # if 'trade' in changed:
+                #     self.get_trades(logger)
         except:
             logger.error('\033[91m{}\033[0m'.format(traceback.format_exc()))
         finally:
             self.running_lock.release()
             self.es_thread.join()
+            for thread in self.writer_threads:
+                thread.join()
+            self.writer.stop()
             logger.error('\033[91mTHIS IS THE END\033[0m')
 
     def setup_logger(self, name):
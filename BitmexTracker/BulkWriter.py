@@ -0,0 +1,130 @@
+import time
+import traceback
+import uuid
+from threading import Thread, Condition
+
+from elasticsearch import helpers
+
+class BulkWriter():
+    """
+            Buffers documents and writes them to ES with bulk API.
+
+            Buffer is flushed when it holds `chunk_size` documents or `flush_interval` seconds passed
+            since previous flush. If ES is slower than collector and buffer reaches `max_buffer`
+            documents, add() blocks until there is room again (backpressure). Failed documents are
+            retried `max_retries` times with growing delay.
+            """
+
+    def __init__(self, es, logger, chunk_size=500, flush_interval=1.0, max_buffer=10000,
+                 max_retries=3, retry_delay=0.5, stats_interval=60):
+        self.es = es
+        self.logger = logger
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.stats_interval = stats_interval
+
+        self.buffer = []
+        self.condition = Condition()
+        self.running = True
+
+        # statistics
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.flush_time = 0.
+        self.max_flush_time = 0.
+        self.blocked_time = 0.
+        self.stats_started = time.time()
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, index, doc_type, body):
+        # random ids: millisecond nonces collide when several documents are written at once, and a fixed
+        # id makes retry of a document which was written before the failure overwrite it, not duplicate it
+        action = {'_index': index, '_type': doc_type, '_id': uuid.uuid4().hex, '_source': body}
+        with self.condition:
+            if len(self.buffer) >= self.max_buffer:
+                blocked = time.time()
+                while len(self.buffer) >= self.max_buffer and self.running:
+                    self.condition.wait(self.flush_interval)
+                self.blocked_time += time.time() - blocked
+            self.buffer.append(action)
+            if len(self.buffer) >= self.chunk_size:
+                self.condition.notify_all()
+
+    def run(self):
+        last_flush = time.time()
+        while self.running or self.buffer:
+            with self.condition:
+                timeout = last_flush + self.flush_interval - time.time()
+                if len(self.buffer) < self.chunk_size and timeout > 0 and self.running:
+                    self.condition.wait(timeout)
+                actions = self.buffer
+                self.buffer = []
+                self.condition.notify_all()
+
+            last_flush = time.time()
+            if actions:
+                self.flush(actions)
+            self.log_stats()
+
+    def flush(self, actions):
+        started = time.time()
+        for attempt in range(self.max_retries + 1):
+            retry = []
+            processed = 0
+            try:
+                results = helpers.streaming_bulk(self.es, actions, chunk_size=self.chunk_size,
+                                                 raise_on_error=False, raise_on_exception=False)
+                # results come in the same order as actions
+                for action, (ok, item) in zip(actions, results):
+                    if ok:
+                        self.written += 1
+                    else:
+                        status = list(item.values())[0].get('status')
+                        # connection errors come with status 'N/A'
+                        if not isinstance(status, int) or status == 429 or status >= 500:
+                            retry.append(action)
+                        else:
+                            self.failed += 1
+                            self.logger.error('Document rejected: {}'.format(item))
+                    processed += 1
+            except Exception:
+                self.logger.error('\033[91m{}\033[0m'.format(traceback.format_exc()))
+                retry += actions[processed:]
+
+            if not retry:
+                break
+            actions = retry
+            self.logger.error('{} documents failed, attempt {}'.format(len(actions), attempt + 1))
+            if attempt < self.max_retries:
+                time.sleep(self.retry_delay * 2 ** attempt)
+        else:
+            self.failed += len(actions)
+
+        flush_time = time.time() - started
+        self.flushes += 1
+        self.flush_time += flush_time
+        self.max_flush_time = max(self.max_flush_time, flush_time)
+
+    def log_stats(self):
+        elapsed = time.time() - self.stats_started
+        if elapsed < self.stats_interval:
+            return
+        self.logger.info('ES writer: {:.1f} docs/s, {} flushes, avg flush {:.3f}s, max flush {:.3f}s, '
+                         'failed {}, blocked {:.3f}s, buffered {}'.format(
+                             self.written / elapsed, self.flushes, self.flush_time / max(self.flushes, 1),
+                             self.max_flush_time, self.failed, self.blocked_time, len(self.buffer)))
+        self.written = self.failed = self.flushes = 0
+        self.flush_time = self.max_flush_time = self.blocked_time = 0.
+        self.stats_started = time.time()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
@@ -1,20 +1,28 @@
 import os
+import ast
+import json
 import time
 import logging
 from logging.handlers import RotatingFileHandler
 import shutil
+import numpy as np
 import pandas as pd
 import pytz
 import requests
 import elasticsearch
 import progressbar
+from threading import local
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 
 CONNECTION_TIMEOUT = 120
 TIMES_TO_TRY = 3
 RETRY_DELAY = 60
 
+# hourly batch is a directory with one .npy file per column
+CACHE_SUFFIX = '.npcache'
+
 def generate_nonce():
     return int(time.time()*1000)
 
@@ -44,10 +52,142 @@ def retry(ExceptionToCheck, logger, tries=TIMES_TO_TRY, delay=RETRY_DELAY):
 
 
 
+def is_levels(values):
+    """True if object column holds order book levels, lists of [price, size]"""
+    return len(values) > 0 and all(isinstance(x, (list, tuple, np.ndarray)) for x in values)
+
+
+def levels_to_array(values):
+    """Order book levels to fixed-width array (rows, width, 2) padded with NaN and number of levels in each row"""
+    depths = np.fromiter((len(x) for x in values), dtype=np.int32, count=len(values))
+    levels = np.full((len(values), depths.max() if len(depths) else 0, 2), np.nan)
+    for i, x in enumerate(values):
+        if depths[i]:
+            levels[i, :depths[i]] = x
+    return levels, depths
+
+
+def array_to_levels(levels, depths):
+    """Column of per-row views into levels array, without padding"""
+    column = np.empty(len(depths), dtype=object)
+    for i, depth in enumerate(depths):
+        column[i] = levels[i, :depth]
+    return column
+
+
+def write_columnar(path, df):
+    """
+            Saves dataframe as directory of .npy files, one per column. Order book levels
+            are saved as fixed-width float arrays. Directory appears atomically.
+
+            :param path: batch directory
+            :param df: dataframe with datetime index
+            """
+    tmp = '{}.tmp{}'.format(path, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    index = pd.DatetimeIndex(df.index)
+    meta = {'index': df.index.name, 'tz': str(index.tz) if index.tz is not None else None,
+            'columns': [str(column) for column in df.columns], 'levels': []}
+    np.save(os.path.join(tmp, 'index.npy'), (index.tz_convert(None) if index.tz is not None else index).values)
+
+    for i in range(len(df.columns)):
+        values = df.iloc[:, i].to_numpy()
+        if values.dtype == object and is_levels(values):
+            levels, depths = levels_to_array(values)
+            np.save(os.path.join(tmp, '{}.npy'.format(i)), levels)
+            np.save(os.path.join(tmp, '{}.depth.npy'.format(i)), depths)
+            meta['levels'].append(i)
+        else:
+            np.save(os.path.join(tmp, '{}.npy'.format(i)), values, allow_pickle=values.dtype == object)
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # batch was written by someone else meanwhile
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def read_columnar(path):
+    """
+            Loads dataframe saved by write_columnar()
+
+            :param path: batch directory
+            :return: dataframe, order book columns hold (levels, 2) arrays
+            """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    index = pd.DatetimeIndex(np.load(os.path.join(path, 'index.npy')), name=meta['index'])
+    if meta['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(meta['tz'])
+
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        filename = os.path.join(path, '{}.npy'.format(i))
+        if i in meta['levels']:
+            data[column] = array_to_levels(np.load(filename), np.load(os.path.join(path, '{}.depth.npy'.format(i))))
+        else:
+            data[column] = np.load(filename, allow_pickle=True)
+    return pd.DataFrame(data, index=index, columns=meta['columns'])
+
+
+def concat_chunks(chunks):
+    """Concatenates dataframes once, empty dataframe if there are none"""
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='timestamp'))
+    return pd.concat(chunks)
+
+
+def documents_frame(documents):
+    """Dataframe of ES documents indexed by their timestamp"""
+    df = pd.DataFrame(documents).set_index('timestamp')
+    df.index = pd.to_datetime(df.index, format='%Y-%m-%d %H:%M:%S.%f')
+    return df
+
+
+def parse_levels(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        # tuples were written by older versions
+        return ast.literal_eval(value)
+
+
+def read_csv_batch(filename, parse=True):
+    """
+            Loads batch from old CSV cache
+
+            :param filename:
+            :param parse: parse stringified order book levels
+            :return:
+            """
+    df = pd.read_csv(filename)
+    if 'timestamp' in df:
+        df = df.set_index('timestamp')
+    # batches of different indices were saved with and without microseconds and timezone
+    df.index = pd.to_datetime(df.index)
+    if parse:
+        for column in df.columns:
+            values = df[column].values
+            # object dtype holds strings before pandas 3, str dtype since
+            if pd.api.types.is_string_dtype(values.dtype) and len(values) and all(isinstance(x, str) and x.startswith(('[', '(')) for x in values):
+                df[column] = [parse_levels(x) for x in values]
+    return df
+
+
 class DataManager(object):
 
     logger = None
 
+    # set in threads downloading batches, so nested cachers do not start their own pools
+    prefetch_state = local()
+
     class cache_subdirs():
         tickers = 'tickers'
         orderbooks = 'orderbooks'
@@ -55,11 +195,13 @@ class DataManager(object):
         volumes = 'volumes'
         candles = 'candles'
         all_data = 'all_data'
+        ticks = 'ticks'
 
     def __init__(self, host='91.235.136.166',
                  es_port=9200, influxdb_port=8086,
                  index_prefix='btcusd.bitmex',
                  cached_data_dir='./data', clean_cache=True,
+                 download_workers=4, scroll_slices=1,
                  *args, **kwargs):
         """
 
@@ -69,6 +211,8 @@ class DataManager(object):
                 :param index_prefix: defaults to 'btcusd.bitmex'
                 :param cached_data_dir: path to cache files
                 :param clean_cache: True or False, defaults to True
+                :param download_workers: number of hourly batches downloaded concurrently, 1 to download one by one
+                :param scroll_slices: number of parallel sliced scrolls per download, helps for large hours
                 :param test: defaults to real exchange
                 :param **kwargs: bitmex apikey, apisecret e.t.c same as in bitmex connector
                 """
@@ -81,6 +225,9 @@ class DataManager(object):
 
         self.scroll_time = '30m'
 
+        self.download_workers = download_workers
+        self.scroll_slices = scroll_slices
+
         self.es = None
         self.influxdb = None
         self.create_es_connection()
@@ -109,7 +256,9 @@ class DataManager(object):
 
                 :return:
                 """
-        self.es = elasticsearch.Elasticsearch(self.host, timeout=CONNECTION_TIMEOUT)
+        # every worker and scroll slice holds its own connection
+        self.es = elasticsearch.Elasticsearch(self.host, timeout=CONNECTION_TIMEOUT,
+                                              maxsize=max(10, self.download_workers * self.scroll_slices))
 
     @retry(elasticsearch.exceptions.ConnectionError, logger, tries=TIMES_TO_TRY)
     def get_indices_by_re(self, re):
@@ -134,16 +283,62 @@ class DataManager(object):
         data = { "index": { "blocks": { "read_only_allow_delete": "false" } } }
         requests.put('{host}:{port}/{index}/_settings?pretty'.format(host=self.host, port=self.es_port, index=index), data)
 
-    def download_data_by_time(self, index, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
+    def clear_scroll(self, scroll_id):
+        try:
+            self.es.clear_scroll(scroll_id=scroll_id)
+        except elasticsearch.exceptions.ElasticsearchException:
+            # scroll expires anyway
+            pass
+
+    def scroll_slice(self, index, body, slice_id, slices):
+        """
+                Downloads one slice of sliced scroll
+
+                :return: list of documents
+                """
+        page = self.es.search(index=index, scroll=self.scroll_time, size=1000,
+                              body=dict(body, slice={'id': slice_id, 'max': slices}))
+        data = []
+        while page['hits']['hits']:
+            data += [item['_source'] for item in page['hits']['hits']]
+            page = self.es.scroll(scroll_id=page['_scroll_id'], scroll=self.scroll_time)
+        self.clear_scroll(page['_scroll_id'])
+        return data
+
+    def download_data_by_time(self, index, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False, slices=None):
         if time_from is None:
             time_from = time_to - td
+        if slices is None:
+            slices = self.scroll_slices
+
+        if slices > 1:
+            body = { "query": { "range": { "timestamp": { "gte": time_from, "lt": time_to, } } } }
+            with ThreadPoolExecutor(max_workers=slices) as pool:
+                parts = list(pool.map(lambda slice_id: self.scroll_slice('{}.{}'.format(self.index_prefix, index), body, slice_id, slices),
+                                      range(slices)))
+            # slices come in arbitrary order, sorted as pages of single scroll below
+            return concat_chunks(documents_frame(part) for part in parts if part).sort_index(kind='mergesort')
+
+        # stable sort keeps order of documents written within one millisecond
+        return concat_chunks(self.scroll_chunks(index, time_from, time_to, verbose)).sort_index(kind='mergesort')
+
+    def scroll_chunks(self, index, time_from, time_to, verbose=False):
+        """
+                Yields scroll pages of index as dataframes
 
+                :param index: index without prefix
+                :param time_from:
+                :param time_to:
+                :param verbose: show progress bar
+                :return: generator of dataframes
+                """
         page = self.es.search(
             index='{}.{}'.format(self.index_prefix, index),
             scroll=self.scroll_time,
             size=1000,
             body={ "query": { "range": { "timestamp": { "gte": time_from, "lt": time_to, } } } },
-            sort='_id'
+            # ids are random since BulkWriter stopped writing millisecond nonces, time order comes from timestamp
+            sort='timestamp:asc'
         )
         sid = page['_scroll_id']
         scrolled = len(page['hits']['hits'])
@@ -162,22 +357,21 @@ class DataManager(object):
                 widgets=widgets, maxval=scroll_size).start()
             bar.update(scrolled)
 
-        data = [item['_source'] for item in page['hits']['hits']]
-        df = pd.DataFrame(data).set_index('timestamp')
-
-        while (scrolled < scroll_size):
-            page = self.es.scroll(scroll_id=sid, scroll=self.scroll_time)
-            # Update the scroll ID
-            sid = page['_scroll_id']
-            # Get the number of results that we returned in the last scroll
-            scrolled += len(page['hits']['hits'])
-            if verbose:
-                bar.update(scrolled)
-            data = [item['_source'] for item in page['hits']['hits']]
-            df = df.append(pd.DataFrame(data).set_index('timestamp'))
-
-        df.index = pd.to_datetime(df.index, format='%Y-%m-%d %H:%M:%S.%f')
-        return df
+        try:
+            while page['hits']['hits']:
+                yield documents_frame([item['_source'] for item in page['hits']['hits']])
+
+                if scrolled >= scroll_size:
+                    break
+                page = self.es.scroll(scroll_id=sid, scroll=self.scroll_time)
+                # Update the scroll ID
+                sid = page['_scroll_id']
+                # Get the number of results that we returned in the last scroll
+                scrolled += len(page['hits']['hits'])
+                if verbose:
+                    bar.update(scrolled)
+        finally:
+            self.clear_scroll(sid)
 
     def __get_instruments_uncached(self, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
         return self.download_data_by_time(index='instruments', td=td, time_from=time_from, time_to=time_to, verbose=verbose)
@@ -209,6 +403,18 @@ class DataManager(object):
                 """
         return self.cacher(data_getter=self.__get_tickers_uncached, td=td, time_from=time_from, time_to=time_to, verbose=verbose, subdir=self.cache_subdirs.tickers)
 
+    def iter_tickers(self, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
+        """
+                Same as get_tickers() but yields one-hour dataframes, so months of data can be processed in constant memory
+
+                :param td: timedelta if not time_from
+                :param time_from:
+                :param time_to:
+                :param verbose: dafaults to False
+                :return: generator of dataframes
+                """
+        return self.iter_batches(data_getter=self.__get_tickers_uncached, td=td, time_from=time_from, time_to=time_to, verbose=verbose, subdir=self.cache_subdirs.tickers)
+
     def __get_volumes_uncached(self, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
         return self.download_data_by_time(index='volumes', td=td, time_from=time_from, time_to=time_to, verbose=verbose)
 
@@ -240,6 +446,19 @@ class DataManager(object):
                 """
         return self.cacher(level=level, data_getter=self.__get_orderbooks_uncached, td=td, time_from=time_from, time_to=time_to, verbose=verbose, subdir=self.cache_subdirs.orderbooks)
 
+    def iter_orderbooks(self, level=0, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
+        """
+                Same as get_orderbooks() but yields one-hour dataframes, so months of data can be processed in constant memory
+
+                :param level: 0 - 0.5$ resolution, 1 - 10$, or 2 - 100$
+                :param td: timedelta if not time_from
+                :param time_from:
+                :param time_to:
+                :param verbose: dafaults to False
+                :return: generator of dataframes
+                """
+        return self.iter_batches(level=level, data_getter=self.__get_orderbooks_uncached, td=td, time_from=time_from, time_to=time_to, verbose=verbose, subdir=self.cache_subdirs.orderbooks)
+
     def __get_candles_uncached(self, period='1min', td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
         tickers = self.cacher(td=td, time_from=time_from, time_to=time_to, verbose=verbose, data_getter=self.get_tickers, subdir=self.cache_subdirs.tickers)
         tickers.rename(columns = {'mid':'price'}, inplace = True)
@@ -283,6 +502,18 @@ class DataManager(object):
                 """
         return self.cacher(data_getter=self.__get_TOV_uncached, time_from=time_from, td=td, time_to=time_to, verbose=verbose, subdir=self.cache_subdirs.all_data)
 
+    def iter_TOV(self, td=timedelta(minutes=5), time_from=None, time_to=datetime.now(pytz.utc), verbose=False):
+        """
+                Same as get_TOV() but yields one-hour dataframes
+
+                :param td: timedelta if not time_from
+                :param time_from:
+                :param time_to:
+                :param verbose: dafaults to False
+                :return: generator of dataframes
+                """
+        return self.iter_batches(data_getter=self.__get_TOV_uncached, time_from=time_from, td=td, time_to=time_to, verbose=verbose, subdir=self.cache_subdirs.all_data)
+
     def create_index(self, index):
         if (self.es.indices.exists(index)):
             logging.info('Already Exists, Skipping:! ' + index)
@@ -299,7 +530,82 @@ class DataManager(object):
             os.makedirs(path)
         return path
 
-    def cacher(self, subdir, data_getter, time_from, td, time_to, verbose, *args, **kwargs):
+    def __batch_filename(self, cache_dir, time_, kwargs):
+        return cache_dir + '/' + '{time_from}_{time_to}'.format(
+            time_from=self.__format_datetime(time_),
+            time_to=self.__format_datetime(time_ + timedelta(hours=1))
+        ) + '_'.join(['_%s=%s' % (key, value) for (key, value) in kwargs.items()])
+
+    def __download_batch(self, filename, data_getter, time_, **kwargs):
+        df_h = data_getter(**kwargs, time_from=time_, time_to=time_ + timedelta(hours=1))
+        df_h.index = pd.to_datetime(df_h.index, format='%Y-%m-%d %H:%M:%S.%f')
+        write_columnar(filename + CACHE_SUFFIX, df_h)
+        return df_h
+
+    def __prefetch_batch(self, filename, data_getter, time_, **kwargs):
+        self.prefetch_state.active = True
+        try:
+            self.__download_batch(filename, data_getter, time_, **kwargs)
+        finally:
+            self.prefetch_state.active = False
+
+    def prefetch(self, subdir, data_getter, hours, verbose=False, **kwargs):
+        """
+                Downloads missing hourly batches concurrently with `download_workers` threads
+
+                :param subdir: cache subdir
+                :param data_getter: uncached getter of one batch
+                :param hours: start times of batches
+                :param verbose: show progress bar of completed batches
+                :param kwargs: data_getter kwargs
+                :return: number of downloaded batches
+                """
+        cache_dir = self.__check_folder(self.cached_data_dir + '/' + self.index_prefix.replace('.', '_'))
+        cache_dir = self.__check_folder(cache_dir + '/' + subdir)
+
+        missing = []
+        for time_ in hours:
+            filename = self.__batch_filename(cache_dir, time_, kwargs)
+            if not os.path.exists(filename + CACHE_SUFFIX) and not os.path.exists(filename + '.csv'):
+                missing.append((filename, time_))
+        if not missing:
+            return 0
+
+        if verbose:
+            widgets = ['Downloading {index} one-hour batches'.format(index=str(subdir)),
+                       progressbar.Bar(left='[', marker='#', right=']'),
+                       progressbar.FormatLabel(' [%(value)i/%(max)i] ['),
+                       progressbar.Percentage(),
+                       progressbar.FormatLabel('] [%(elapsed)s] ['),
+                       progressbar.ETA(), '] [',
+                       progressbar.FileTransferSpeed(unit='batches'), ']'
+                       ]
+            bar = progressbar.ProgressBar(
+                widgets=widgets, maxval=len(missing)).start()
+
+        with ThreadPoolExecutor(max_workers=self.download_workers) as pool:
+            futures = [pool.submit(self.__prefetch_batch, filename, data_getter, time_, **kwargs)
+                       for filename, time_ in missing]
+            for completed, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if verbose:
+                    bar.update(completed)
+
+        return len(missing)
+
+    def iter_batches(self, subdir, data_getter, time_from, td, time_to, verbose, *args, **kwargs):
+        """
+                Yields cached data by one-hour batches, missing batches are downloaded and cached
+
+                :param subdir: cache subdir
+                :param data_getter: uncached getter of one batch
+                :param time_from:
+                :param td: timedelta if not time_from
+                :param time_to:
+                :param verbose: show progress bar
+                :param kwargs: data_getter kwargs
+                :return: generator of dataframes
+                """
 
         cache_dir = self.__check_folder(self.cached_data_dir + '/' + self.index_prefix.replace('.', '_'))
         cache_dir = self.__check_folder(cache_dir + '/' + subdir)
@@ -310,7 +616,14 @@ class DataManager(object):
         time_ = time_from.replace(minute=0, second=0, microsecond=0)
         batches_ready = 0
 
-        df = pd.DataFrame()
+        time_to_compare = time_to.replace(minute=0, second=0, microsecond=0)
+
+        hours = []
+        while time_ + timedelta(hours=len(hours)) < time_to_compare:
+            hours.append(time_ + timedelta(hours=len(hours)))
+
+        if self.download_workers > 1 and len(hours) > 1 and not getattr(self.prefetch_state, 'active', False):
+            self.prefetch(subdir, data_getter, hours, verbose, **kwargs)
 
         if verbose:
             widgets = ['Getting {index} data by one-hour batches'.format(index=str(subdir)),
@@ -322,26 +635,22 @@ class DataManager(object):
                        progressbar.FileTransferSpeed(unit='batches'), ']'
                        ]
             bar = progressbar.ProgressBar(
-                widgets=widgets, maxval=time_to.hour - time_from.hour).start()
+                widgets=widgets, maxval=len(hours) + 1).start()
             bar.update(batches_ready)
 
-        time_to_compare = time_to.replace(minute=0, second=0, microsecond=0)
-
         while time_ < time_to_compare:
-            filename = cache_dir + '/' + '{time_from}_{time_to}'.format(
-                time_from=self.__format_datetime(time_),
-                time_to=self.__format_datetime(time_ + timedelta(hours=1))
-            ) + '_'.join(['_%s=%s' % (key, value) for (key, value) in kwargs.items()]) + '.csv'
+            filename = self.__batch_filename(cache_dir, time_, kwargs)
             try:
-                df_h = pd.read_csv(filename)
-                if 'timestamp' in df_h:
-                    df_h = df_h.set_index('timestamp')
+                df_h = read_columnar(filename + CACHE_SUFFIX)
             except FileNotFoundError:
-                df_h = data_getter(**kwargs, time_from=time_, time_to=time_ + timedelta(hours=1))
-                df_h.to_csv(filename)
-            df_h.index = pd.to_datetime(df_h.index, format='%Y-%m-%d %H:%M:%S.%f')
+                if os.path.exists(filename + '.csv'):
+                    df_h = read_csv_batch(filename + '.csv')
+                    write_columnar(filename + CACHE_SUFFIX, df_h)
+                    os.remove(filename + '.csv')
+                else:
+                    df_h = self.__download_batch(filename, data_getter, time_, **kwargs)
             if time_ == time_from.replace(minute=0, second=0, microsecond=0): df_h = df_h[df_h.index >= time_from]
-            df = df.append(df_h)
+            yield df_h
             if verbose:
                 batches_ready += 1
                 bar.update(batches_ready)
@@ -351,13 +660,36 @@ class DataManager(object):
             df_h = data_getter(**kwargs, time_from=time_to.replace(minute=0, second=0, microsecond=0), time_to=time_to)
             if 'timestamp' in df_h:
                 df_h = df_h.set_index('timestamp')
-            df = df.append(df_h)
+            yield df_h
 
         if verbose:
-            batches_ready += 1
-            bar.update(time_to.hour - time_from.hour)
+            bar.update(len(hours) + 1)
+
+    def cacher(self, subdir, data_getter, time_from, td, time_to, verbose, *args, **kwargs):
+        # batches are concatenated once, appending them one by one copies everything read so far
+        return concat_chunks(self.iter_batches(subdir, data_getter, time_from, td, time_to, verbose, *args, **kwargs))
 
-        return df
+    def migrate_csv_cache(self, remove=True):
+        """
+                Converts all CSV batches in cache directory to columnar format
+
+                :param remove: remove CSV files after conversion
+                :return: number of converted batches
+                """
+        converted = 0
+        for root, dirs, files in os.walk(self.cached_data_dir):
+            for name in files:
+                if not name.endswith('.csv'):
+                    continue
+                filename = os.path.join(root, name)
+                path = filename[:-len('.csv')] + CACHE_SUFFIX
+                if not os.path.exists(path):
+                    write_columnar(path, read_csv_batch(filename))
+                    converted += 1
+                if remove:
+                    os.remove(filename)
+        self.logger.info('Migrated {} CSV batches to columnar cache'.format(converted))
+        return converted
 
     def write_data(self, index, data, doc_type='doc', time=datetime.now(pytz.utc)):
         data['timestamp'] = time
@@ -0,0 +1,652 @@
+import bisect
+import json
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+SATOSHI = 100000000
+
+MAKER_FEE = -0.00025
+TAKER_FEE = 0.00075
+MAINTENANCE_MARGIN = 0.005
+
+# bitmex charges funding at 04:00, 12:00 and 20:00 UTC
+FUNDING_INTERVAL = 8 * 3600 * 10 ** 9
+FUNDING_OFFSET = 4 * 3600 * 10 ** 9
+
+# leverage used for margin when position is in cross margin (leverage 0)
+CROSS_LEVERAGE = 100
+
+
+def last_valid(mask):
+    """Index of the last True of mask up to every position, -1 before the first one"""
+    index = np.where(mask, np.arange(len(mask)), -1)
+    return np.maximum.accumulate(index) if len(index) else index
+
+
+def fill_forward(values, initial=np.nan):
+    """
+            Values with NaN replaced by the previous valid one and leading NaN by `initial`, which is
+            what on_tick() carries over between ticks. Arrays passed to replay() have to be filled so,
+            ticks it skips would leave stale prices otherwise.
+            """
+    values = np.asarray(values, dtype=float)
+    index = last_valid(~np.isnan(values))
+    return np.where(index >= 0, values[np.maximum(index, 0)], initial)
+
+
+def isoformat(nanoseconds):
+    return datetime.fromtimestamp(nanoseconds / 1e9, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class OrderIndex():
+    """
+            Resting orders of one side sorted by trigger price with the first to trigger at the end of list.
+
+            Checking whether anything triggers is O(1), adding and removing an order is a binary search,
+            so ticks only touch orders whose price was crossed. Orders of the same price keep time priority.
+            """
+
+    def __init__(self, highest_first):
+        """
+                :param highest_first: True for buy limits and sell stops, which trigger when price
+                                      falls to them, False for sell limits and buy stops
+                """
+        self.highest_first = highest_first
+        self.keys = []
+        self.orders = {}
+
+    def key(self, price, order):
+        return (price, -order['seq']) if self.highest_first else (-price, -order['seq'])
+
+    def add(self, price, order):
+        key = self.key(price, order)
+        bisect.insort(self.keys, key)
+        self.orders[key] = order
+
+    def remove(self, price, order):
+        key = self.key(price, order)
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.orders[key]
+
+    def best_price(self):
+        if not self.keys:
+            return None
+        price = self.keys[-1][0]
+        return price if self.highest_first else -price
+
+    def triggered(self, price):
+        """True if first order triggers at market price"""
+        best = self.best_price()
+        if best is None:
+            return False
+        return best >= price if self.highest_first else best <= price
+
+    def pop(self):
+        return self.orders.pop(self.keys.pop())
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class ExchangeSimulator():
+    """
+            Local XBTUSD exchange filling orders against recorded market data.
+
+            Market orders and marketable part of limit orders take liquidity from order book snapshot.
+            Resting limit orders are filled as maker when opposite side of the book crosses their price,
+            or by trades at their price after volume queued ahead of them (level size when order was
+            placed) is traded. Stop and StopLimit orders turn into Market and Limit orders when last
+            price reaches stopPx.
+
+            Account follows inverse contract rules: position is in USD contracts, cost, PnL, margin
+            and balance are in XBT. Funding is charged every 8 hours, position is liquidated when its
+            margin falls to maintenance margin. Orders, positions and wallet are returned in the shape
+            of bitmex REST API, so traders work with it unmodified through BitmexProxy.
+            """
+
+    def __init__(self, balance=1., symbol='XBTUSD', funding_rate=0.0001, maker_fee=MAKER_FEE, taker_fee=TAKER_FEE):
+        """
+                :param balance: initial wallet balance in XBT
+                :param symbol:
+                :param funding_rate: used when market data has no funding rate
+                :param maker_fee: negative for rebate
+                :param taker_fee:
+                """
+        self.symbol = symbol
+        self.wallet = float(balance)
+        self.deposited = float(balance)
+        self.funding_rate = funding_rate
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+
+        self.leverage = 0
+        self.contracts = 0
+        self.cost = 0.
+        self.realised_pnl = 0.
+        self.order_margin = 0.
+
+        self.orders = {}
+        self.history = []
+        self.executions = []
+        self.seq = 0
+
+        self.buy_limits = OrderIndex(highest_first=True)
+        self.sell_limits = OrderIndex(highest_first=False)
+        self.buy_stops = OrderIndex(highest_first=False)
+        self.sell_stops = OrderIndex(highest_first=True)
+        # resting limit orders by price, for queue position
+        self.levels = {}
+
+        self.timestamp = 0
+        self.last = np.nan
+        self.bid = np.nan
+        self.ask = np.nan
+        # book levels as (levels, 2) arrays of price and size, best level first
+        self.bids = np.empty((0, 2))
+        self.asks = np.empty((0, 2))
+        self.next_funding = None
+
+    # market data
+
+    def on_tick(self, timestamp, last, bids=None, asks=None, volume=0., funding_rate=None):
+        """
+                Applies one market data snapshot and executes triggered orders
+
+                :param timestamp: UTC nanoseconds
+                :param last: last trade price
+                :param bids: buy side levels (levels, 2), best (highest) first
+                :param asks: sell side levels (levels, 2), best (lowest) first
+                :param volume: contracts traded since previous tick
+                :param funding_rate: current funding rate, `funding_rate` from constructor if None
+                """
+        self.timestamp = int(timestamp)
+        if not np.isnan(last):
+            self.last = float(last)
+        if bids is not None:
+            self.bids = bids
+        if asks is not None:
+            self.asks = asks
+        self.bid = self.bids[0, 0] if len(self.bids) else self.last
+        self.ask = self.asks[0, 0] if len(self.asks) else self.last
+
+        self.charge_funding(funding_rate)
+        self.trigger_stops()
+        self.fill_crossed_limits()
+        if volume and not np.isnan(volume):
+            self.fill_queue(self.last, volume)
+        self.check_liquidation()
+
+    def charge_funding(self, funding_rate=None):
+        if self.next_funding is None:
+            self.next_funding = ((self.timestamp - FUNDING_OFFSET) // FUNDING_INTERVAL + 1) * FUNDING_INTERVAL + FUNDING_OFFSET
+        while self.timestamp >= self.next_funding:
+            rate = self.funding_rate if funding_rate is None or np.isnan(funding_rate) else funding_rate
+            if self.contracts != 0:
+                # longs pay shorts when rate is positive
+                payment = rate * self.contracts / self.last
+                self.wallet -= payment
+                self.realised_pnl -= payment
+            self.next_funding += FUNDING_INTERVAL
+
+    def trigger_stops(self):
+        while self.buy_stops.triggered(self.last):
+            self.activate(self.buy_stops.pop())
+        while self.sell_stops.triggered(self.last):
+            self.activate(self.sell_stops.pop())
+
+    def activate(self, order):
+        order['triggered'] = 'StopOrderTriggered'
+        if order['ordType'] == 'Stop':
+            self.take(order, None)
+        else:
+            self.place_limit(order)
+
+    def fill_crossed_limits(self):
+        while self.buy_limits.triggered(self.ask):
+            order = self.buy_limits.pop()
+            self.unlevel(order)
+            self.fill(order, order['leavesQty'], order['price'], maker=True)
+        while self.sell_limits.triggered(self.bid):
+            order = self.sell_limits.pop()
+            self.unlevel(order)
+            self.fill(order, order['leavesQty'], order['price'], maker=True)
+
+    def fill_queue(self, price, volume):
+        """Trades at resting orders price eat queue ahead of them first"""
+        for order in list(self.levels.get(price, [])):
+            volume -= order['queue']
+            if volume <= 0:
+                order['queue'] = -volume
+                return
+            order['queue'] = 0
+            qty = min(int(volume), order['leavesQty'])
+            if qty <= 0:
+                return
+            volume -= qty
+            self.fill(order, qty, price, maker=True)
+            if order['leavesQty'] == 0:
+                self.unindex(order)
+
+    def events(self, timestamps, last, bid, ask, volume):
+        """
+                Mask of ticks which trigger something in current state: funding time, crossed stop or
+                limit order, trade at price of resting order or liquidation. Other ticks change nothing
+                but market data, so replay can skip them.
+                """
+        with np.errstate(invalid='ignore'):
+            mask = timestamps >= self.next_funding if self.next_funding is not None else np.ones(len(timestamps), bool)
+            price = self.buy_stops.best_price()
+            if price is not None:
+                mask |= last >= price
+            price = self.sell_stops.best_price()
+            if price is not None:
+                mask |= last <= price
+            price = self.buy_limits.best_price()
+            if price is not None:
+                mask |= ask <= price
+            price = self.sell_limits.best_price()
+            if price is not None:
+                mask |= bid >= price
+            if self.levels:
+                mask |= (volume > 0) & np.isin(last, list(self.levels))
+            if self.contracts != 0:
+                margin = self.wallet if not self.leverage else self.position_margin()
+                mask |= margin + self.cost - self.contracts / last <= MAINTENANCE_MARGIN * abs(self.contracts) / last
+        return mask
+
+    def replay(self, timestamps, last, bid, ask, volume, book):
+        """
+                Applies ticks given as arrays, on_tick() is called only for ticks found by events()
+                and for the last one, so cost depends on number of executions and not on number
+                of ticks times number of orders.
+
+                :param timestamps: UTC nanoseconds
+                :param last: last prices, forward filled (see fill_forward())
+                :param bid: best bid prices, forward filled, last price where there was no book yet
+                :param ask: best ask prices, forward filled, last price where there was no book yet
+                :param volume: contracts traded since previous tick
+                :param book: function of tick index returning (bids, asks) as for on_tick(), the latest
+                             book up to the tick, as skipped ticks don't update it
+                :return: number of ticks applied
+                """
+        n = len(timestamps)
+        start = 0
+        applied = 0
+        while start < n:
+            # state changes only at events, search for the next one in growing windows
+            window = 64
+            found = None
+            while start < n:
+                end = min(start + window, n)
+                hits = np.flatnonzero(self.events(timestamps[start:end], last[start:end], bid[start:end],
+                                                  ask[start:end], volume[start:end]))
+                if len(hits):
+                    found = start + hits[0]
+                    break
+                start = end
+                window *= 2
+            if found is None:
+                break
+            self.on_tick(timestamps[found], last[found], *book(found), volume=volume[found])
+            applied += 1
+            start = found + 1
+
+        if n and (applied == 0 or self.timestamp != int(timestamps[-1])):
+            traded = np.flatnonzero(~np.isnan(last))
+            if len(traded):
+                self.last = float(last[traded[-1]])
+            self.on_tick(timestamps[-1], last[-1], *book(n - 1), volume=0.)
+            applied += 1
+        return applied
+
+    # orders
+
+    def new_order(self, symbol=None, side=None, orderQty=None, simpleOrderQty=None, price=None, stopPx=None,
+                  ordType=None, execInst='', clOrdID='', text='', **kwargs):
+        """Order_new with bitmex semantics, returns order dict. Invalid orders are returned Rejected"""
+        self.seq += 1
+        execInst = execInst or ''
+        close = 'Close' in execInst
+        reduce_only = close or 'ReduceOnly' in execInst
+
+        if ordType is None:
+            if stopPx is not None:
+                ordType = 'StopLimit' if price is not None else 'Stop'
+            else:
+                ordType = 'Limit' if price is not None else 'Market'
+
+        if side is None and close:
+            side = 'Sell' if self.contracts > 0 else 'Buy'
+
+        if orderQty is None and simpleOrderQty is not None:
+            reference = price or stopPx or self.last
+            orderQty = int(round(simpleOrderQty * reference))
+        if orderQty is None and close:
+            orderQty = abs(self.contracts)
+
+        order = {
+            'orderID': str(uuid.uuid4()), 'clOrdID': clOrdID, 'symbol': symbol or self.symbol, 'side': side,
+            'orderQty': int(orderQty or 0), 'price': price, 'stopPx': stopPx, 'ordType': ordType,
+            'execInst': execInst, 'ordStatus': 'New', 'leavesQty': int(orderQty or 0), 'cumQty': 0,
+            'avgPx': None, 'text': text, 'triggered': '', 'timestamp': isoformat(self.timestamp),
+            'transactTime': isoformat(self.timestamp), 'seq': self.seq, 'queue': 0, 'reduce': reduce_only,
+            'margin': 0.,
+        }
+        self.orders[order['orderID']] = order
+        self.history.append(order)
+
+        if side not in ('Buy', 'Sell') or order['orderQty'] <= 0:
+            return self.reject(order, 'Invalid orderQty or side')
+        if reduce_only:
+            direction = 1 if side == 'Buy' else -1
+            if self.contracts * direction >= 0:
+                return self.reject(order, 'Order would not reduce position')
+            order['orderQty'] = order['leavesQty'] = min(order['orderQty'], abs(self.contracts))
+        elif not self.reserve_margin(order):
+            return self.reject(order, 'Account has insufficient Available Balance')
+
+        if ordType == 'Market':
+            self.take(order, None)
+        elif ordType == 'Limit':
+            self.place_limit(order)
+        elif ordType in ('Stop', 'StopLimit'):
+            if stopPx is None:
+                return self.reject(order, 'Invalid stopPx')
+            index = self.buy_stops if side == 'Buy' else self.sell_stops
+            index.add(stopPx, order)
+            if index.triggered(self.last):
+                self.trigger_stops()
+        else:
+            return self.reject(order, 'Unsupported ordType')
+        return dict(order)
+
+    def reject(self, order, text):
+        order['ordStatus'] = 'Rejected'
+        order['leavesQty'] = 0
+        order['text'] = text
+        self.release_margin(order)
+        return dict(order)
+
+    def place_limit(self, order):
+        """Takes marketable part, rests remainder at its price"""
+        price = order['price']
+        crossing = self.ask <= price if order['side'] == 'Buy' else self.bid >= price
+        if crossing:
+            self.take(order, price)
+        if order['leavesQty'] == 0:
+            return
+        if order['side'] == 'Buy':
+            self.buy_limits.add(price, order)
+            book = self.bids
+        else:
+            self.sell_limits.add(price, order)
+            book = self.asks
+        # size already resting at this price is ahead in the queue
+        at_price = book[book[:, 0] == price, 1] if len(book) else []
+        order['queue'] = float(at_price[0]) if len(at_price) else 0.
+        self.levels.setdefault(price, []).append(order)
+
+    def take(self, order, limit):
+        """Fills order against opposite side of the book up to limit price"""
+        book = self.asks if order['side'] == 'Buy' else self.bids
+        for price, size in book:
+            if order['leavesQty'] == 0 or np.isnan(price):
+                break
+            if limit is not None and (price > limit if order['side'] == 'Buy' else price < limit):
+                break
+            self.fill(order, min(order['leavesQty'], int(size)), price, maker=False)
+        if order['leavesQty'] > 0 and limit is None:
+            # book is only top levels, rest of market order goes at the worst seen price
+            price = book[-1, 0] if len(book) else self.last
+            self.fill(order, order['leavesQty'], price, maker=False)
+
+    def fill(self, order, qty, price, maker):
+        if qty <= 0:
+            return
+        qty, price = int(qty), float(price)
+        if order['reduce']:
+            qty = min(qty, abs(self.contracts))
+            if qty == 0:
+                self.cancel(order, 'Position is closed')
+                return
+
+        direction = 1 if order['side'] == 'Buy' else -1
+        fee = (self.maker_fee if maker else self.taker_fee) * qty / price
+        self.update_position(direction * qty, price)
+        self.wallet -= fee
+        self.realised_pnl -= fee
+
+        filled = order['cumQty']
+        order['avgPx'] = price if not filled else (order['avgPx'] * filled + price * qty) / (filled + qty)
+        order['cumQty'] = filled + qty
+        order['leavesQty'] -= qty
+        order['ordStatus'] = 'Filled' if order['leavesQty'] == 0 else 'PartiallyFilled'
+        order['transactTime'] = isoformat(self.timestamp)
+        if order['ordType'] in ('Market', 'Stop'):
+            # market orders report execution price, traders read it from price
+            order['price'] = order['avgPx']
+        self.release_margin(order, qty)
+
+        self.executions.append({
+            'execID': str(uuid.uuid4()), 'orderID': order['orderID'], 'clOrdID': order['clOrdID'],
+            'symbol': order['symbol'], 'side': order['side'], 'lastQty': qty, 'lastPx': price,
+            'ordType': order['ordType'], 'execType': 'Trade', 'ordStatus': order['ordStatus'],
+            'lastLiquidityInd': 'AddedLiquidity' if maker else 'RemovedLiquidity',
+            'commission': self.maker_fee if maker else self.taker_fee, 'execComm': int(round(fee * SATOSHI)),
+            'timestamp': isoformat(self.timestamp), 'transactTime': isoformat(self.timestamp),
+        })
+
+    def update_position(self, qty, price):
+        """Adds signed qty filled at price, realises PnL of the closed part"""
+        if self.contracts == 0 or (self.contracts > 0) == (qty > 0):
+            self.contracts += qty
+            self.cost += qty / price
+            return
+
+        closed = min(abs(qty), abs(self.contracts))
+        part = closed / abs(self.contracts)
+        cost_closed = self.cost * part
+        contracts_closed = self.contracts * part
+        pnl = cost_closed - contracts_closed / price
+        self.wallet += pnl
+        self.realised_pnl += pnl
+        self.contracts -= int(round(contracts_closed))
+        self.cost -= cost_closed
+        if self.contracts == 0:
+            self.cost = 0.
+
+        rest = abs(qty) - closed
+        if rest:
+            direction = 1 if qty > 0 else -1
+            self.contracts += direction * rest
+            self.cost += direction * rest / price
+
+    def cancel(self, order, text='Canceled via API'):
+        if order['ordStatus'] not in ('New', 'PartiallyFilled'):
+            return
+        self.unindex(order)
+        order['ordStatus'] = 'Canceled'
+        order['text'] = text
+        self.release_margin(order)
+        order['leavesQty'] = 0
+
+    def unindex(self, order):
+        if order['ordType'] in ('Stop', 'StopLimit') and not order['triggered']:
+            index = self.buy_stops if order['side'] == 'Buy' else self.sell_stops
+            index.remove(order['stopPx'], order)
+            return
+        index = self.buy_limits if order['side'] == 'Buy' else self.sell_limits
+        index.remove(order['price'], order)
+        self.unlevel(order)
+
+    def unlevel(self, order):
+        orders = self.levels.get(order['price'])
+        if orders is not None and order in orders:
+            orders.remove(order)
+            if not orders:
+                del self.levels[order['price']]
+
+    def cancel_orders(self, orderID=None, clOrdID=None, text='Canceled via API', **kwargs):
+        """Order_cancel"""
+        ids = orderID if isinstance(orderID, list) else [orderID] if orderID else []
+        cl_ids = clOrdID if isinstance(clOrdID, list) else [clOrdID] if clOrdID else []
+        canceled = []
+        for order in self.open_orders():
+            if order['orderID'] in ids or (order['clOrdID'] and order['clOrdID'] in cl_ids):
+                self.cancel(order, text)
+                canceled.append(dict(order))
+        return canceled
+
+    def cancel_all(self, text='Canceled via API', filter=None, **kwargs):
+        """Order_cancelAll"""
+        canceled = []
+        for order in self.open_orders(filter):
+            self.cancel(order, text)
+            canceled.append(dict(order))
+        return canceled
+
+    def open_orders(self, filter=None):
+        orders = [order for order in self.history if order['ordStatus'] in ('New', 'PartiallyFilled')]
+        return self.apply_filter(orders, filter)
+
+    @staticmethod
+    def apply_filter(orders, filter):
+        if not filter:
+            return orders
+        conditions = json.loads(filter) if isinstance(filter, str) else filter
+        if conditions.get('open'):
+            conditions = {k: v for k, v in conditions.items() if k != 'open'}
+            orders = [order for order in orders if order['ordStatus'] in ('New', 'PartiallyFilled')]
+        return [order for order in orders if all(order.get(k) == v for k, v in conditions.items())]
+
+    def get_orders(self, filter=None, count=100, reverse=False, start=0, **kwargs):
+        """Order_getOrders"""
+        orders = self.apply_filter(self.history, filter)
+        if reverse:
+            orders = orders[::-1]
+        return [dict(order) for order in orders[start:start + count]]
+
+    # margin
+
+    def effective_leverage(self):
+        return self.leverage if self.leverage else CROSS_LEVERAGE
+
+    def unrealised_pnl(self):
+        if self.contracts == 0 or np.isnan(self.last):
+            return 0.
+        return self.cost - self.contracts / self.last
+
+    def position_margin(self):
+        return abs(self.cost) / self.effective_leverage()
+
+    def available_margin(self):
+        return self.wallet + self.unrealised_pnl() - self.position_margin() - self.order_margin
+
+    def reserve_margin(self, order):
+        price = order['price'] or order['stopPx'] or self.last
+        # part of order closing current position needs no margin
+        direction = 1 if order['side'] == 'Buy' else -1
+        opening = order['orderQty'] - (min(order['orderQty'], abs(self.contracts)) if self.contracts * direction < 0 else 0)
+        if opening == 0:
+            return True
+        margin = opening / price / self.effective_leverage() + self.taker_fee * order['orderQty'] / price
+        if margin > self.available_margin():
+            return False
+        order['margin'] = margin
+        self.order_margin += margin
+        return True
+
+    def release_margin(self, order, qty=None):
+        if not order['margin']:
+            return
+        released = order['margin'] if qty is None or order['leavesQty'] == 0 else order['margin'] * qty / (order['leavesQty'] + qty)
+        order['margin'] -= released
+        self.order_margin = max(self.order_margin - released, 0.)
+
+    def set_leverage(self, leverage, **kwargs):
+        """Position_updateLeverage, 0 is cross margin"""
+        self.leverage = float(leverage)
+        return self.position()
+
+    def liquidation_price(self):
+        if self.contracts == 0:
+            return None
+        margin = self.wallet if not self.leverage else self.position_margin()
+        # price where margin + unrealised PnL equals maintenance margin
+        maintenance = MAINTENANCE_MARGIN * abs(self.cost)
+        denominator = self.cost + margin - maintenance
+        if denominator <= 0:
+            return None
+        return self.contracts / denominator
+
+    def check_liquidation(self):
+        if self.contracts == 0 or np.isnan(self.last):
+            return
+        margin = self.wallet if not self.leverage else self.position_margin()
+        maintenance = MAINTENANCE_MARGIN * abs(self.contracts) / self.last
+        if margin + self.unrealised_pnl() > maintenance:
+            return
+
+        self.cancel_all('Canceled: Liquidation')
+        order = {
+            'orderID': str(uuid.uuid4()), 'clOrdID': '', 'symbol': self.symbol,
+            'side': 'Sell' if self.contracts > 0 else 'Buy', 'orderQty': abs(self.contracts), 'price': None,
+            'stopPx': None, 'ordType': 'Market', 'execInst': 'Close', 'ordStatus': 'New',
+            'leavesQty': abs(self.contracts), 'cumQty': 0, 'avgPx': None, 'text': 'Liquidation', 'triggered': '',
+            'timestamp': isoformat(self.timestamp), 'transactTime': isoformat(self.timestamp),
+            'seq': self.seq, 'queue': 0, 'reduce': True, 'margin': 0.,
+        }
+        self.history.append(order)
+        self.orders[order['orderID']] = order
+        self.fill(order, order['leavesQty'], self.last, maker=False)
+
+    # bitmex shaped responses
+
+    def position(self):
+        unrealised = self.unrealised_pnl()
+        liquidation = self.liquidation_price()
+        return {
+            'account': 0, 'symbol': self.symbol, 'currency': 'XBt', 'underlying': 'XBT',
+            'quoteCurrency': 'USD', 'leverage': self.leverage if self.leverage else CROSS_LEVERAGE,
+            'crossMargin': not self.leverage, 'currentQty': self.contracts, 'isOpen': self.contracts != 0,
+            'avgEntryPrice': self.contracts / self.cost if self.contracts else None,
+            'markPrice': self.last, 'lastPrice': self.last,
+            'homeNotional': -self.contracts / self.last if self.contracts else 0.,
+            'posMargin': int(round(self.position_margin() * SATOSHI)),
+            'realisedPnl': int(round(self.realised_pnl * SATOSHI)),
+            'unrealisedPnl': int(round(unrealised * SATOSHI)),
+            'liquidationPrice': liquidation,
+            'timestamp': isoformat(self.timestamp),
+        }
+
+    def wallet_summary(self):
+        """User_getWalletSummary, amounts in satoshi"""
+        unrealised = int(round(self.unrealised_pnl() * SATOSHI))
+        wallet = int(round(self.wallet * SATOSHI))
+        realised = wallet - int(round(self.deposited * SATOSHI))
+        return [
+            {'account': 0, 'currency': 'XBt', 'transactType': 'Deposit', 'amount': int(round(self.deposited * SATOSHI)),
+             'walletBalance': None, 'marginBalance': None, 'unrealisedPnl': 0},
+            {'account': 0, 'currency': 'XBt', 'transactType': 'RealisedPNL', 'amount': realised,
+             'walletBalance': None, 'marginBalance': None, 'unrealisedPnl': unrealised},
+            {'account': 0, 'currency': 'XBt', 'transactType': 'Total', 'amount': wallet,
+             'walletBalance': wallet, 'marginBalance': wallet + unrealised, 'unrealisedPnl': unrealised},
+        ]
+
+    def margin(self):
+        """User_getMargin, amounts in satoshi"""
+        unrealised = self.unrealised_pnl()
+        return {
+            'account': 0, 'currency': 'XBt',
+            'walletBalance': int(round(self.wallet * SATOSHI)),
+            'marginBalance': int(round((self.wallet + unrealised) * SATOSHI)),
+            'availableMargin': int(round(self.available_margin() * SATOSHI)),
+            'unrealisedPnl': int(round(unrealised * SATOSHI)),
+            'realisedPnl': int(round(self.realised_pnl * SATOSHI)),
+            'initMargin': int(round(self.order_margin * SATOSHI)),
+            'maintMargin': int(round(self.position_margin() * SATOSHI)),
+        }
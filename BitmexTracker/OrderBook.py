@@ -0,0 +1,101 @@
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+SIDES = ('Buy', 'Sell')
+
+
+def aggregate(prices, sizes, decimals):
+    """
+            Sums sizes of levels which fall to the same price after rounding to `decimals`
+            (-1 for 10 USD, -2 for 100 USD bins). Same result as pandas round + groupby sum.
+            """
+    if len(prices) == 0:
+        return prices, sizes
+    binned = np.round(prices, decimals)
+    # prices are sorted and rounding is monotonic, so levels of one bin are adjacent
+    starts = np.flatnonzero(np.r_[True, binned[1:] != binned[:-1]])
+    return binned[starts], np.add.reduceat(sizes, starts)
+
+
+class OrderBook():
+    """
+            L2 order book kept in sorted numpy arrays, one pair (prices, sizes) per side.
+
+            Websocket orderBookL2 deltas are applied in place: updates are a binary search,
+            inserts and deletes are done once per message for all its levels.
+            """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.prices = {}
+        self.sizes = {}
+        self.ids = {}
+        self.ready = False
+        self.clear()
+
+    def clear(self):
+        for side in SIDES:
+            self.prices[side] = np.empty(0)
+            self.sizes[side] = np.empty(0)
+        self.ids = {}
+        self.ready = False
+
+    def apply(self, action, data):
+        """Applies orderBookL2 message"""
+        with self.lock:
+            if action == 'partial':
+                self.clear()
+                self.insert(data)
+                self.ready = True
+            elif action == 'insert':
+                self.insert(data)
+            elif action == 'update':
+                self.update(data)
+            elif action == 'delete':
+                self.delete(data)
+
+    def by_side(self, data, with_size=True):
+        for side in SIDES:
+            items = [item for item in data if item['side'] == side]
+            if not items:
+                continue
+            # updates and deletes may come without price, it is known from insert
+            prices = np.array([item.get('price', self.ids.get(item['id'], np.nan)) for item in items], dtype=float)
+            sizes = np.array([item['size'] for item in items], dtype=float) if with_size else None
+            yield side, items, prices, sizes
+
+    def insert(self, data):
+        for side, items, prices, sizes in self.by_side(data):
+            for item, price in zip(items, prices):
+                self.ids[item['id']] = price
+            prices = np.concatenate((self.prices[side], prices))
+            sizes = np.concatenate((self.sizes[side], sizes))
+            order = np.argsort(prices, kind='mergesort')
+            self.prices[side] = prices[order]
+            self.sizes[side] = sizes[order]
+
+    def update(self, data):
+        for side, items, prices, sizes in self.by_side(data):
+            book = self.prices[side]
+            if len(book) == 0:
+                continue
+            index = np.minimum(np.searchsorted(book, prices), len(book) - 1)
+            found = book[index] == prices
+            self.sizes[side][index[found]] = sizes[found]
+
+    def delete(self, data):
+        for side, items, prices, sizes in self.by_side(data, with_size=False):
+            for item in items:
+                self.ids.pop(item['id'], None)
+            keep = ~np.isin(self.prices[side], prices)
+            self.prices[side] = self.prices[side][keep]
+            self.sizes[side] = self.sizes[side][keep]
+
+    def snapshot(self):
+        """Copies of both sides as ((buy prices, buy sizes), (sell prices, sell sizes)), None before partial"""
+        with self.lock:
+            if not self.ready:
+                return None
+            return tuple((self.prices[side].copy(), self.sizes[side].copy()) for side in SIDES)
@@ -0,0 +1,36 @@
+from collections import deque
+from threading import Condition
+
+
+class RingBuffer():
+    """
+            Bounded FIFO between snapshot capture and writers.
+
+            Capture never blocks: when buffer is full the oldest item is dropped and counted.
+            """
+
+    def __init__(self, size=600):
+        self.items = deque(maxlen=size)
+        self.condition = Condition()
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Oldest item or None if nothing came during timeout"""
+        with self.condition:
+            if not self.items:
+                self.condition.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+from BitmexTracker.DataManager import levels_to_array
+
+
+def to_nanoseconds(dt):
+    """UTC nanoseconds of datetime, naive datetimes are treated as UTC"""
+    dt = pd.Timestamp(dt)
+    if dt.tz is not None:
+        dt = dt.tz_convert('UTC').tz_localize(None)
+    return dt.value
+
+
+class TickStore():
+    """
+            Time-indexed tick data in contiguous memory-mapped arrays.
+
+            Every column is a raw binary file of one dtype: timestamps (UTC nanoseconds),
+            ticker prices, volumes and order book levels as fixed-width (ticks, levels, 2)
+            arrays padded with NaN. Range lookup is a binary search over timestamps and
+            returns views of the mapped files, nothing is read or copied until used.
+            """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        self.path = path
+        self.length = meta['length']
+        self.timestamps = self.__map('timestamp', 'int64', [])
+        self.columns = {column: self.__map(column, spec['dtype'], spec['shape'])
+                        for column, spec in meta['columns'].items()}
+
+    def __map(self, column, dtype, shape):
+        shape = tuple([self.length] + shape)
+        if self.length == 0:
+            # empty file can not be mapped
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, column + '.bin'), dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return self.length
+
+    def range(self, time_from, time_to):
+        """
+                Ticks with time_from <= timestamp < time_to
+
+                :return: dict of column views, timestamps are under 'timestamp' key
+                """
+        start, end = np.searchsorted(self.timestamps, [to_nanoseconds(time_from), to_nanoseconds(time_to)])
+        ticks = {column: values[start:end] for column, values in self.columns.items()}
+        ticks['timestamp'] = self.timestamps[start:end]
+        return ticks
+
+    @staticmethod
+    def column_spec(values, levels):
+        """
+                Storage of column by its first non-null value: order book levels, float or None for
+                other columns. False if column has no value yet, so it can't be told.
+                """
+        if values.dtype != object:
+            number = np.issubdtype(values.dtype, np.number) or np.issubdtype(values.dtype, np.bool_)
+            return {'dtype': 'float64', 'shape': []} if number else None
+        present = np.flatnonzero(pd.notnull(values))
+        if len(present) == 0:
+            return False
+        first = values[present[0]]
+        if isinstance(first, (list, tuple, np.ndarray)):
+            return {'dtype': 'float64', 'shape': [levels, 2]}
+        if isinstance(first, (int, float, np.number, np.bool_)):
+            return {'dtype': 'float64', 'shape': []}
+        return None
+
+    @staticmethod
+    def build(path, chunks, levels=30):
+        """
+                Writes tick store from dataframes with datetime index, e.g. DataManager.iter_TOV().
+                Column is stored by its first non-null value over all chunks: numbers as float64,
+                order books as `levels` levels, other columns are skipped. Rows before a column is
+                seen (joined frames have NaN where stream had no message) are NaN, depth 0.
+
+                :param path: store directory, created atomically
+                :param chunks: dataframes in time order
+                :param levels: order book levels kept per tick
+                :return: TickStore
+                """
+        tmp = '{}.tmp{}'.format(path, os.getpid())
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        files = {'timestamp': open(os.path.join(tmp, 'timestamp.bin'), 'wb')}
+        columns = {}
+        skipped = set()
+        length = 0
+        last_timestamp = None
+
+        def write_empty(column, spec, rows):
+            np.full((rows,) + tuple(spec['shape']), np.nan).tofile(files[column])
+            if spec['shape']:
+                np.zeros(rows, dtype='int32').tofile(files[column + '_depth'])
+
+        try:
+            for df in chunks:
+                if len(df) == 0:
+                    continue
+                df = df.sort_index()
+                index = pd.DatetimeIndex(df.index)
+                if index.tz is not None:
+                    index = index.tz_convert('UTC').tz_localize(None)
+                timestamps = index.values.astype('datetime64[ns]').view('int64')
+                if last_timestamp is not None and timestamps[0] < last_timestamp:
+                    raise ValueError('Chunks are not in time order')
+                last_timestamp = timestamps[-1]
+
+                for column in map(str, df.columns):
+                    if column in columns or column in skipped:
+                        continue
+                    spec = TickStore.column_spec(df[column].to_numpy(), levels)
+                    if spec is None:
+                        skipped.add(column)
+                    elif spec:
+                        names = [column, column + '_depth'] if spec['shape'] else [column]
+                        if any(name in columns or name == 'timestamp' for name in names):
+                            raise ValueError('Column {} clashes with stored column'.format(column))
+                        columns[column] = spec
+                        if spec['shape']:
+                            columns[column + '_depth'] = {'dtype': 'int32', 'shape': []}
+                        for name in names:
+                            files[name] = open(os.path.join(tmp, name + '.bin'), 'wb')
+                        # column first seen in later chunk
+                        write_empty(column, spec, length)
+
+                timestamps.tofile(files['timestamp'])
+                for column, spec in columns.items():
+                    if column.endswith('_depth') and column[:-len('_depth')] in columns:
+                        continue
+                    if column not in df:
+                        write_empty(column, spec, len(df))
+                        continue
+                    values = df[column].to_numpy()
+                    if spec['shape']:
+                        padded = np.full((len(df), levels, 2), np.nan)
+                        depths = np.zeros(len(df), dtype='int32')
+                        # rows without order book are NaN in joined frames
+                        present = np.array([isinstance(x, (list, tuple, np.ndarray)) for x in values])
+                        if present.any():
+                            array, array_depths = levels_to_array(values[present])
+                            width = min(levels, array.shape[1])
+                            padded[present, :width] = array[:, :width]
+                            depths[present] = np.minimum(array_depths, levels)
+                        padded.tofile(files[column])
+                        depths.tofile(files[column + '_depth'])
+                    else:
+                        pd.to_numeric(df[column], errors='coerce').to_numpy(dtype='float64').tofile(files[column])
+
+                length += len(df)
+        finally:
+            for f in files.values():
+                f.close()
+
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'length': length, 'columns': columns}, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+        return TickStore(path)
@@ -1,4 +1,7 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
 
 from Functions.data_preparation import write_state
 from Functions.logger import create_logger
@@ -8,24 +11,95 @@ import pytz
 from influxdb import InfluxDBClient
 from Functions.consts import influxdb_conndata
 
-from Functions.data_preparation import get_last_candles
+from Functions.candle_store import timeperiod_seconds
+from Functions.candle_service import CandleService
+from Functions.scheduler import Scheduler
+from Functions.market_data import MarketData
+from Functions.order_gateway import OrderGateway
+from Functions.indicators import SharedIndicators
+from Strategies.base import Strategy
 
 class BotManager():
 
     bots = {}
     influx = None
 
+    # run bots in parallel threads, bots of one account are still executed one by one
+    concurrent = True
+    max_workers = 8
+    account_locks = {}
+    executor = None
+
+    # bots are started `bar_close_delay` seconds after bar close by wall clock,
+    # or right after candle close event from market data feed if `trigger_on_events`
+    scheduler = None
+    bar_close_delay = 0.5
+    trigger_on_events = False
+
+    # traders read prices, positions and orders from shared websocket feeds instead of REST
+    use_market_data = True
+
+    # strategies with equal indicators (class, params, input, timeperiod) compute them once per bar
+    share_indicators = True
+
     def __init__(self, account_name, strategy, trader, bitmex_params, trader_params, strategy_params, restore_state=True):
         self.name = account_name + '_' + strategy.__name__ + '_' +  trader.__name__
         self.account_name = account_name
         self.strategy_name = strategy.__name__
         self.trader_name = trader.__name__
         self.logger = create_logger(self.name)
+        if BotManager.share_indicators and Strategy.shared_indicators is None:
+            Strategy.shared_indicators = SharedIndicators()
+        # strategy trades symbol of its trader, streaming indicators are shared per symbol
+        strategy_params = dict({'symbol': trader_params.get('symbol', 'XBTUSD')}, **strategy_params)
         self.strategy = strategy(self.logger, **strategy_params)
         self.trader = trader(self.logger, self.strategy, bitmex_params, **trader_params)
+        # server of base_url (e.g. Functions.mock_exchange) has no websocket
+        if BotManager.use_market_data and 'base_url' not in bitmex_params:
+            self.trader.market_data = MarketData.get(symbol=self.trader.symbol, **bitmex_params)
         if restore_state:
             self.trader.load_state(self.account_name)
         self.initial_balance, _ = self.trader.balances_status()
+        BotManager.account_locks.setdefault(account_name, Lock())
+
+    def trade(self, candles, bar_close):
+        """
+                Execute trade and save state holding the account lock, so bots of one account never race.
+
+                :param candles: candles to make prediction on
+                :param bar_close: unix time of the bar close which triggered the trade
+                :return: timings of the execution in seconds since bar close
+                """
+        with BotManager.account_locks[self.account_name]:
+            started = time.time()
+            self.trader.order_sent_at = None
+            self.trader.order_filled_at = None
+            self.trader.exec_trade(candles)
+            self.trader.save_state(self.account_name)
+            finished = time.time()
+
+        timings = {
+            'Start delay': started - bar_close,
+            'Execution time': finished - started,
+            'Finish delay': finished - bar_close,
+        }
+        if self.trader.order_sent_at is not None:
+            timings['Order send delay'] = self.trader.order_sent_at - bar_close
+        if self.trader.order_filled_at is not None:
+            timings['Order fill delay'] = self.trader.order_filled_at - bar_close
+        return timings
+
+    def timings_point(self, timings):
+        return {
+            "measurement": "latency",
+            "tags": {
+                "account": self.account_name,
+                "strategy": self.strategy_name,
+                "trader": self.trader_name,
+            },
+            "time": datetime.now(pytz.utc),
+            "fields": timings
+        }
 
     def log_balance(self):
         total, realised_pnl = self.trader.balances_status()
@@ -64,6 +138,52 @@ class BotManager():
         bot = BotManager(account_name, strategy, trader, bitmex_params, trader_params, strategy_params, restore_state)
         BotManager.bots[bot.name] = bot
 
+    @staticmethod
+    def trade_bots(logger, symbol, timeperiod, names, bar_close, missed=0):
+        logger.info("Start make prediction for {} {} bar closed at {}".format(symbol, timeperiod, bar_close))
+        dt_trade = time.time()
+        candles = CandleService.get(symbol).candles(timeperiod, bar_close)
+
+        if BotManager.concurrent:
+            futures = {bot: BotManager.executor.submit(BotManager.bots[bot].trade, candles, bar_close)
+                       for bot in names}
+        else:
+            futures = None
+
+        points = []
+        for bot in names:
+            try:
+                if futures is not None:
+                    timings = futures[bot].result()
+                else:
+                    timings = BotManager.bots[bot].trade(candles, bar_close)
+            except Exception as e:
+                logger.info("EXCEPTION in {}: {}".format(bot, str(e)))
+                continue
+            logger.info("{} timings: {}".format(bot, timings))
+            points.append(BotManager.bots[bot].timings_point(timings))
+
+        dt_trade = time.time() - dt_trade
+        logger.info("All bots traded in {}s, last finished {}s after bar close".format(
+            dt_trade, max([p['fields']['Finish delay'] for p in points], default=0)))
+        if Strategy.shared_indicators is not None:
+            stats = Strategy.shared_indicators.stats()
+            logger.info("Shared indicators: {}".format(stats))
+            points.append({"measurement": "indicators", "time": datetime.now(pytz.utc), "fields": stats})
+        stats = {}
+        for gateway in OrderGateway.gateways.values():
+            for key, value in gateway.stats().items():
+                stats[key] = stats.get(key, 0) + value
+        if stats:
+            logger.info("Order gateways: {}".format(stats))
+            points.append({"measurement": "orders", "time": datetime.now(pytz.utc), "fields": stats})
+        BotManager.influx.write_points(points)
+
+    @staticmethod
+    def log_balances(bar_close, missed=0):
+        for bot in BotManager.bots:
+            BotManager.bots[bot].log_balance()
+
     @staticmethod
     def run():
 
@@ -72,40 +192,34 @@ class BotManager():
         logger = create_logger('bot_manager')
         logger.info("Start of work")
 
-        start_time_offset = 0.5
-        time_to_wait_new_trade = 60# * 60
         time_to_wait_new_balance_check = 61# * 10
 
-        safe_stop = False
-
-        while not safe_stop:
-            try:
-                now = round(time.time())
-
-                if now % time_to_wait_new_trade == 0:
-                    logger.info("Start make prediction")
-                    time.sleep(start_time_offset)
-                    dt_trade = time.time()
-                    candles = get_last_candles(timeframe='1m')
-
-                    for bot in BotManager.bots:
-                        BotManager.bots[bot].trader.exec_trade(candles)
-                        BotManager.bots[bot].trader.save_state(BotManager.bots[bot].account_name)
-#                        time.sleep(0.5)
-
-                    dt_trade = time.time() - dt_trade
-                    time_last_trade = time.time() - dt_trade
-
-                if now % time_to_wait_new_balance_check == 0:
-
-                    for bot in BotManager.bots:
-                        BotManager.bots[bot].log_balance()
-
-            except Exception as e:
-                logger.info("EXCEPTION: " + str(e))
-            except KeyboardInterrupt:
-                safe_stop = True
-                logger.info('Stopping gracefully')
-            finally:
-                time.sleep(1)
-
+        # bots are grouped by symbol and strategy timeperiod, each group is traded on close of its own bar
+        groups = {}
+        for bot in BotManager.bots:
+            symbol = BotManager.bots[bot].trader.symbol
+            timeperiod = BotManager.bots[bot].strategy.timeperiod
+            groups.setdefault((symbol, timeperiod), []).append(bot)
+
+        # history is downloaded once per (symbol, timeperiod), after that only new 1m bars are fetched
+        for symbol, timeperiod in groups:
+            CandleService.get(symbol).require(timeperiod)
+
+        BotManager.executor = ThreadPoolExecutor(max_workers=BotManager.max_workers)
+        BotManager.scheduler = Scheduler(logger, delay=BotManager.bar_close_delay,
+                                         on_events=BotManager.trigger_on_events)
+
+        for (symbol, timeperiod), names in groups.items():
+            BotManager.scheduler.add_job(timeperiod_seconds(timeperiod),
+                                         partial(BotManager.trade_bots, logger, symbol, timeperiod, names))
+        BotManager.scheduler.add_job(time_to_wait_new_balance_check, BotManager.log_balances)
+
+        if BotManager.trigger_on_events:
+            # candles are downloaded from real exchange, so events are taken from there too
+            MarketData.get(test=False).add_bar_listener(BotManager.scheduler.notify)
+
+        try:
+            BotManager.scheduler.run()
+        except KeyboardInterrupt:
+            BotManager.scheduler.stop()
+            logger.info('Stopping gracefully')
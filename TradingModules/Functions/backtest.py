@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+from Functions.data_preparation import resample
+
+# trade kinds in trades table
+OPEN = 0
+CLOSE = 1
+LIQUIDATION = 2
+
+
+def simulate(close, high, low, decision, exit_long, exit_short, balance, leverage, deposit_percent,
+             max_num_of_positions, new_trade_to_average_percent, fee, pyramiding):
+    """
+            Trader logic over signal arrays, one pass over bars.
+
+            Follows Traders.trader_fast_rsi / trader_mas_extreme: exit closes position when there is no
+            decision, opposite decision closes position and opens new one, same side decision adds
+            to position if price moved by `new_trade_to_average_percent` against average entry and
+            there are less than `max_num_of_positions` entries. Orders are filled at bar close.
+            Positions are in XBTUSD inverse contracts (USD), balance and PnL in XBT. Position is
+            liquidated when bar extreme takes whole margin.
+
+            Written with numpy arrays and scalars only, so it can be compiled by numba.
+            """
+    n = len(close)
+    equity = np.empty(n)
+    position = np.empty(n)
+
+    trade_bar = np.empty(2 * n, dtype=np.int64)
+    trade_kind = np.empty(2 * n, dtype=np.int64)
+    trade_price = np.empty(2 * n)
+    trade_contracts = np.empty(2 * n)
+    trade_pnl = np.empty(2 * n)
+    trades = 0
+
+    tradable_qty = balance * deposit_percent * leverage
+    contracts = 0.  # signed USD
+    cost = 0.  # signed XBT paid for contracts, sum of contracts / price
+    num_of_positions = 0
+    sum_of_prices = 0.
+
+    for i in range(n):
+        price = close[i]
+
+        if contracts != 0:
+            worst = low[i] if contracts > 0 else high[i]
+            margin = abs(cost) / leverage
+            if cost - contracts / worst <= -margin:
+                # whole margin is lost at liquidation price
+                liquidation_price = contracts / (cost + margin)
+                balance -= margin
+                trade_bar[trades] = i
+                trade_kind[trades] = LIQUIDATION
+                trade_price[trades] = liquidation_price
+                trade_contracts[trades] = -contracts
+                trade_pnl[trades] = -margin
+                trades += 1
+                contracts = 0.
+                cost = 0.
+                num_of_positions = 0
+                sum_of_prices = 0.
+                tradable_qty = max(balance, 0.) * deposit_percent * leverage
+
+        need_close = False
+        if contracts > 0 and (decision[i] == -1 or (decision[i] == 0 and exit_long[i])):
+            need_close = True
+        if contracts < 0 and (decision[i] == 1 or (decision[i] == 0 and exit_short[i])):
+            need_close = True
+
+        if need_close:
+            pnl = cost - contracts / price - fee * abs(contracts) / price
+            balance += pnl
+            trade_bar[trades] = i
+            trade_kind[trades] = CLOSE
+            trade_price[trades] = price
+            trade_contracts[trades] = -contracts
+            trade_pnl[trades] = pnl
+            trades += 1
+            contracts = 0.
+            cost = 0.
+            num_of_positions = 0
+            sum_of_prices = 0.
+            tradable_qty = max(balance, 0.) * deposit_percent * leverage
+
+        side = decision[i]
+        can_open = False
+        if side != 0 and tradable_qty > 0:
+            if num_of_positions == 0:
+                can_open = True
+            elif pyramiding and num_of_positions <= max_num_of_positions:
+                average = sum_of_prices / num_of_positions
+                if side == -1 and price * (1.0 - new_trade_to_average_percent) > average:
+                    can_open = True
+                if side == 1 and price * (1.0 + new_trade_to_average_percent) < average:
+                    can_open = True
+
+        if can_open:
+            qty = side * tradable_qty * price
+            commission = fee * abs(qty) / price
+            balance -= commission
+            contracts += qty
+            cost += qty / price
+            num_of_positions += 1
+            sum_of_prices += price
+            trade_bar[trades] = i
+            trade_kind[trades] = OPEN
+            trade_price[trades] = price
+            trade_contracts[trades] = qty
+            trade_pnl[trades] = -commission
+            trades += 1
+
+        position[i] = contracts
+        equity[i] = balance + (cost - contracts / price if contracts != 0 else 0.)
+
+    return (equity, position, trade_bar[:trades], trade_kind[:trades], trade_price[:trades],
+            trade_contracts[:trades], trade_pnl[:trades])
+
+
+simulate_compiled = njit(cache=True)(simulate) if njit is not None else simulate
+
+
+def backtest(strategy, candles, leverage=1, deposit_percent=1., max_num_of_positions=5,
+             new_trade_to_average_percent=0.015, fee=0.00075, balance=1., pyramiding=True, resample_candles=False):
+    """
+            Backtests strategy over whole candle history at once
+
+            :param strategy: strategy instance, its signals() gives decisions for all bars
+            :param candles: OHLCV dataframe
+            :param leverage:
+            :param deposit_percent: part of balance used by one entry, as in traders
+            :param max_num_of_positions: pyramiding limit, as in traders
+            :param new_trade_to_average_percent: price move against average entry needed to add to position
+            :param fee: taker fee, defaults to bitmex 0.075%
+            :param balance: initial balance in XBT
+            :param pyramiding: False to trade as trader_mas_extreme with piramyding_strategy=False
+            :param resample_candles: resample candles to strategy.timeperiod first
+            :return: (equity dataframe with equity and position by bar, trades dataframe)
+            """
+    if resample_candles:
+        candles = resample(candles, strategy.timeperiod).dropna()
+
+    decision, exit_long, exit_short = strategy.signals(candles)
+
+    result = simulate_compiled(candles.close.values.astype(float), candles.high.values.astype(float),
+                               candles.low.values.astype(float), np.asarray(decision, dtype=np.int64),
+                               np.asarray(exit_long, dtype=bool), np.asarray(exit_short, dtype=bool),
+                               float(balance), float(leverage), float(deposit_percent), int(max_num_of_positions),
+                               float(new_trade_to_average_percent), float(fee), bool(pyramiding))
+    equity, position, trade_bar, trade_kind, trade_price, trade_contracts, trade_pnl = result
+
+    equity = pd.DataFrame({'equity': equity, 'position': position}, index=candles.index)
+    trades = pd.DataFrame({'kind': trade_kind, 'price': trade_price, 'contracts': trade_contracts, 'pnl': trade_pnl},
+                          index=candles.index[trade_bar])
+    return equity, trades
+
+
+def summary(equity, trades, periods_per_year=None):
+    """
+            Total return, max drawdown, Sharpe ratio and number of trades of backtest result
+
+            :param periods_per_year: bars per year for Sharpe annualization, guessed from index if None
+            """
+    values = equity['equity'].values
+    if len(values) == 0:
+        return {'return': 0., 'max_drawdown': 0., 'sharpe': 0., 'trades': 0}
+
+    peaks = np.maximum.accumulate(values)
+    drawdown = np.max((peaks - values) / peaks) if peaks[-1] > 0 else 1.
+
+    returns = np.diff(values) / values[:-1] if len(values) > 1 else np.zeros(0)
+    if periods_per_year is None and len(equity.index) > 1:
+        periods_per_year = pd.Timedelta(days=365) / (equity.index[1] - equity.index[0])
+    std = returns.std() if len(returns) else 0.
+    sharpe = returns.mean() / std * np.sqrt(periods_per_year) if std > 0 else 0.
+
+    return {
+        'return': values[-1] / values[0] - 1,
+        'max_drawdown': drawdown,
+        'sharpe': sharpe,
+        'trades': int((trades['kind'] == OPEN).sum()),
+    }
@@ -1,12 +1,11 @@
-import bitmex
-
+from Functions.clients import get_bitmex_client
 from Functions.consts import *
 
 
 def balances_status():
-    client = bitmex.bitmex(test=TESTNET_EXCHANGE,
-                           api_key=BITMEX_API_KEY,
-                           api_secret=BITMEX_API_SECRET)
+    client = get_bitmex_client(test=TESTNET_EXCHANGE,
+                               api_key=BITMEX_API_KEY,
+                               api_secret=BITMEX_API_SECRET)
 
     if len(client.User.User_getWalletSummary().result()[0]) == 3:
         wallet_summary = client.User.User_getWalletSummary().result()[0]
@@ -24,9 +23,9 @@ def balances_status():
 
 
 def amount_in_orders():
-    client = bitmex.bitmex(test=TESTNET_EXCHANGE,
-                           api_key=BITMEX_API_KEY,
-                           api_secret=BITMEX_API_SECRET)
+    client = get_bitmex_client(test=TESTNET_EXCHANGE,
+                               api_key=BITMEX_API_KEY,
+                               api_secret=BITMEX_API_SECRET)
 
     result = client.Position.Position_get().result()
 
@@ -34,9 +33,9 @@ def amount_in_orders():
 
 
 def has_open_positions():
-    client = bitmex.bitmex(test=TESTNET_EXCHANGE,
-                           api_key=BITMEX_API_KEY,
-                           api_secret=BITMEX_API_SECRET)
+    client = get_bitmex_client(test=TESTNET_EXCHANGE,
+                               api_key=BITMEX_API_KEY,
+                               api_secret=BITMEX_API_SECRET)
 
     result = client.Position.Position_get().result()[0][0]
 
@@ -47,9 +46,9 @@ def has_open_positions():
 
 
 def not_in_position():
-    client = bitmex.bitmex(test=TESTNET_EXCHANGE,
-                           api_key=BITMEX_API_KEY,
-                           api_secret=BITMEX_API_SECRET)
+    client = get_bitmex_client(test=TESTNET_EXCHANGE,
+                               api_key=BITMEX_API_KEY,
+                               api_secret=BITMEX_API_SECRET)
 
     result = client.Order.Order_getOrders(filter='{"open": true}').result()
 
@@ -68,9 +67,9 @@ def not_in_position():
 
 
 def cancel_all_orders():
-    client = bitmex.bitmex(test=TESTNET_EXCHANGE,
-                           api_key=BITMEX_API_KEY,
-                           api_secret=BITMEX_API_SECRET)
+    client = get_bitmex_client(test=TESTNET_EXCHANGE,
+                               api_key=BITMEX_API_KEY,
+                               api_secret=BITMEX_API_SECRET)
 
     client.Order.Order_cancelAll().result()
 
@@ -0,0 +1,105 @@
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode, urlparse
+
+import requests
+
+# swagger operation: (method, path relative to /api/v1)
+ENDPOINTS = {
+    'Order_new': ('POST', '/order'),
+    'Order_newBulk': ('POST', '/order/bulk'),
+    'Order_cancel': ('DELETE', '/order'),
+    'Order_cancelAll': ('DELETE', '/order/all'),
+    'Order_getOrders': ('GET', '/order'),
+    'Position_get': ('GET', '/position'),
+    'Position_updateLeverage': ('POST', '/position/leverage'),
+    'User_getWalletSummary': ('GET', '/user/walletSummary'),
+    'User_getMargin': ('GET', '/user/margin'),
+    'Trade_getBucketed': ('GET', '/trade/bucketed'),
+    'Instrument_get': ('GET', '/instrument'),
+}
+
+URLS = {True: 'https://testnet.bitmex.com/api/v1', False: 'https://www.bitmex.com/api/v1'}
+
+
+def signature(api_secret, verb, path, expires, body=''):
+    """bitmex api-signature: hex HMAC-SHA256 of verb, path with query, expires and body"""
+    message = verb + path + str(expires) + body
+    return hmac.new(bytes(api_secret, 'utf8'), bytes(message, 'utf8'), digestmod=hashlib.sha256).hexdigest()
+
+
+class RestFuture():
+    """Request which is sent by result(), as swagger futures are"""
+
+    def __init__(self, rest, method, path, params):
+        self.rest = rest
+        self.method = method
+        self.path = path
+        self.params = params
+
+    def result(self):
+        return self.rest.request(self.method, self.path, self.params)
+
+
+class RestResource():
+
+    def __init__(self, rest):
+        self.rest = rest
+
+    def __getattr__(self, operation):
+        if operation not in ENDPOINTS:
+            raise AttributeError(operation)
+        method, path = ENDPOINTS[operation]
+        return lambda **params: RestFuture(self.rest, method, path, params)
+
+
+class BitmexRest():
+    """
+            Signed REST client of bitmex api with interface of swagger client used by traders
+            (client.Order.Order_new(...).result() returns (result, response)).
+
+            It needs no swagger spec, so base_url can point to any server with bitmex api, e.g.
+            Functions.mock_exchange. Errors are raised as requests.HTTPError with response attached.
+            """
+
+    def __init__(self, base_url=None, api_key=None, api_secret=None, test=True, session=None):
+        self.base_url = (base_url or URLS[test]).rstrip('/')
+        self.base_path = urlparse(self.base_url).path
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.session = session or requests.Session()
+        self.Order = RestResource(self)
+        self.Position = RestResource(self)
+        self.User = RestResource(self)
+        self.Trade = RestResource(self)
+        self.Instrument = RestResource(self)
+
+    def request(self, method, path, params):
+        params = {key: value for key, value in params.items() if value is not None}
+        query = ''
+        body = ''
+        if method == 'GET':
+            if params:
+                query = '?' + urlencode(params)
+        else:
+            body = json.dumps(params)
+
+        headers = {'content-type': 'application/json', 'accept': 'application/json'}
+        if self.api_key:
+            expires = int(time.time()) + 5
+            headers.update({
+                'api-expires': str(expires), 'api-key': self.api_key,
+                'api-signature': signature(self.api_secret, method, self.base_path + path + query, expires, body),
+            })
+
+        response = self.session.request(method, self.base_url + path + query, data=body or None, headers=headers)
+        if response.status_code >= 400:
+            try:
+                message = response.json()['error']['message']
+            except Exception:
+                message = response.text
+            raise requests.HTTPError('{} {}: {}'.format(response.status_code, response.reason, message),
+                                     response=response)
+        return response.json(), response
@@ -0,0 +1,223 @@
+import time
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from Functions.candle_store import TIMEFRAMES, base_timeframe, ccxt_symbol, download, timeperiod_seconds
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+MINUTE = TIMEFRAMES['1m']
+
+
+class CandleSeries():
+    """
+            Closed candles of one (symbol, period) in preallocated arrays.
+
+            Bars are appended in place, frame() is a read-only dataframe over the last rows with
+            no copy of data. When buffer is full, last rows move to a new buffer, so frames handed
+            out earlier keep pointing to unchanged data.
+            """
+
+    def __init__(self, period, limit):
+        """
+                :param period: bar length in milliseconds
+                :param limit: bars kept for readers
+                """
+        self.period = period
+        self.limit = limit
+        self.capacity = 4 * limit
+        self.values = np.empty((self.capacity, len(COLUMNS)))
+        self.timestamps = np.empty(self.capacity, dtype='int64')
+        self.length = 0
+
+    def last_timestamp(self):
+        """Open time of last closed bar in ms, None if empty"""
+        return int(self.timestamps[self.length - 1]) // 10 ** 6 if self.length else None
+
+    def append(self, timestamp, bar):
+        """
+                :param timestamp: open time in ms
+                :param bar: open, high, low, close, volume
+                """
+        if self.length == self.capacity:
+            values = np.empty_like(self.values)
+            timestamps = np.empty_like(self.timestamps)
+            values[:self.limit] = self.values[-self.limit:]
+            timestamps[:self.limit] = self.timestamps[-self.limit:]
+            self.values, self.timestamps, self.length = values, timestamps, self.limit
+        self.values[self.length] = bar
+        self.timestamps[self.length] = timestamp * 10 ** 6
+        self.length += 1
+
+    def frame(self, limit=None):
+        """Last `limit` bars as dataframe view, index is UTC open time"""
+        start = max(self.length - (limit or self.limit), 0)
+        values = self.values[start:self.length]
+        values.flags.writeable = False
+        index = pd.DatetimeIndex(self.timestamps[start:self.length].view('datetime64[ns]'), copy=False)
+        return pd.DataFrame(values, index=index, columns=COLUMNS, copy=False)
+
+
+def aggregate_bars(candles, period):
+    """
+            ccxt candles of one bin to candles of period (multiple of bin), buckets are aligned to epoch
+
+            :return: list of [open time ms, open, high, low, close, volume] of every bucket
+            """
+    if len(candles) == 0:
+        return []
+    array = np.asarray(candles, dtype=float)
+    buckets = array[:, 0].astype('int64') // period * period
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)]
+    return np.column_stack((buckets[starts], array[starts, 1], np.maximum.reduceat(array[:, 2], starts),
+                            np.minimum.reduceat(array[:, 3], starts), array[ends - 1, 4],
+                            np.add.reduceat(array[:, 5], starts))).tolist()
+
+
+class CandleService():
+    """
+            Candles of one symbol for any number of periods built from 1m bars.
+
+            Every period is seeded once from the largest bitmex bin it consists of. After that only
+            1m bars are downloaded, one request per symbol, and each of them updates open bar of
+            every period in O(1); a period bar is closed and appended when its last minute arrives.
+            Bots get read-only views of (symbol, period) arrays instead of resampled copies.
+            """
+
+    services = {}
+    services_lock = Lock()
+
+    limit = 500
+    retries = 8
+    retry_delay = 0.25
+
+    @staticmethod
+    def get(symbol='XBTUSD'):
+        """Shared service of bitmex symbol"""
+        with CandleService.services_lock:
+            if symbol not in CandleService.services:
+                CandleService.services[symbol] = CandleService(symbol)
+            return CandleService.services[symbol]
+
+    def __init__(self, symbol='XBTUSD'):
+        self.symbol = symbol
+        self.ccxt_symbol = ccxt_symbol(symbol)
+        self.lock = Lock()
+        self.series = {}
+        # open bar of every period: [open time, open, high, low, close, volume]
+        self.partial = {}
+        self.last_minute = None
+
+    def require(self, timeperiod, limit=None):
+        """
+                Keep candles of timeperiod, seeded on first request
+
+                :param timeperiod: bitmex bin ('5m') or pandas offset ('30T'), whole minutes
+                :return: period in ms
+                """
+        period = timeperiod_seconds(timeperiod) * 1000
+        if period % MINUTE != 0:
+            raise ValueError('Period {} is not whole minutes'.format(timeperiod))
+        with self.lock:
+            if period not in self.series:
+                self.seed(period, limit or CandleService.limit)
+        return period
+
+    def seed(self, period, limit):
+        timeframe = base_timeframe(period // 1000)
+        now = int(time.time() * 1000)
+        # bucket which is still open is rebuilt from minutes, closed ones from whole bins
+        current = now // period * period
+        since = current - limit * period
+        candles = download(timeframe, since, (now - since) // TIMEFRAMES[timeframe], self.ccxt_symbol)
+
+        series = CandleSeries(period, limit)
+        for bar in aggregate_bars(candles, period):
+            if bar[0] < current:
+                series.append(int(bar[0]), bar[1:])
+        self.series[period] = series
+        self.partial[period] = None
+
+        # minutes up to the last one other periods have seen, so all of them stay in sync
+        since = series.last_timestamp() + period if series.length else current
+        end = self.last_minute if self.last_minute is not None else now
+        minutes = [minute for minute in download('1m', since, max((end - since) // MINUTE + 1, 0), self.ccxt_symbol)
+                   if minute[0] <= end]
+        for minute in minutes:
+            self.ingest_period(period, minute)
+        if minutes and self.last_minute is None:
+            self.last_minute = int(minutes[-1][0])
+
+    def ingest(self, minute):
+        """Adds closed 1m bar [open time ms, open, high, low, close, volume] to every period"""
+        if self.last_minute is not None and minute[0] <= self.last_minute:
+            return
+        for period in self.series:
+            self.ingest_period(period, minute)
+        self.last_minute = int(minute[0])
+
+    def ingest_period(self, period, minute):
+        series = self.series[period]
+        bucket = int(minute[0]) // period * period
+        last = series.last_timestamp()
+        if last is not None and bucket <= last:
+            return
+
+        partial = self.partial[period]
+        if partial is not None and partial[0] != bucket:
+            # minutes missing at the end of previous bucket, it is closed by the next one
+            series.append(partial[0], partial[1:])
+            partial = None
+        if partial is None:
+            partial = [bucket] + list(minute[1:])
+        else:
+            partial[2] = max(partial[2], minute[2])
+            partial[3] = min(partial[3], minute[3])
+            partial[4] = minute[4]
+            partial[5] += minute[5]
+
+        if int(minute[0]) + MINUTE == bucket + period:
+            series.append(partial[0], partial[1:])
+            partial = None
+        self.partial[period] = partial
+
+    def update(self, bar_close=None):
+        """
+                Download 1m bars closed since the last one and add them to all periods
+
+                :param bar_close: unix time of expected bar close, request is repeated up to `retries`
+                                  times until exchange publishes it
+                :return: number of new 1m bars
+                """
+        with self.lock:
+            added = 0
+            for _ in range(CandleService.retries):
+                now = int(time.time() * 1000)
+                since = self.last_minute + MINUTE if self.last_minute is not None else now // MINUTE * MINUTE - MINUTE
+                missing = (now - since) // MINUTE
+                if missing > 0:
+                    for minute in download('1m', since, missing, self.ccxt_symbol):
+                        self.ingest(minute)
+                        added += 1
+                if bar_close is None or (self.last_minute is not None and self.last_minute + MINUTE >= bar_close * 1000):
+                    break
+                time.sleep(CandleService.retry_delay)
+            return added
+
+    def candles(self, timeperiod, bar_close=None, limit=None):
+        """
+                Closed candles of timeperiod, view of shared arrays
+
+                :param timeperiod: bitmex bin ('5m') or pandas offset ('30T')
+                :param bar_close: unix time of expected bar close, 1m bars are updated up to it
+                :param limit: bars, defaults to limit of the period
+                :return: read-only dataframe
+                """
+        period = self.require(timeperiod)
+        if bar_close is not None:
+            self.update(bar_close)
+        with self.lock:
+            return self.series[period].frame(limit)
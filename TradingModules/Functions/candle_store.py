@@ -0,0 +1,67 @@
+import re
+
+from Functions.clients import get_ccxt_client
+
+# length of bitmex bins in milliseconds
+TIMEFRAMES = {
+    '1m': 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+# bitmex contracts and their ccxt symbols, other ones are looked up in ccxt markets
+CCXT_SYMBOLS = {'XBTUSD': 'BTC/USD', 'ETHUSD': 'ETH/USD'}
+
+# candles per request
+PAGE = 500
+
+UNITS = {'s': 1, 'S': 1, 'T': 60, 'min': 60, 'm': 60, 'h': 3600, 'H': 3600, 'd': 86400, 'D': 86400}
+
+
+def timeperiod_seconds(timeperiod):
+    """Length of period given as bitmex bin ('5m') or pandas offset ('30T') in seconds"""
+    match = re.match(r'^(\d*)\s*([a-zA-Z]+)$', timeperiod.strip())
+    if match is None or match.group(2) not in UNITS:
+        raise ValueError('Unknown timeperiod {}'.format(timeperiod))
+    return int(match.group(1) or 1) * UNITS[match.group(2)]
+
+
+def ccxt_symbol(symbol):
+    """ccxt symbol of bitmex contract, e.g. 'BTC/USD' for 'XBTUSD'"""
+    if symbol in CCXT_SYMBOLS:
+        return CCXT_SYMBOLS[symbol]
+    client = get_ccxt_client()
+    client.load_markets()
+    market = client.markets_by_id[symbol]
+    # newer ccxt keeps list of markets per id
+    market = market[0] if isinstance(market, list) else market
+    CCXT_SYMBOLS[symbol] = market['symbol']
+    return market['symbol']
+
+
+def base_timeframe(period):
+    """Largest bitmex bin which period consists of"""
+    for timeframe in sorted(TIMEFRAMES, key=TIMEFRAMES.get, reverse=True):
+        if period * 1000 % TIMEFRAMES[timeframe] == 0:
+            return timeframe
+    raise ValueError('Period of {}s can not be built from bitmex bins'.format(period))
+
+
+def fetch(timeframe, since, limit, symbol='BTC/USD'):
+    """One page of closed candles of ccxt symbol"""
+    return get_ccxt_client().fetch_ohlcv(symbol, timeframe, since, limit, {'partial': False})
+
+
+def download(timeframe, since, count, symbol='BTC/USD'):
+    """Up to `count` closed candles of ccxt symbol from `since` in pages"""
+    bin_size = TIMEFRAMES[timeframe]
+    candles = []
+    while len(candles) < count:
+        page = fetch(timeframe, since, min(PAGE, count - len(candles)), symbol)
+        page = [c for c in page if len(candles) == 0 or c[0] > candles[-1][0]]
+        if len(page) == 0:
+            break
+        candles += page
+        since = page[-1][0] + bin_size
+    return candles
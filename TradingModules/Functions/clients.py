@@ -0,0 +1,84 @@
+from threading import Lock
+
+import bitmex
+import ccxt
+from requests.adapters import HTTPAdapter
+
+from Functions.bitmex_rest import BitmexRest
+
+# connections kept alive per client, enough for all bots of one account
+POOL_SIZE = 16
+
+_clients = {}
+_lock = Lock()
+
+
+def get_bitmex_client(test=True, api_key=None, api_secret=None, config=None, base_url=None):
+    """
+            Swagger client for account, built once and shared by traders, BotManager and helper functions.
+
+            Building a client downloads and parses swagger spec, so it has to be done only once per
+            (account, testnet, config). Reused client keeps its HTTP session and keep-alive connections.
+
+            :param test: testnet or real exchange
+            :param api_key: account api key, None for public endpoints
+            :param api_secret: account api secret
+            :param config: bravado config passed to bitmex connector
+            :param base_url: api url (e.g. 'http://127.0.0.1:8080/api/v1' of Functions.mock_exchange),
+                             if set Functions.bitmex_rest client talks to it instead of swagger client
+            :return: bitmex swagger client
+            """
+    # clients built with other bravado config (timeouts, validation) are different clients
+    key = ('bitmex', api_key, base_url or test, repr(sorted(config.items())) if config else None)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                if base_url is not None:
+                    client = BitmexRest(base_url, api_key=api_key, api_secret=api_secret)
+                    mount_pool(client.session)
+                else:
+                    client = bitmex.bitmex(test=test, config=config, api_key=api_key, api_secret=api_secret)
+                    mount_pool(getattr(client.swagger_spec.http_client, 'session', None))
+                _clients[key] = client
+    return client
+
+
+def get_ccxt_client(api_key=None, api_secret=None):
+    """
+            Shared ccxt bitmex connector, public one if no keys passed.
+
+            :return: ccxt.bitmex
+            """
+    key = ('ccxt', api_key, None, None)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                params = {}
+                if api_key is not None:
+                    params = {'apiKey': api_key, 'secret': api_secret}
+                client = ccxt.bitmex(params)
+                mount_pool(getattr(client, 'session', None))
+                _clients[key] = client
+    return client
+
+
+def register_client(client, test=True, api_key=None, kind='bitmex'):
+    """
+            Put already built client (e.g. backtest proxy) into registry, so traders pick it up unchanged
+
+            :param kind: 'bitmex' for swagger client, 'ccxt' for ccxt connector (e.g. BitmexProxy.ccxt)
+            """
+    with _lock:
+        _clients[(kind, api_key, test if kind == 'bitmex' else None, None)] = client
+
+
+def mount_pool(session):
+    if session is None:
+        return
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
@@ -1,12 +1,16 @@
 import datetime
-from collections import namedtuple
 
-import ccxt
 import numpy as np
 import pandas as pd
 import talib
+from Functions.clients import get_ccxt_client
 from Functions.consts import *
 
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
 
 def resample(dataframe, to_timeframe):
     ohlc_dict = {
@@ -22,12 +26,10 @@ def resample(dataframe, to_timeframe):
     return resampled
 
 
-def get_last_close(timeframe):
+def get_last_close(timeframe, symbol='BTC/USD'):
     # bitmex connector
-    bitmex_api = ccxt.bitmex({
-    })
+    bitmex_api = get_ccxt_client()
     # params:
-    symbol = 'BTC/USD'
     limit = 1
     params = {'partial': False}
     comission_rate = 0.0
@@ -40,17 +42,20 @@ def get_last_close(timeframe):
     return df.iloc[-1].close
 
 
-def get_last_candles(timeframe='1h'):
+def get_last_candles(timeframe='1h', symbol='BTC/USD'):
     # bitmex connector
-    bitmex_api = ccxt.bitmex({
-    })
+    bitmex_api = get_ccxt_client()
     # params:
-    symbol = 'BTC/USD'
     limit = 500
     params = {'partial': False}
 
     since = bitmex_api.milliseconds() - limit * 60 * 60 * 1000
     candles = bitmex_api.fetch_ohlcv(symbol, timeframe, since, limit, params)
+
+    return candles_to_frame(candles)
+
+
+def candles_to_frame(candles):
     df = pd.DataFrame(candles, columns=[
                       'timestamp', 'open', 'high', 'low', 'close', 'volume'])
 
@@ -72,10 +77,7 @@ def get_data(timeframe):
     # df = dm.get_candles_by_time(td=timedelta(hours=1), period='1min')
 
     # bitmex connector
-    bitmex_api = ccxt.bitmex({
-        'apiKey': BITMEX_API_KEY,
-        'secret': BITMEX_API_SECRET,
-    })
+    bitmex_api = get_ccxt_client(BITMEX_API_KEY, BITMEX_API_SECRET)
     # params:
     symbol = 'BTC/USD'
     limit = 500
@@ -87,6 +89,18 @@ def get_data(timeframe):
     df = pd.DataFrame(candles, columns=[
                       'timestamp', 'open', 'high', 'low', 'close', 'volume'])
 
+    return make_features(df, comission_rate=comission_rate)
+
+
+def make_features(df, comission_rate=0.0, lags=3):
+    """
+            HA, talib indicators and lagged columns of OHLCV dataframe with next bar HA change as target
+
+            :param df: OHLCV dataframe
+            :param comission_rate: changes smaller than commission give target 0 and are dropped
+            :param lags: number of previous bars added as columns
+            :return: dataframe with features, perc_change and perc_change_sign columns
+            """
     # data transforming
     df = add_HA(df)
     df = add_indicators(df)
@@ -94,7 +108,7 @@ def get_data(timeframe):
     columns = ['open', 'high', 'low', 'close', 'volume',
                'HA_Close', 'HA_Open', 'HA_High', 'HA_Low']
     for column in columns:
-        for i in range(1, 4):
+        for i in range(1, lags + 1):
             df[column + str(i)] = df[column].shift(i)
     df.dropna(inplace=True)
 
@@ -137,25 +151,66 @@ def train_test_split(df):
     return X_train, X_test, y_train
 
 
-def add_HA(df):
+def ha_open_loop(_open, close, previous=None):
+    ha_open = np.empty(len(close))
+    prev_open, prev_close = previous if previous is not None else (_open[0], close[0])
+    for i, c in enumerate(close.tolist()):
+        prev_open = (prev_open + prev_close) / 2
+        ha_open[i] = prev_open
+        prev_close = c
+    return ha_open
+
+
+def ha_open_filter(_open, close, previous=None):
+    """HA_Open[i] = (HA_Open[i-1] + close[i-1]) / 2 as a first order recursive filter over the whole array."""
+    if lfilter is None:
+        return ha_open_loop(_open, close, previous)
+    prev_open, prev_close = previous if previous is not None else (_open[0], close[0])
+    first = (prev_open + prev_close) / 2
+    ha_open = np.empty(len(close))
+    ha_open[0] = first
+    # halving is exact, so 0.5 * a + 0.5 * b gives the same bits as (a + b) / 2
+    ha_open[1:] = lfilter([0.5], [1., -0.5], close[:-1], zi=[0.5 * first])[0]
+    return ha_open
+
+
+def add_HA(df, incremental=False):
     '''Heiken Ashi transform.
     input:
         DF with OHLC columns.
+        incremental: if DF already has HA columns, compute only rows where HA_Open is NaN
+        (e.g. bars appended since the last call) starting from the previous HA state.
     output:
         DF with OHLC and new Heiken Ashi OHLC columns.
     '''
-    df['HA_Close'] = (df['open'] + df['high'] + df['low'] + df['close']) / 4
-
-    nt = namedtuple('nt', ['open', 'close'])
-    previous_row = nt(df.ix[0, 'open'], df.ix[0, 'close'])
-
-    for i, row in enumerate(df.itertuples()):
-        ha_open = (previous_row.open + previous_row.close) / 2
-        df.ix[i, 'HA_Open'] = ha_open
-        previous_row = nt(ha_open, row.close)
-
-    df['HA_High'] = df[['HA_Open', 'HA_Close', 'high']].max(axis=1)
-    df['HA_Low'] = df[['HA_Open', 'HA_Close', 'low']].min(axis=1)
+    start = 0
+    if incremental and 'HA_Open' in df:
+        computed = df['HA_Open'].notnull().values
+        if computed.all():
+            return df
+        start = int(np.argmin(computed))
+
+    _open = df['open'].values[start:].astype(float)
+    high = df['high'].values[start:].astype(float)
+    low = df['low'].values[start:].astype(float)
+    close = df['close'].values[start:].astype(float)
+    if len(close) == 0:
+        return df
+
+    previous = None
+    if start > 0:
+        previous = (df['HA_Open'].values[start - 1], df['close'].values[start - 1])
+
+    ha_close = (_open + high + low + close) / 4
+    ha_open = ha_open_filter(_open, close, previous)
+    ha_high = np.maximum(np.maximum(ha_open, ha_close), high)
+    ha_low = np.minimum(np.minimum(ha_open, ha_close), low)
+
+    for column, values in (('HA_Close', ha_close), ('HA_Open', ha_open), ('HA_High', ha_high), ('HA_Low', ha_low)):
+        if start == 0:
+            df[column] = values
+        else:
+            df.iloc[start:, df.columns.get_loc(column)] = values
     return df
 
 
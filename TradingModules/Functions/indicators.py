@@ -0,0 +1,298 @@
+from collections import OrderedDict, deque
+from threading import Lock
+
+import numpy as np
+import talib
+
+
+def bar_color(_open, close):
+    """1 for green bar, -1 for red bar, 0 for doji"""
+    if close > _open:
+        return 1
+    if close < _open:
+        return -1
+    return 0
+
+
+def bar_colors(_open, close):
+    """bar_color() over whole arrays"""
+    return np.sign(np.asarray(close, dtype=float) - np.asarray(_open, dtype=float)).astype(int)
+
+
+def sma(values, period):
+    """talib.SMA over whole array, period 1 (rejected by talib) returns values as is"""
+    values = np.asarray(values, dtype=float)
+    if period == 1:
+        return values.copy()
+    return talib.SMA(values, period)
+
+
+class IndicatorCache():
+    """
+            LRU memo of whole-history indicator arrays.
+
+            Parameter sets and bots computing the same indicator over the same candles
+            (e.g. RSI of one period) get one shared read-only array instead of recomputing it.
+            """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.arrays = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+                :param key: hashable, e.g. (indicator name, params, candles version)
+                :param compute: function returning array, called on miss
+                """
+        with self.lock:
+            if key in self.arrays:
+                self.arrays.move_to_end(key)
+                self.hits += 1
+                return self.arrays[key]
+            self.misses += 1
+
+        array = np.asarray(compute())
+        array.flags.writeable = False
+        with self.lock:
+            self.arrays[key] = array
+            while len(self.arrays) > self.maxsize:
+                self.arrays.popitem(last=False)
+        return array
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def clear(self):
+        with self.lock:
+            self.arrays.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class Indicator():
+    """
+            Streaming indicator updated with one closed bar at a time.
+
+            Every update is O(1), `value` keeps the latest output (NaN while warming up)
+            and matches talib/pandas output computed over the same history.
+            """
+
+    # attributes readers use after update, shared indicators copy them per bar
+    outputs = ('value',)
+
+    def __init__(self):
+        self.value = np.nan
+
+    def update(self, x):
+        raise NotImplementedError
+
+    def feed(self, *columns):
+        for values in zip(*columns):
+            self.update(*values)
+        return self.value
+
+
+class SMA(Indicator):
+    """Same arithmetic as talib.SMA: running total, add the new value, then remove the trailing one"""
+
+    def __init__(self, period):
+        Indicator.__init__(self)
+        self.period = period
+        self.window = deque()
+        self.total = 0.
+
+    def update(self, x):
+        # talib starts calculation from the first non NaN value
+        if len(self.window) == 0 and x != x:
+            return self.value
+        self.window.append(x)
+        self.total += x
+        if len(self.window) < self.period:
+            return self.value
+        self.value = self.total / self.period
+        self.total -= self.window.popleft()
+        return self.value
+
+
+class RSI(Indicator):
+    """Same arithmetic as talib.RSI (Wilder smoothing seeded by simple average of first `period` changes)"""
+
+    def __init__(self, period):
+        Indicator.__init__(self)
+        self.period = period
+        self.prev = None
+        self.count = 0
+        self.gain = 0.
+        self.loss = 0.
+
+    def rsi(self):
+        total = self.gain + self.loss
+        if total == 0:
+            return 0.
+        return 100. * (self.gain / total)
+
+    def update(self, x):
+        if self.prev is None:
+            if x == x:
+                self.prev = x
+            return self.value
+
+        diff = x - self.prev
+        self.prev = x
+        self.count += 1
+
+        if self.count > self.period:
+            self.loss *= self.period - 1
+            self.gain *= self.period - 1
+
+        if diff < 0:
+            self.loss -= diff
+        else:
+            self.gain += diff
+
+        if self.count >= self.period:
+            # talib multiplies by the reciprocal instead of dividing
+            self.loss *= 1.0 / self.period
+            self.gain *= 1.0 / self.period
+            self.value = self.rsi()
+        return self.value
+
+
+class RollingExtremum(Indicator):
+    """Rolling max (or min) over `period` values on a monotonic deque, same as pandas rolling(period).max()"""
+
+    def __init__(self, period, maximum=True):
+        Indicator.__init__(self)
+        self.period = period
+        self.maximum = maximum
+        self.window = deque()
+        self.count = 0
+
+    def update(self, x):
+        if self.maximum:
+            while self.window and self.window[-1][1] <= x:
+                self.window.pop()
+        else:
+            while self.window and self.window[-1][1] >= x:
+                self.window.pop()
+        self.window.append((self.count, x))
+        self.count += 1
+
+        while self.window[0][0] <= self.count - 1 - self.period:
+            self.window.popleft()
+
+        if self.count >= self.period:
+            self.value = self.window[0][1]
+        return self.value
+
+
+class RollingMax(RollingExtremum):
+
+    def __init__(self, period):
+        RollingExtremum.__init__(self, period, maximum=True)
+
+
+class RollingMin(RollingExtremum):
+
+    def __init__(self, period):
+        RollingExtremum.__init__(self, period, maximum=False)
+
+
+class BodyAverage(Indicator):
+    """SMA of candle body abs(close - open), `body` keeps the last body"""
+
+    outputs = ('value', 'body')
+
+    def __init__(self, period=10):
+        Indicator.__init__(self)
+        self.sma = SMA(period)
+        self.body = np.nan
+
+    def update(self, _open, close):
+        self.body = abs(close - _open)
+        self.value = self.sma.update(self.body)
+        return self.value
+
+
+class SharedIndicators():
+    """
+            Streaming indicators shared by strategies of all bots.
+
+            Indicator is keyed by (class, params, source, timeperiod) and is updated once per bar
+            however many strategies feed it, others get outputs memoized for that bar. Outputs of
+            the last `history` bars are kept, so strategy seeded later with the same history still
+            gets exact values.
+            """
+
+    def __init__(self, history=2000):
+        self.history = history
+        self.lock = Lock()
+        self.indicators = {}
+        self.hits = 0
+        self.misses = 0
+
+    def update(self, key, factory, version, *values):
+        """
+                :param key: (class name, params, source, timeperiod)
+                :param factory: builds indicator on first use
+                :param version: bar timestamp, increasing
+                :param values: inputs of indicator update()
+                :return: outputs of indicator after bar `version`, NaN if bar is older than kept history
+                """
+        with self.lock:
+            entry = self.indicators.get(key)
+            if entry is None:
+                entry = self.indicators[key] = {'indicator': factory(), 'outputs': OrderedDict(), 'last': None}
+
+            outputs = entry['outputs'].get(version)
+            if outputs is not None:
+                self.hits += 1
+                return outputs
+
+            indicator = entry['indicator']
+            if entry['last'] is not None and version <= entry['last']:
+                # bar before kept history, can not be replayed on shared state
+                self.misses += 1
+                return tuple(np.nan for _ in indicator.outputs)
+
+            self.misses += 1
+            indicator.update(*values)
+            outputs = tuple(getattr(indicator, name) for name in indicator.outputs)
+            entry['outputs'][version] = outputs
+            entry['last'] = version
+            if len(entry['outputs']) > self.history:
+                entry['outputs'].popitem(last=False)
+            return outputs
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.
+
+    def stats(self):
+        """Number of distinct indicators, updates computed and updates served from memo"""
+        return {'indicators': len(self.indicators), 'computed': self.misses, 'shared': self.hits,
+                'hit_rate': self.hit_rate()}
+
+
+class SharedIndicator():
+    """Indicator interface of SharedIndicators entry for one strategy, bar version is read from `version`"""
+
+    def __init__(self, registry, key, factory, version):
+        self.registry = registry
+        self.key = key
+        self.factory = factory
+        self.version = version
+        self.value = np.nan
+        self.names = None
+
+    def update(self, *values):
+        outputs = self.registry.update(self.key, self.factory, self.version(), *values)
+        if self.names is None:
+            self.names = self.registry.indicators[self.key]['indicator'].outputs
+        for name, output in zip(self.names, outputs):
+            setattr(self, name, output)
+        return self.value
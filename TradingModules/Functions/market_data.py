@@ -0,0 +1,217 @@
+import hashlib
+import hmac
+import json
+import time
+import traceback
+from datetime import datetime, timezone
+from threading import Thread, Lock, Event
+
+import websocket
+
+from Functions.logger import create_logger
+
+# rows kept for tables which only grow
+MAX_TABLE_LEN = 200
+
+# time to wait for partials on startup
+CONNECT_TIMEOUT = 10
+
+
+def parse_timestamp(timestamp):
+    return datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc).timestamp()
+
+
+class MarketData():
+    """
+            Market and account data kept in memory from bitmex websocket.
+
+            One connection per (account, testnet) subscribes once to trade buckets, instrument and,
+            if keys are given, position, order and margin streams. Traders read latest values from it
+            instead of doing REST round trips. Every getter returns None if data is not available,
+            so callers can fall back to REST.
+            """
+
+    feeds = {}
+    feeds_lock = Lock()
+
+    @staticmethod
+    def get(test=True, api_key=None, api_secret=None, symbol='XBTUSD'):
+        """Shared feed for account, started on first request"""
+        key = (api_key, test, symbol)
+        with MarketData.feeds_lock:
+            if key not in MarketData.feeds:
+                MarketData.feeds[key] = MarketData(test, api_key, api_secret, symbol)
+            return MarketData.feeds[key]
+
+    def __init__(self, test=True, api_key=None, api_secret=None, symbol='XBTUSD'):
+        self.test = test
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.symbol = symbol
+        self.logger = create_logger('market_data')
+
+        self.tables = {}
+        self.keys = {}
+        self.lock = Lock()
+        self.ready = Event()
+        self.connected = False
+        self.last_message = 0
+        self.bar_listeners = []
+        self.execution_listeners = []
+        self.stopped = False
+        # assigned by run thread on every connect
+        self.ws = None
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait(CONNECT_TIMEOUT)
+
+    def url(self):
+        host = 'testnet.bitmex.com' if self.test else 'www.bitmex.com'
+        subscriptions = ['tradeBin1m:' + self.symbol, 'tradeBin1h:' + self.symbol, 'instrument:' + self.symbol]
+        if self.api_key:
+            subscriptions += ['position:' + self.symbol, 'order:' + self.symbol, 'execution:' + self.symbol, 'margin']
+        return 'wss://{}/realtime?subscribe={}'.format(host, ','.join(subscriptions))
+
+    def auth_headers(self):
+        if not self.api_key:
+            return []
+        expires = int(time.time()) + 5
+        signature = hmac.new(bytes(self.api_secret, 'utf8'), bytes('GET/realtime' + str(expires), 'utf8'),
+                             digestmod=hashlib.sha256).hexdigest()
+        return ['api-expires: ' + str(expires),
+                'api-signature: ' + signature,
+                'api-key: ' + self.api_key]
+
+    def run(self):
+        while not self.stopped:
+            try:
+                self.ws = websocket.WebSocketApp(self.url(), header=self.auth_headers(),
+                                                 on_open=self.on_open, on_message=self.on_message,
+                                                 on_close=self.on_close, on_error=self.on_error)
+                self.ws.run_forever(ping_interval=20)
+            except Exception:
+                self.logger.error(traceback.format_exc())
+            self.connected = False
+            if not self.stopped:
+                time.sleep(1)
+
+    def stop(self):
+        self.stopped = True
+        ws = self.ws
+        if ws is not None:
+            ws.close()
+
+    def on_open(self, *args):
+        self.logger.info('Websocket connected')
+        self.connected = True
+
+    def on_close(self, *args):
+        self.logger.info('Websocket closed')
+        self.connected = False
+        with self.lock:
+            self.tables = {}
+
+    def on_error(self, *args):
+        self.logger.error('Websocket error: {}'.format(args[-1]))
+
+    def add_bar_listener(self, listener):
+        """listener(bar_close) is called with unix time of each closed 1m bar"""
+        self.bar_listeners.append(listener)
+
+    def add_execution_listener(self, listener):
+        """listener(executions) is called with rows of every execution insert (order fills, cancels)"""
+        self.execution_listeners.append(listener)
+
+    def find(self, table, item):
+        keys = self.keys.get(table, [])
+        for row in self.tables.get(table, []):
+            if all(row.get(k) == item.get(k) for k in keys):
+                return row
+        return None
+
+    def on_message(self, *args):
+        message = json.loads(args[-1])
+        table = message.get('table')
+        action = message.get('action')
+        self.last_message = time.time()
+        if table is None or action is None:
+            return
+
+        data = message['data']
+        with self.lock:
+            if action == 'partial':
+                self.tables[table] = data
+                self.keys[table] = message.get('keys', [])
+            elif action == 'insert':
+                rows = self.tables.setdefault(table, [])
+                rows += data
+                if len(rows) > MAX_TABLE_LEN:
+                    del rows[:len(rows) - MAX_TABLE_LEN]
+            elif action == 'update':
+                for item in data:
+                    row = self.find(table, item)
+                    if row is not None:
+                        row.update(item)
+            elif action == 'delete':
+                for item in data:
+                    row = self.find(table, item)
+                    if row is not None:
+                        self.tables[table].remove(row)
+
+            if all(t in self.tables for t in ('instrument', 'tradeBin1m')):
+                self.ready.set()
+
+        if table == 'tradeBin1m' and action == 'insert':
+            # bitmex labels bins by close time
+            for item in data:
+                bar_close = int(parse_timestamp(item['timestamp']))
+                for listener in self.bar_listeners:
+                    listener(bar_close)
+
+        if table == 'execution' and action == 'insert':
+            for listener in self.execution_listeners:
+                listener(data)
+
+    def last_row(self, table):
+        if not self.connected:
+            return None
+        with self.lock:
+            rows = self.tables.get(table)
+            return dict(rows[-1]) if rows else None
+
+    def last_price(self):
+        instrument = self.last_row('instrument')
+        if instrument is None:
+            return None
+        return instrument.get('lastPrice')
+
+    def last_close(self, timeframe):
+        bin_ = self.last_row('tradeBin' + timeframe)
+        if bin_ is None:
+            return None
+        return bin_.get('close')
+
+    def position_qty(self):
+        if not self.connected or 'position' not in self.tables:
+            return None
+        position = self.last_row('position')
+        if position is None:
+            return 0
+        return position.get('currentQty', 0)
+
+    def position(self):
+        """Position row of symbol (currentQty, leverage, ...), None if not available"""
+        if not self.connected or 'position' not in self.tables:
+            return None
+        return self.last_row('position')
+
+    def open_orders(self):
+        if not self.connected or 'order' not in self.tables:
+            return None
+        with self.lock:
+            return [dict(order) for order in self.tables['order']
+                    if order.get('ordStatus') in ('New', 'PartiallyFilled')]
+
+    def margin(self):
+        return self.last_row('margin')
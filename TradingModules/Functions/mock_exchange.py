@@ -0,0 +1,303 @@
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qsl
+
+from Functions.bitmex_rest import signature
+
+SATOSHI = 100000000
+
+
+def isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+class MockError(Exception):
+
+    def __init__(self, status, message, headers=None):
+        Exception.__init__(self, message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class MockExchange():
+    """
+            Local bitmex REST api for tests of traders and order gateway, no network or keys needed.
+
+            Serves the endpoints of Functions.bitmex_rest.ENDPOINTS for one symbol at `price`, which
+            tests move with set_price(). Market orders and marketable limit orders are filled at once,
+            others rest until price crosses them, stops trigger the same way. Bulk requests are applied
+            in order under one lock, so a flip or bracket is atomic for other clients. Requests are
+            signature checked, rate limited with bitmex headers, recorded in `requests` and can be
+            made to fail with fail().
+
+            Point traders at it with bitmex_params={'base_url': exchange.start(), 'api_key': 'mock',
+            'api_secret': 'mock'}.
+            """
+
+    def __init__(self, symbol='XBTUSD', price=10000., balance=1., api_key='mock', api_secret='mock', latency=0.,
+                 rate_limit=120, host='127.0.0.1', port=0):
+        """
+                :param balance: wallet balance in XBT
+                :param latency: seconds added to every response, to emulate network round trip
+                :param rate_limit: requests per minute, as bitmex limit of authenticated account
+                :param port: 0 to pick free port
+                """
+        self.symbol = symbol
+        self.price = price
+        self.wallet = int(balance * SATOSHI)
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.address = (host, port)
+
+        self.lock = Lock()
+        self.orders = []
+        self.contracts = 0
+        self.entry_price = 0.
+        self.leverage = 0.
+        # (method, path, unix time) of every request
+        self.requests = []
+        # (status, headers) of responses to fail next requests with
+        self.failures = []
+        self.window_start = time.time()
+        self.window_requests = 0
+        self.server = None
+
+    def start(self):
+        """Starts server in background thread, returns base_url of api"""
+        exchange = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                exchange.handle(self)
+
+            def do_POST(self):
+                exchange.handle(self)
+
+            def do_DELETE(self):
+                exchange.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(self.address, Handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return 'http://{}:{}/api/v1'.format(*self.server.server_address[:2])
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail(self, status=503, headers=None, times=1):
+        """Next `times` requests get error response, e.g. fail(429, {'Retry-After': '1'})"""
+        with self.lock:
+            self.failures += [(status, headers or {})] * times
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        body = handler.rfile.read(int(handler.headers.get('content-length') or 0)).decode()
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self.lock:
+            self.requests.append((handler.command, url.path, time.time()))
+            headers = self.rate_limit_headers()
+            try:
+                self.check_signature(handler, body)
+                if self.window_requests > self.rate_limit:
+                    raise MockError(429, 'Rate limit exceeded',
+                                    {'Retry-After': str(int(self.window_start + 60 - time.time()) + 1)})
+                if self.failures:
+                    status, failure_headers = self.failures.pop(0)
+                    raise MockError(status, 'Mock failure', failure_headers)
+                params = dict(parse_qsl(url.query))
+                if body:
+                    params.update(json.loads(body))
+                status, result = 200, self.route(handler.command, url.path.split('/api/v1', 1)[-1], params)
+            except MockError as e:
+                status, result = e.status, {'error': {'message': str(e), 'name': 'HTTPError'}}
+                headers.update(e.headers)
+
+        data = json.dumps(result).encode()
+        handler.send_response(status)
+        handler.send_header('content-type', 'application/json')
+        handler.send_header('content-length', str(len(data)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def rate_limit_headers(self):
+        now = time.time()
+        if now - self.window_start >= 60:
+            self.window_start, self.window_requests = now, 0
+        self.window_requests += 1
+        return {'x-ratelimit-limit': str(self.rate_limit),
+                'x-ratelimit-remaining': str(max(self.rate_limit - self.window_requests, 0)),
+                'x-ratelimit-reset': str(int(self.window_start + 60))}
+
+    def check_signature(self, handler, body):
+        if not self.api_key:
+            return
+        expires = handler.headers.get('api-expires')
+        if handler.headers.get('api-key') != self.api_key or expires is None:
+            raise MockError(401, 'Invalid API Key.')
+        if int(expires) < time.time():
+            raise MockError(401, 'This request has expired.')
+        if handler.headers.get('api-signature') != signature(self.api_secret, handler.command, handler.path,
+                                                             expires, body):
+            raise MockError(401, 'Signature not valid.')
+
+    def route(self, method, path, params):
+        if (method, path) == ('POST', '/order'):
+            return self.new_order(params)
+        if (method, path) == ('POST', '/order/bulk'):
+            return self.new_bulk(params)
+        if (method, path) == ('GET', '/order'):
+            return self.get_orders(params)
+        if (method, path) == ('DELETE', '/order'):
+            return self.cancel(params)
+        if (method, path) == ('DELETE', '/order/all'):
+            return self.cancel({'orderID': [o['orderID'] for o in self.orders if o['ordStatus'] == 'New']})
+        if (method, path) == ('GET', '/position'):
+            return [self.position()]
+        if (method, path) == ('POST', '/position/leverage'):
+            self.leverage = float(params['leverage'])
+            return self.position()
+        if (method, path) == ('GET', '/user/walletSummary'):
+            return [{'transactType': 'RealisedPNL', 'walletBalance': 0, 'unrealisedPnl': 0},
+                    {'transactType': 'Total', 'walletBalance': self.wallet, 'unrealisedPnl': self.unrealised_pnl()}]
+        if (method, path) == ('GET', '/user/margin'):
+            return {'walletBalance': self.wallet, 'marginBalance': self.wallet + self.unrealised_pnl(),
+                    'unrealisedPnl': self.unrealised_pnl()}
+        if (method, path) in (('GET', '/trade/bucketed'), ('GET', '/instrument')):
+            return [{'symbol': self.symbol, 'timestamp': isoformat(time.time()), 'open': self.price,
+                     'high': self.price, 'low': self.price, 'close': self.price, 'lastPrice': self.price}]
+        raise MockError(404, 'Not found: {} {}'.format(method, path))
+
+    def validate(self, params):
+        if params.get('symbol', self.symbol) != self.symbol:
+            raise MockError(400, 'Invalid symbol')
+        if params.get('clOrdID') and any(o['clOrdID'] == params['clOrdID'] for o in self.orders):
+            raise MockError(400, 'Duplicate clOrdID')
+        qty = params.get('orderQty', params.get('simpleOrderQty'))
+        if qty is None and 'Close' not in params.get('execInst', ''):
+            raise MockError(400, 'Invalid orderQty')
+        if params.get('side') not in ('Buy', 'Sell', None) or (params.get('side') is None and qty is not None):
+            raise MockError(400, 'Invalid side')
+
+    def new_order(self, params):
+        self.validate(params)
+        return self.place(params)
+
+    def new_bulk(self, params):
+        orders = params['orders']
+        orders = json.loads(orders) if isinstance(orders, str) else orders
+        # whole batch is rejected if any order is invalid
+        for order in orders:
+            self.validate(order)
+        if len({o['clOrdID'] for o in orders if o.get('clOrdID')}) != len([o for o in orders if o.get('clOrdID')]):
+            raise MockError(400, 'Duplicate clOrdID')
+        return [self.place(order) for order in orders]
+
+    def place(self, params):
+        execInst = params.get('execInst', '')
+        qty = params.get('orderQty', params.get('simpleOrderQty'))
+        side = params.get('side')
+        if qty is None:
+            # close whole position
+            qty, side = abs(self.contracts), side or ('Sell' if self.contracts > 0 else 'Buy')
+        if 'simpleOrderQty' in params:
+            # simpleOrderQty is in XBT, contracts are USD
+            qty = qty * self.price
+        ordType = params.get('ordType') or ('Stop' if params.get('stopPx') is not None else
+                                            'Limit' if params.get('price') is not None else 'Market')
+        order = {
+            'orderID': str(uuid.uuid4()), 'clOrdID': params.get('clOrdID', ''), 'symbol': self.symbol,
+            'side': side, 'orderQty': int(qty), 'price': params.get('price'), 'stopPx': params.get('stopPx'),
+            'ordType': ordType, 'execInst': execInst, 'ordStatus': 'New', 'leavesQty': int(qty), 'cumQty': 0,
+            'avgPx': None, 'timestamp': isoformat(time.time()),
+        }
+        self.orders.append(order)
+        self.match(order)
+        return dict(order)
+
+    def match(self, order):
+        sign = 1 if order['side'] == 'Buy' else -1
+        if order['ordType'] == 'Stop':
+            if (self.price - order['stopPx']) * sign < 0:
+                return
+        elif order['ordType'] == 'Limit' and (order['price'] - self.price) * sign < 0:
+            return
+
+        qty = order['leavesQty']
+        if 'Close' in order['execInst'] or 'ReduceOnly' in order['execInst']:
+            qty = min(qty, abs(self.contracts)) if self.contracts * sign < 0 else 0
+        if qty == 0:
+            order['ordStatus'], order['leavesQty'] = 'Canceled', 0
+            return
+        price = order['price'] if order['ordType'] == 'Limit' else self.price
+        self.fill(sign * qty, price)
+        order.update({'ordStatus': 'Filled', 'cumQty': qty, 'leavesQty': 0, 'avgPx': price})
+
+    def fill(self, qty, price):
+        if self.contracts * qty < 0:
+            closed = min(abs(qty), abs(self.contracts)) * (1 if self.contracts > 0 else -1)
+            self.wallet += int(round(closed * (1 / self.entry_price - 1 / price) * SATOSHI))
+            self.contracts -= closed
+            qty += closed
+            if self.contracts == 0:
+                self.entry_price = 0.
+        if qty != 0:
+            total = self.contracts + qty
+            # average entry of inverse contracts is harmonic
+            self.entry_price = total / (self.contracts / self.entry_price + qty / price) if self.contracts else price
+            self.contracts = total
+
+    def set_price(self, price):
+        """Moves market, resting limit and stop orders which are crossed get filled"""
+        with self.lock:
+            self.price = price
+            for order in self.orders:
+                if order['ordStatus'] == 'New':
+                    self.match(order)
+
+    def unrealised_pnl(self):
+        if self.contracts == 0:
+            return 0
+        return int(round(self.contracts * (1 / self.entry_price - 1 / self.price) * SATOSHI))
+
+    def position(self):
+        return {'symbol': self.symbol, 'currentQty': self.contracts, 'avgEntryPrice': self.entry_price or None,
+                'leverage': self.leverage, 'markPrice': self.price, 'unrealisedPnl': self.unrealised_pnl(),
+                'isOpen': self.contracts != 0}
+
+    def get_orders(self, params):
+        orders = self.orders
+        filter_ = json.loads(params['filter']) if isinstance(params.get('filter'), str) else params.get('filter')
+        for key, value in (filter_ or {}).items():
+            if key == 'open':
+                orders = [o for o in orders if (o['ordStatus'] == 'New') == bool(value)]
+            else:
+                values = value if isinstance(value, list) else [value]
+                orders = [o for o in orders if o.get(key) in values]
+        if str(params.get('reverse', 'false')).lower() == 'true':
+            orders = orders[::-1]
+        return [dict(o) for o in orders[:int(params.get('count', 100))]]
+
+    def cancel(self, params):
+        ids = params.get('orderID') or []
+        ids = json.loads(ids) if isinstance(ids, str) and ids.startswith('[') else ids
+        ids = ids if isinstance(ids, list) else [ids]
+        canceled = []
+        for order in self.orders:
+            if order['orderID'] in ids and order['ordStatus'] == 'New':
+                order['ordStatus'], order['leavesQty'] = 'Canceled', 0
+                canceled.append(dict(order))
+        return canceled
@@ -0,0 +1,185 @@
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+try:
+    from skopt import Optimizer
+except ImportError:
+    Optimizer = None
+
+from Functions.backtest import backtest, summary
+from Functions.indicators import IndicatorCache
+
+COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# metrics used for ranking and whether larger is better
+METRICS = {'return': True, 'max_drawdown': False, 'sharpe': True}
+
+# state of worker process, set once by attach()
+_worker = {}
+
+
+def grid(space):
+    """All combinations of parameter values, space is {param: list of values}"""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_samples(space, n, seed=None):
+    """
+            n random parameter sets. Lists are sampled as choices, (low, high) tuples as uniform
+            ranges, integer if both bounds are integers.
+            """
+    random = np.random.RandomState(seed)
+    samples = []
+    for _ in range(n):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    params[name] = int(random.randint(low, high + 1))
+                else:
+                    params[name] = float(random.uniform(low, high))
+            else:
+                params[name] = values[random.randint(len(values))]
+        samples.append(params)
+    return samples
+
+
+class SharedCandles():
+    """
+            OHLCV history in shared memory, workers map it instead of receiving pickled copy with every task.
+            Creator owns the segment and has to close() it.
+            """
+
+    def __init__(self, candles):
+        values = np.ascontiguousarray(candles[COLUMNS].to_numpy(dtype=float))
+        index = pd.DatetimeIndex(candles.index).values.astype('datetime64[ns]').view('int64')
+        self.shape = values.shape
+        self.memory = shared_memory.SharedMemory(create=True, size=max(values.nbytes + index.nbytes, 1))
+        np.ndarray(values.shape, dtype=float, buffer=self.memory.buf)[:] = values
+        np.ndarray(index.shape, dtype='int64', buffer=self.memory.buf, offset=values.nbytes)[:] = index
+        self.tz = str(candles.index.tz) if getattr(candles.index, 'tz', None) is not None else None
+
+    def descriptor(self):
+        return self.memory.name, self.shape, self.tz
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+    @staticmethod
+    def attach(name, shape, tz):
+        """Dataframe over shared segment, returns (dataframe, segment) and segment must be kept alive"""
+        memory = shared_memory.SharedMemory(name=name)
+        values = np.ndarray(shape, dtype=float, buffer=memory.buf)
+        index = np.ndarray((shape[0],), dtype='int64', buffer=memory.buf, offset=values.nbytes)
+        index = pd.DatetimeIndex(index.view('datetime64[ns]'))
+        if tz is not None:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        return pd.DataFrame(values, index=index, columns=COLUMNS, copy=False), memory
+
+
+def attach(descriptor, cache_size):
+    candles, memory = SharedCandles.attach(*descriptor)
+    _worker['candles'] = candles
+    _worker['memory'] = memory
+    _worker['cache'] = IndicatorCache(cache_size)
+
+
+def evaluate(strategy_class, strategy_params, params, backtest_params, candles=None, cache=None):
+    """Backtest of one parameter set, candles and cache of worker process are used if not passed"""
+    candles = _worker['candles'] if candles is None else candles
+    cache = _worker['cache'] if cache is None else cache
+
+    strategy = strategy_class(logger=logging.getLogger('optimize'), **strategy_params, **params)
+    strategy.cache = cache
+    started = time.time()
+    equity, trades = backtest(strategy, candles, **backtest_params)
+    result = dict(params)
+    result.update(summary(equity, trades))
+    result['time'] = time.time() - started
+    result['cache_hit_rate'] = cache.hit_rate()
+    return result
+
+
+def rank(results):
+    """
+            Results ordered by mean of their ranks by return, max drawdown and Sharpe ratio
+
+            :param results: list of dicts of params and summary() metrics
+            :return: dataframe, best first
+            """
+    df = pd.DataFrame(results)
+    if len(df) == 0:
+        return df
+    ranks = [df[metric].rank(ascending=not larger) for metric, larger in METRICS.items()]
+    df['rank'] = pd.concat(ranks, axis=1).mean(axis=1)
+    return df.sort_values(['rank', 'return'], ascending=[True, False]).reset_index(drop=True)
+
+
+def sweep(strategy_class, candles, space, method='grid', samples=100, strategy_params=None, backtest_params=None,
+          workers=None, cache_size=256, seed=None):
+    """
+            Backtests strategy over parameter space in process pool
+
+            Candles are put to shared memory once, every worker keeps its own IndicatorCache, so
+            indicators shared by parameter sets (e.g. RSI of one period) are computed once per worker.
+
+            :param strategy_class: e.g. Strategies.strategy_fast_rsi.strategy_fast_rsi
+            :param candles: OHLCV dataframe in strategy timeperiod
+            :param space: {param: list of values} or (low, high) ranges for 'random' and 'bayesian'
+            :param method: 'grid', 'random' or 'bayesian' (needs scikit-optimize)
+            :param samples: number of parameter sets for 'random' and 'bayesian'
+            :param strategy_params: fixed strategy constructor params, timeperiod defaults to '1h'
+            :param backtest_params: passed to Functions.backtest.backtest
+            :param workers: processes, defaults to number of CPUs
+            :param cache_size: indicator arrays kept by every worker
+            :param seed:
+            :return: ranked dataframe, see rank()
+            """
+    strategy_params = dict({'timeperiod': '1h'}, **(strategy_params or {}))
+    backtest_params = backtest_params or {}
+    workers = workers or os.cpu_count()
+
+    shared = SharedCandles(candles)
+    try:
+        with ProcessPoolExecutor(workers, initializer=attach, initargs=(shared.descriptor(), cache_size)) as pool:
+            def run(parameter_sets):
+                return list(pool.map(evaluate, itertools.repeat(strategy_class), itertools.repeat(strategy_params),
+                                     parameter_sets, itertools.repeat(backtest_params)))
+
+            if method == 'grid':
+                results = run(grid(space))
+            elif method == 'random':
+                results = run(random_samples(space, samples, seed))
+            elif method == 'bayesian':
+                results = bayesian(run, space, samples, workers, seed)
+            else:
+                raise ValueError('Unknown method {}'.format(method))
+    finally:
+        shared.close()
+    return rank(results)
+
+
+def bayesian(run, space, samples, batch, seed=None):
+    """Gaussian process search maximizing return, asks `batch` points at a time to keep pool busy"""
+    if Optimizer is None:
+        raise ImportError('scikit-optimize is needed for bayesian sweep')
+    names = list(space)
+    optimizer = Optimizer([space[name] if isinstance(space[name], tuple) else list(space[name]) for name in names],
+                          random_state=seed)
+    results = []
+    while len(results) < samples:
+        points = optimizer.ask(min(batch, samples - len(results)))
+        evaluated = run([dict(zip(names, point)) for point in points])
+        optimizer.tell(points, [-result['return'] for result in evaluated])
+        results += evaluated
+    return results
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from threading import Thread, Lock
+
+from Functions.logger import create_logger
+
+# order statuses after which no more executions come
+FINAL_STATUSES = ('Filled', 'Canceled', 'Rejected')
+
+# event loop of all gateways, runs in its own thread, started by event_loop()
+_loop = None
+_loop_lock = Lock()
+
+
+def event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, daemon=True).start()
+    return _loop
+
+
+def response_headers(response):
+    headers = getattr(response, 'headers', None)
+    return {key.lower(): value for key, value in headers.items()} if headers else {}
+
+
+def retry_delay(attempt, headers, base=0.5, cap=30.):
+    """
+            Seconds to wait before retry `attempt` (0 based): exponential backoff with full jitter,
+            but not less than `Retry-After` or time left to rate limit reset if no requests remain
+            """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if 'retry-after' in headers:
+        delay = max(delay, float(headers['retry-after']))
+    if headers.get('x-ratelimit-remaining') == '0' and 'x-ratelimit-reset' in headers:
+        delay = max(delay, float(headers['x-ratelimit-reset']) - time.time())
+    return delay
+
+
+class OrderGateway():
+    """
+            Asynchronous order placement of one bitmex account.
+
+            Order and leverage requests run concurrently on shared event loop, blocking swagger calls
+            are done in executor threads. Failed requests are retried with jittered exponential backoff
+            which honors `Retry-After` and `x-ratelimit-*` headers of bitmex, requests wait for rate
+            limit reset when account has no requests left. Orders carry clOrdID, so retry of a request
+            which reached the exchange is detected (duplicate clOrdID) instead of placing order twice.
+
+            Fills come from execution stream of Functions.market_data if it is watched, otherwise from
+            order response. Traders call it synchronously with submit().
+
+            Leverage confirmed by exchange (leverage responses, position rows of REST and of watched
+            feeds) is kept per symbol, Position_updateLeverage is sent only when it changes.
+            """
+
+    gateways = {}
+    gateways_lock = Lock()
+
+    retries = 10
+    # seconds to wait for execution of order which is not filled by response
+    fill_timeout = 2.
+
+    @staticmethod
+    def get(client):
+        """Shared gateway of swagger client (one per account), so rate limit state is shared too"""
+        with OrderGateway.gateways_lock:
+            if id(client) not in OrderGateway.gateways:
+                OrderGateway.gateways[id(client)] = OrderGateway(client)
+            return OrderGateway.gateways[id(client)]
+
+    def __init__(self, client):
+        self.client = client
+        self.logger = create_logger('order_gateway')
+        self.loop = event_loop()
+        # unix time until which account has no requests left
+        self.limited_until = 0
+        # clOrdID: (future resolved with final order row, last execution row)
+        self.pending = {}
+        self.watched = set()
+        # market data feed of symbol, position rows of it are the freshest leverage
+        self.feeds = {}
+        # symbol: leverage confirmed by exchange
+        self.leverages = {}
+        self.leverage_calls = 0
+        self.leverage_calls_saved = 0
+
+    def watch(self, market_data):
+        """Resolve fills from execution stream of market data feed"""
+        if id(market_data) not in self.watched:
+            self.watched.add(id(market_data))
+            self.feeds[market_data.symbol] = market_data
+            market_data.add_execution_listener(self.on_executions)
+
+    def note_position(self, position):
+        """Remember leverage of position row (REST response or stream)"""
+        if position and position.get('symbol') and position.get('leverage') is not None:
+            self.leverages[position['symbol']] = position['leverage']
+
+    def confirmed_leverage(self, symbol):
+        feed = self.feeds.get(symbol)
+        if feed is not None:
+            self.note_position(feed.position())
+        return self.leverages.get(symbol)
+
+    def stats(self):
+        return {'leverage_calls': self.leverage_calls, 'leverage_calls_saved': self.leverage_calls_saved}
+
+    def on_executions(self, executions):
+        # called from websocket thread
+        self.loop.call_soon_threadsafe(self.resolve, executions)
+
+    def resolve(self, executions):
+        for execution in executions:
+            pending = self.pending.get(execution.get('clOrdID'))
+            if pending is None:
+                continue
+            pending[1] = execution
+            if execution.get('ordStatus') in FINAL_STATUSES and not pending[0].done():
+                pending[0].set_result(execution)
+
+    async def call(self, name, request):
+        """
+                Swagger request with retries
+
+                :param name: request name for logs
+                :param request: callable returning swagger future
+                :return: (result, unix time of response)
+                """
+        for attempt in range(OrderGateway.retries):
+            wait = self.limited_until - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result, response = await self.loop.run_in_executor(None, lambda: request().result())
+                self.update_limits(response_headers(response))
+                return result, time.time()
+            except Exception as e:
+                response = getattr(e, 'response', None)
+                status = getattr(response, 'status_code', None)
+                headers = response_headers(response)
+                self.update_limits(headers)
+                # bad request, insufficient balance and so on can't be fixed by retry
+                if status is not None and 400 <= status < 500 and status != 429:
+                    raise
+                delay = retry_delay(attempt, headers)
+                self.logger.info("{} failed ({}), another try in {:.2f}s".format(name, status or repr(e), delay))
+                await asyncio.sleep(delay)
+        raise RuntimeError('{} failed {} times'.format(name, OrderGateway.retries))
+
+    def update_limits(self, headers):
+        if headers.get('x-ratelimit-remaining') == '0' and 'x-ratelimit-reset' in headers:
+            self.limited_until = max(self.limited_until, float(headers['x-ratelimit-reset']))
+
+    async def place(self, orders, resend=True):
+        """
+                Order_new of one order, Order_newBulk of more in one request. Orders carry clOrdID, orders
+                which reached exchange on failed try are looked up instead of resent, the rest of them are
+                sent again once
+                """
+        try:
+            if len(orders) == 1:
+                result, acked_at = await self.call('Order_new', lambda: self.client.Order.Order_new(**orders[0]))
+                return [result], acked_at
+            return await self.call('Order_newBulk', lambda: self.client.Order.Order_newBulk(orders=json.dumps(orders)))
+        except Exception as e:
+            if 'duplicate clordid' not in str(getattr(e, 'swagger_result', None) or e).lower():
+                raise
+            filter_ = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
+            result, acked_at = await self.call('Order_getOrders', lambda: self.client.Order.Order_getOrders(
+                symbol=orders[0]['symbol'], filter=filter_, count=len(orders)))
+            by_id = {order['clOrdID']: order for order in result}
+            missing = [order for order in orders if order['clOrdID'] not in by_id]
+            if missing:
+                ids = ', '.join(order['clOrdID'] for order in missing)
+                if not resend:
+                    raise RuntimeError('Orders {} are duplicate but not found on exchange'.format(ids))
+                self.logger.info("Orders {} not found after duplicate clOrdID, sending them again".format(ids))
+                placed, acked_at = await self.place(missing, resend=False)
+                by_id.update((order['clOrdID'], order) for order in placed)
+            return [by_id[order['clOrdID']] for order in orders], acked_at
+
+    async def wait_fill(self, order):
+        fill, execution = self.pending[order['clOrdID']]
+        # response of market order is usually final already, execution may come before it as well,
+        # without execution stream response is all there is
+        if order.get('ordStatus') in FINAL_STATUSES or not self.watched:
+            return order
+        try:
+            return await asyncio.wait_for(asyncio.shield(fill), OrderGateway.fill_timeout)
+        except asyncio.TimeoutError:
+            return self.pending[order['clOrdID']][1] or order
+
+    async def execute(self, orders, leverage=None):
+        sent_at = time.time()
+        orders = [dict(order, clOrdID=order.get('clOrdID') or uuid.uuid4().hex) for order in orders]
+        symbol = orders[0]['symbol']
+        for order in orders:
+            self.pending[order['clOrdID']] = [self.loop.create_future(), None]
+        try:
+            requests = [self.place(orders)]
+            if leverage is not None and self.confirmed_leverage(symbol) == leverage:
+                self.leverage_calls_saved += 1
+                leverage = None
+            if leverage is not None:
+                self.leverage_calls += 1
+                set_leverage = self.client.Position.Position_updateLeverage
+                requests.append(self.call('Position_updateLeverage',
+                                          lambda: set_leverage(symbol=symbol, leverage=leverage)))
+            placed, *leverage_set = await asyncio.gather(*requests, return_exceptions=True)
+            if isinstance(placed, Exception):
+                raise placed
+            for position in leverage_set:
+                if isinstance(position, Exception):
+                    # state on exchange is unknown now, next order sets leverage again
+                    self.leverages.pop(symbol, None)
+                    self.logger.info("Leverage was not set: {}".format(repr(position)))
+                else:
+                    self.note_position(position[0])
+            results, acked_at = placed
+
+            fills = await asyncio.gather(*(self.wait_fill(result) for result in results))
+            filled_at = time.time()
+        finally:
+            for order in orders:
+                del self.pending[order['clOrdID']]
+
+        results = [dict(result) for result in results]
+        for result, filled in zip(results, fills):
+            for key in ('ordStatus', 'cumQty', 'leavesQty', 'avgPx'):
+                if filled.get(key) is not None:
+                    result[key] = filled[key]
+            result['sentAt'], result['ackedAt'], result['filledAt'] = sent_at, acked_at, filled_at
+        self.logger.info("Orders {}: sent at {:.3f}, acknowledged in {:.3f}s, {} in {:.3f}s".format(
+            ', '.join('{} {}'.format(order['clOrdID'], order.get('side') or order.get('execInst')) for order in orders),
+            sent_at, acked_at - sent_at, '/'.join(str(result.get('ordStatus')) for result in results),
+            filled_at - sent_at))
+        return results
+
+    def submit(self, order, leverage=None):
+        """
+                Places order and sets leverage concurrently, blocks until order is final or fill_timeout passes
+
+                :param order: Order_new params
+                :param leverage: Position_updateLeverage value, None not to change it, request is skipped
+                                 if exchange has this leverage already
+                :return: order row with ordStatus, cumQty, avgPx of latest execution and unix times
+                         sentAt, ackedAt (response) and filledAt
+                """
+        return self.submit_bulk([order], leverage)[0]
+
+    def submit_bulk(self, orders, leverage=None):
+        """
+                Places orders of one symbol in one request (bitmex bulk endpoint), exchange applies them
+                in order, e.g. close of position and entry of the opposite one, or entry with stop and
+                take profit. Leverage is set concurrently as in submit().
+
+                :return: order rows, see submit()
+                """
+        return asyncio.run_coroutine_threadsafe(self.execute(orders, leverage), self.loop).result()
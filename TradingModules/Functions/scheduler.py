@@ -0,0 +1,101 @@
+import time
+import traceback
+from threading import Event, Lock
+
+
+class Scheduler():
+    """
+            Runs jobs right after bar close of their period.
+
+            Deadlines are absolute bar boundaries, so time spent in jobs or oversleeping never shifts
+            following ticks. Waiting is done on a monotonic clock. If bars were missed (jobs took longer
+            than a period) job is run once for the latest closed bar and gets number of skipped bars.
+
+            With `on_events=True` jobs are started by `notify(bar_close)` from market data feed
+            (candle close event) and wall clock is used only as a fallback after `grace` seconds.
+            """
+
+    def __init__(self, logger, delay=0.5, on_events=False, grace=5.0):
+        """
+                :param logger:
+                :param delay: seconds after bar close to wait for exchange to publish the bar (wall clock mode)
+                :param on_events: trigger jobs from notify() instead of wall clock
+                :param grace: seconds to wait for event before falling back to wall clock
+                """
+        self.logger = logger
+        self.delay = delay
+        self.on_events = on_events
+        self.grace = grace
+
+        self.jobs = {}
+        self.next_close = {}
+        self.notified_close = 0
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.stopped = Event()
+
+    def add_job(self, period, job):
+        """
+                :param period: period in seconds
+                :param job: callable(bar_close, missed) where bar_close is unix time of bar close
+                """
+        with self.lock:
+            self.jobs.setdefault(period, []).append(job)
+            self.next_close[period] = (int(time.time()) // period + 1) * period
+
+    def notify(self, bar_close):
+        """Called by market data feed when bar closed at unix time `bar_close` is complete"""
+        with self.lock:
+            self.notified_close = max(self.notified_close, bar_close)
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def due(self, period, now):
+        next_close = self.next_close[period]
+        if self.on_events:
+            return self.notified_close >= next_close or now >= next_close + self.grace
+        return now >= next_close + self.delay
+
+    def run_due(self, now):
+        with self.lock:
+            due = sorted(period for period in self.jobs if self.due(period, now))
+
+        for period in due:
+            if self.on_events:
+                bar_close = max(int(now), self.notified_close) // period * period
+            else:
+                bar_close = int(now - self.delay) // period * period
+            missed = max(bar_close - self.next_close[period], 0) // period
+            self.next_close[period] = bar_close + period
+
+            if missed > 0:
+                self.logger.info("Missed {} bars of {}s period, catching up".format(missed, period))
+
+            for job in self.jobs[period]:
+                try:
+                    job(bar_close, missed)
+                except Exception:
+                    self.logger.info("EXCEPTION: " + traceback.format_exc())
+
+    def time_to_next(self, now):
+        with self.lock:
+            deadlines = [self.next_close[period] + (self.grace if self.on_events else self.delay)
+                         for period in self.jobs]
+        return max(min(deadlines) - now, 0) if deadlines else 1.
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.run_due(time.time())
+
+            # wall clock is used only to find next boundary, Event.wait runs on monotonic clock
+            timeout = self.time_to_next(time.time())
+            started = time.monotonic()
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+            overslept = time.monotonic() - started - timeout
+            if overslept > 0.1:
+                self.logger.info("Scheduler woke up {:.3f}s late".format(overslept))
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from catboost import CatBoostClassifier
+except ImportError:
+    CatBoostClassifier = None
+
+from Functions.data_preparation import make_features, data_percentage_change
+
+TARGET = 'perc_change_sign'
+CHANGE = 'perc_change'
+NOT_FEATURES = [CHANGE, TARGET, 'timestamp']
+
+# feature matrix of worker process, set once by attach()
+_worker = {}
+
+
+def default_model():
+    if CatBoostClassifier is None:
+        raise ImportError('catboost is needed for default model, pass model factory instead')
+    return CatBoostClassifier(verbose=False)
+
+
+class FeatureCache():
+    """
+            Feature matrices on disk keyed by dataset and feature config.
+
+            Every entry is a directory of .npy files (features, target, next bar change, index)
+            written atomically. Readers memory-map them, so folds in worker processes share
+            one copy in page cache instead of getting pickled slices.
+            """
+
+    def __init__(self, cache_dir='./data/features'):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(candles, config):
+        digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode())
+        digest.update(pd.DatetimeIndex(candles.index).values.astype('datetime64[ns]').tobytes())
+        digest.update(np.ascontiguousarray(candles[['open', 'high', 'low', 'close', 'volume']].to_numpy(float)).tobytes())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + '.features')
+
+    def get(self, candles, config):
+        """
+                Feature matrix of candles, computed and stored on first request
+
+                :param candles: OHLCV dataframe with datetime index
+                :param config: make_features() params and 'percentage' to use data_percentage_change()
+                :return: path of cache entry, see load()
+                """
+        path = self.path(self.key(candles, config))
+        if not os.path.exists(path):
+            self.write(path, build_features(candles, config), config)
+        return path
+
+    @staticmethod
+    def write(path, df, config):
+        tmp = '{}.tmp{}'.format(path, os.getpid())
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columns = [column for column in df.columns if column not in NOT_FEATURES]
+        np.save(os.path.join(tmp, 'X.npy'), df[columns].to_numpy(dtype=float))
+        np.save(os.path.join(tmp, 'y.npy'), df[TARGET].to_numpy(dtype=float))
+        np.save(os.path.join(tmp, 'change.npy'), df[CHANGE].to_numpy(dtype=float))
+        np.save(os.path.join(tmp, 'index.npy'), pd.DatetimeIndex(df.index).values.astype('datetime64[ns]'))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'columns': columns, 'config': config}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp, path)
+
+    @staticmethod
+    def load(path):
+        """Memory-mapped (X, y, change, index, columns) of cache entry"""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ('X', 'y', 'change', 'index')]
+        return tuple(arrays) + (meta['columns'],)
+
+
+def build_features(candles, config):
+    """Feature dataframe of OHLCV candles, rows without next bar target are dropped"""
+    df = candles[['open', 'high', 'low', 'close', 'volume']].copy()
+    df = make_features(df, comission_rate=config.get('comission_rate', 0.0), lags=config.get('lags', 3))
+    if config.get('percentage', True):
+        df = data_percentage_change(df)
+    df = df.replace([np.inf, -np.inf], np.nan)
+    return df.dropna()
+
+
+def windows(n, train_size, test_size, step=None):
+    """
+            Walk-forward folds over n rows: train on [start, start + train_size), test on the
+            following test_size rows, then move by step (test_size by default)
+
+            :return: list of (train_start, train_end, test_end)
+            """
+    step = step or test_size
+    return [(start, start + train_size, start + train_size + test_size)
+            for start in range(0, n - train_size - test_size + 1, step)]
+
+
+def attach(path):
+    _worker['data'] = FeatureCache.load(path)
+
+
+def evaluate_fold(model_factory, fold, data=None):
+    """Fits model on train rows of fold and scores its predictions of test rows"""
+    X, y, change, index, columns = _worker['data'] if data is None else data
+    train_start, train_end, test_end = fold
+
+    started = time.time()
+    model = model_factory()
+    model.fit(X[train_start:train_end], y[train_start:train_end])
+    predicted = np.sign(np.asarray(model.predict(X[train_end:test_end]), dtype=float).ravel())
+
+    actual = y[train_end:test_end]
+    # position of predicted sign held for one bar, change is next bar HA close ratio (the target)
+    returns = predicted * np.log(change[train_end:test_end])
+    return {
+        'train_from': pd.Timestamp(index[train_start]), 'test_from': pd.Timestamp(index[train_end]),
+        'test_to': pd.Timestamp(index[test_end - 1]), 'accuracy': float(np.mean(predicted == actual)),
+        'return': float(np.expm1(returns.sum())), 'time': time.time() - started,
+    }
+
+
+def walk_forward(candles, train_size, test_size, step=None, config=None, model=default_model, workers=None,
+                 cache=None):
+    """
+            Walk-forward evaluation of model over feature matrix of candles
+
+            Features are built once per (candles, config) and kept in FeatureCache, every fold only
+            slices rows of memory-mapped matrix. Folds run in process pool.
+
+            :param candles: OHLCV dataframe
+            :param train_size: bars in train window
+            :param test_size: bars in test window
+            :param step: bars between folds, defaults to test_size
+            :param config: feature config, e.g. {'lags': 3, 'comission_rate': 0.0, 'percentage': True}
+            :param model: picklable factory of model with fit() and predict(), catboost by default
+            :param workers: processes, defaults to number of CPUs, 1 runs folds in this process
+            :param cache: FeatureCache, defaults to ./data/features
+            :return: dataframe of fold results
+            """
+    config = config or {}
+    cache = cache or FeatureCache()
+    path = cache.get(candles, config)
+
+    data = FeatureCache.load(path)
+    folds = windows(len(data[0]), train_size, test_size, step)
+
+    if workers == 1:
+        results = [evaluate_fold(model, fold, data) for fold in folds]
+    else:
+        with ProcessPoolExecutor(workers or os.cpu_count(), initializer=attach, initargs=(path,)) as pool:
+            results = list(pool.map(evaluate_fold, [model] * len(folds), folds))
+    return pd.DataFrame(results)
@@ -1,4 +1,69 @@
+from Functions.indicators import SharedIndicator
+
+
+def candles_version(candles):
+    """Identity of candle history good enough for memoization: length and first and last bar"""
+    if len(candles) == 0:
+        return (0, None, None)
+    return (len(candles), candles.index[0], candles.index[-1])
+
+
 class Strategy():
-    def __init__(self, logger, timeperiod):
+
+    # Functions.indicators.SharedIndicators of all bots, set before strategies are built (BotManager does it)
+    shared_indicators = None
+
+    def __init__(self, logger, timeperiod, symbol='XBTUSD'):
         self.logger = logger
-        self.timeperiod = timeperiod
\ No newline at end of file
+        self.timeperiod = timeperiod
+        self.symbol = symbol
+        self.last_bar = None
+        # bar which streaming indicators are being updated with
+        self.version = None
+        # Functions.indicators.IndicatorCache shared with other strategies, None to compute every time
+        self.cache = None
+
+    def new_bars(self, candles):
+        """Candles which were not passed to previous calls"""
+        if self.last_bar is not None:
+            candles = candles[candles.index > self.last_bar]
+        if len(candles) != 0:
+            self.last_bar = candles.index[-1]
+        return candles
+
+    def update_indicators(self, candles):
+        """Feed streaming indicators with new closed bars only, first call seeds them with whole history"""
+        for bar in self.new_bars(candles).itertuples():
+            self.version = bar.Index
+            self.update(bar)
+
+    def update(self, bar):
+        raise NotImplementedError
+
+    def streaming(self, factory, *params, source='close'):
+        """
+                Streaming indicator factory(*params), shared with strategies of other bots if shared_indicators is set
+
+                :param source: what indicator is fed with, indicators of equal class, params, source,
+                               symbol and timeperiod are computed once per bar
+                """
+        if Strategy.shared_indicators is None:
+            return factory(*params)
+        key = (factory.__name__, params, source, self.symbol, self.timeperiod)
+        return SharedIndicator(Strategy.shared_indicators, key, lambda: factory(*params), lambda: self.version)
+
+    def indicator(self, candles, name, compute, *params):
+        """Whole-history indicator array, memoized in self.cache by name, params and candles if cache is set"""
+        if self.cache is None:
+            return compute()
+        return self.cache.get((name, params, candles_version(candles)), compute)
+
+    def signals(self, candles):
+        """
+                Decisions for every bar of history at once, used by Functions.backtest
+
+                :param candles: dataframe of closed bars in strategy timeperiod
+                :return: (decision, exit_long, exit_short) arrays, decision is make_prediction() result
+                         and exits are need_exit() results for long and short position after each bar
+                """
+        raise NotImplementedError
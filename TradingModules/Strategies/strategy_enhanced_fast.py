@@ -1,11 +1,12 @@
 from Functions.data_preparation import *
+from Functions.indicators import RSI, SMA, BodyAverage, bar_color, bar_colors, sma
 from Strategies.base import Strategy
 
 
 class strategy_enhanced_fast(Strategy):
     def __init__(self, logger, timeperiod, rsiperiod = 7, rsilimit = 35, rsibars = 3, openbars = 1,
-                 closebars = 1, openbody = 20, closebody = 50):
-        Strategy.__init__(self, logger=logger, timeperiod=timeperiod)
+                 closebars = 1, openbody = 20, closebody = 50, symbol='XBTUSD'):
+        Strategy.__init__(self, logger=logger, timeperiod=timeperiod, symbol=symbol)
         self.rsiperiod = rsiperiod
         self.rsilimit = rsilimit
         self.rsibars = rsibars
@@ -14,58 +15,60 @@ class strategy_enhanced_fast(Strategy):
         self.openbody = openbody
         self.closebody = closebody
 
-    def make_prediction(self, candles):
-        self.rsi = talib.RSI(candles.close.values, self.rsiperiod)
         self.uplimit = 100 - self.rsilimit
         self.dnlimit = self.rsilimit
 
-        rsidn = np.array(self.rsi < self.dnlimit, dtype=float)
-        rsiup = np.array(self.rsi > self.uplimit, dtype=float)
-        if self.rsibars > 1:
-            rsidnok = talib.SMA(rsidn, self.rsibars) == 1
-            rsiupok = talib.SMA(rsiup, self.rsibars) == 1
-        else:
-            rsidnok = rsidn == 1
-            rsiupok = rsiup == 1
+        self.rsi = self.streaming(RSI, rsiperiod)
+        self.body_average = self.streaming(BodyAverage, 10, source='body')
 
-        body = np.abs(candles.close.values - candles.open.values)
-        abody = talib.SMA(body, 10)
+        # share of last N bars meeting the condition, 1 means all of them
+        self.rsidn = self.streaming(SMA, rsibars, source=('rsi below', rsiperiod, self.dnlimit))
+        self.rsiup = self.streaming(SMA, rsibars, source=('rsi above', rsiperiod, self.uplimit))
+        self.opengbar = self.streaming(SMA, openbars, source='green')
+        self.openrbar = self.streaming(SMA, openbars, source='red')
+        self.closegbar = self.streaming(SMA, closebars, source='green')
+        self.closerbar = self.streaming(SMA, closebars, source='red')
 
-        self.openbodyok = body >= abody / 100 * self.openbody
-        self.closebodyok = body >= abody / 100 * self.closebody
+    def update(self, bar):
+        rsi = self.rsi.update(bar.close)
+        self.rsidn.update(float(rsi < self.dnlimit))
+        self.rsiup.update(float(rsi > self.uplimit))
 
-        bar = np.zeros_like(candles.close.values)
+        self.body_average.update(bar.open, bar.close)
 
-        bar[candles.close.values > candles.open.values] = 1
-        bar[np.logical_and(candles.close.values <= candles.open.values,
-                           candles.close.values < candles.open.values)] = -1
-        bar[np.logical_and(candles.close.values <= candles.open.values,
-                           candles.close.values >= candles.open.values)] = 0
+        color = bar_color(bar.open, bar.close)
+        gbar = float(color == 1)
+        rbar = float(color == -1)
+        self.opengbar.update(gbar)
+        self.openrbar.update(rbar)
+        self.closegbar.update(gbar)
+        self.closerbar.update(rbar)
 
-        gbar = np.array(bar == 1, dtype=float)
-        rbar = np.array(bar == -1, dtype=float)
+    def make_prediction(self, candles):
+        self.update_indicators(candles)
 
-        if self.openbars > 1:
-            self.opengbarok = talib.SMA(gbar, self.openbars) == 1
-            self.openrbarok = talib.SMA(rbar, self.openbars) == 1
-        else:
-            self.opengbarok = gbar == 1
-            self.openrbarok = rbar == 1
+        rsidnok = self.rsidn.value == 1
+        rsiupok = self.rsiup.value == 1
 
-        if self.closebars > 1:
-            self.closegbarok = talib.SMA(gbar, self.closebars) == 1
-            self.closerbarok = talib.SMA(rbar, self.closebars) == 1
-        else:
-            self.closegbarok = gbar == 1
-            self.closerbarok = rbar == 1
+        body = self.body_average.body
+        abody = self.body_average.value
 
-        up = np.logical_and(np.logical_and(self.openrbarok, rsidnok), self.openbodyok)
-        dn = np.logical_and(np.logical_and(self.opengbarok, rsiupok), self.openbodyok)
+        self.openbodyok = body >= abody / 100 * self.openbody
+        self.closebodyok = body >= abody / 100 * self.closebody
+
+        self.opengbarok = self.opengbar.value == 1
+        self.openrbarok = self.openrbar.value == 1
 
-        if up[-1]:
+        self.closegbarok = self.closegbar.value == 1
+        self.closerbarok = self.closerbar.value == 1
+
+        up = self.openrbarok and rsidnok and self.openbodyok
+        dn = self.opengbarok and rsiupok and self.openbodyok
+
+        if up:
             self.logger.info("Need long:")
             return 1
-        if dn[-1]:
+        if dn:
             self.logger.info("Need short:")
             return -1
         else:
@@ -73,9 +76,39 @@ class strategy_enhanced_fast(Strategy):
             return 0
 
     def need_exit(self, position_size):
-        norma = (self.rsi[-1] > self.dnlimit and self.rsi[-1] < self.uplimit)
-        exit = ((position_size > 0 and self.closegbarok[-1] and norma) or (
-        position_size < 0 and self.closerbarok[-1] and norma)) and self.closebodyok[-1]
+        norma = (self.rsi.value > self.dnlimit and self.rsi.value < self.uplimit)
+        exit = ((position_size > 0 and self.closegbarok and norma) or (
+        position_size < 0 and self.closerbarok and norma)) and self.closebodyok
         return exit
 
-
+    def signals(self, candles):
+        _open = candles.open.values.astype(float)
+        close = candles.close.values.astype(float)
+
+        rsi = self.indicator(candles, 'rsi', lambda: talib.RSI(close, self.rsiperiod), self.rsiperiod)
+        bar = bar_colors(_open, close)
+        body = np.abs(close - _open)
+        abody = self.indicator(candles, 'body_sma', lambda: sma(body, 10), 10)
+        gbar = (bar == 1).astype(float)
+        rbar = (bar == -1).astype(float)
+
+        with np.errstate(invalid='ignore'):
+            rsidnok = sma(rsi < self.dnlimit, self.rsibars) == 1
+            rsiupok = sma(rsi > self.uplimit, self.rsibars) == 1
+
+            openbodyok = body >= abody / 100 * self.openbody
+            closebodyok = body >= abody / 100 * self.closebody
+
+            norma = (rsi > self.dnlimit) & (rsi < self.uplimit)
+
+        red_run = self.indicator(candles, 'red_run', lambda: sma(rbar, self.openbars), self.openbars)
+        green_run = self.indicator(candles, 'green_run', lambda: sma(gbar, self.openbars), self.openbars)
+        up = (red_run == 1) & rsidnok & openbodyok
+        dn = (green_run == 1) & rsiupok & openbodyok
+
+        decision = np.where(up, 1, np.where(dn, -1, 0))
+        green_run = self.indicator(candles, 'green_run', lambda: sma(gbar, self.closebars), self.closebars)
+        red_run = self.indicator(candles, 'red_run', lambda: sma(rbar, self.closebars), self.closebars)
+        exit_long = (green_run == 1) & norma & closebodyok
+        exit_short = (red_run == 1) & norma & closebodyok
+        return decision, exit_long, exit_short
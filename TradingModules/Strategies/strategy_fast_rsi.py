@@ -1,21 +1,35 @@
 from Functions.data_preparation import *
+from Functions.indicators import RSI, BodyAverage, bar_color, bar_colors, sma
 from Strategies.base import Strategy
 
 class strategy_fast_rsi(Strategy):
 
-    def __init__(self, logger, timeperiod, rsiperiod1=9, rsilimit1=19, rsiperiod2=14, rsilimit2=22):
-        Strategy.__init__(self, logger=logger, timeperiod=timeperiod)
+    def __init__(self, logger, timeperiod, rsiperiod1=9, rsilimit1=19, rsiperiod2=14, rsilimit2=22, symbol='XBTUSD'):
+        Strategy.__init__(self, logger=logger, timeperiod=timeperiod, symbol=symbol)
         self.rsiperiod1 = rsiperiod1
         self.rsilimit1 = rsilimit1
         self.rsiperiod2 = rsiperiod2
         self.rsilimit2 = rsilimit2
 
+        self.rsi1 = self.streaming(RSI, rsiperiod1)
+        self.rsi2 = self.streaming(RSI, rsiperiod2)
+        self.body_average = self.streaming(BodyAverage, 10, source='body')
+        self.bar = 0
+
+    def update(self, bar):
+        self.rsi1.update(bar.close)
+        self.rsi2.update(bar.close)
+        self.body_average.update(bar.open, bar.close)
+        self.bar = bar_color(bar.open, bar.close)
+
     def make_prediction(self, candles):
 
         #candles = resample(candles, self.timeperiod)
 
-        rsi1 = talib.RSI(candles.close.values, self.rsiperiod1)
-        rsi2 = talib.RSI(candles.close.values, self.rsiperiod2)
+        self.update_indicators(candles)
+
+        rsi1 = self.rsi1.value
+        rsi2 = self.rsi2.value
 
         uplimit1 = 100 - self.rsilimit1
         dnlimit1 = self.rsilimit1
@@ -23,38 +37,26 @@ class strategy_fast_rsi(Strategy):
         uplimit2 = 100 - self.rsilimit2
         dnlimit2 = self.rsilimit2
 
-        self.body = np.abs(candles.close.values - candles.open.values)
-        self.abody = talib.SMA(self.body, 10)
-
-        self.bar = np.zeros_like(candles.close.values)
-
-        self.bar[candles.close.values > candles.open.values] = 1
-        self.bar[np.logical_and(candles.close.values <= candles.open.values, candles.close.values < candles.open.values)] = -1
-        self.bar[np.logical_and(candles.close.values <= candles.open.values, candles.close.values >= candles.open.values)] = 0
+        self.body = self.body_average.body
+        self.abody = self.body_average.value
 
-        up1 = np.logical_and(np.logical_and(self.bar == -1, rsi1 < dnlimit1),
-                            (self.body > self.abody / 5))
+        up1 = self.bar == -1 and rsi1 < dnlimit1 and self.body > self.abody / 5
 
-        dn1 = np.logical_and(np.logical_and(self.bar == 1, rsi1 > uplimit1),
-                            (self.body > self.abody / 5))
+        dn1 = self.bar == 1 and rsi1 > uplimit1 and self.body > self.abody / 5
 
-        up2 = np.logical_and(np.logical_and(self.bar == -1, rsi2 < dnlimit2),
-                            (self.body > self.abody / 5))
+        up2 = self.bar == -1 and rsi2 < dnlimit2 and self.body > self.abody / 5
 
-        dn2 = np.logical_and(np.logical_and(self.bar == 1, rsi2 > uplimit2),
-                            (self.body > self.abody / 5))
+        dn2 = self.bar == 1 and rsi2 > uplimit2 and self.body > self.abody / 5
 
-        self.norma = np.logical_and(np.logical_and(np.logical_and(rsi1 > dnlimit1, rsi1 < uplimit1),
-                                                   rsi2 > dnlimit2),
-                                    rsi2 < uplimit2)
+        self.norma = dnlimit1 < rsi1 < uplimit1 and dnlimit2 < rsi2 < uplimit2
 
-        self.needup = np.logical_or(up1, up2)
-        self.needdn = np.logical_or(dn1, dn2)
+        self.needup = up1 or up2
+        self.needdn = dn1 or dn2
 
-        if self.needup[-1]:
+        if self.needup:
             self.logger.info("Need long:")
             return 1
-        if self.needdn[-1]:
+        if self.needdn:
             self.logger.info("Need short:")
             return -1
         else:
@@ -62,8 +64,39 @@ class strategy_fast_rsi(Strategy):
             return 0
 
     def need_exit(self, position_size):
-        return (((position_size > 0 and self.bar[-1] == 1 and self.norma[-1]) or
-               (position_size < 0 and self.bar[-1] == -1 and self.norma[-1])) and
-                self.body[-1] > self.abody[-1] / 2)
+        return (((position_size > 0 and self.bar == 1 and self.norma) or
+               (position_size < 0 and self.bar == -1 and self.norma)) and
+                self.body > self.abody / 2)
+
+
+
+    def signals(self, candles):
+        _open = candles.open.values.astype(float)
+        close = candles.close.values.astype(float)
+
+        rsi1 = self.indicator(candles, 'rsi', lambda: talib.RSI(close, self.rsiperiod1), self.rsiperiod1)
+        rsi2 = self.indicator(candles, 'rsi', lambda: talib.RSI(close, self.rsiperiod2), self.rsiperiod2)
+
+        uplimit1 = 100 - self.rsilimit1
+        dnlimit1 = self.rsilimit1
+
+        uplimit2 = 100 - self.rsilimit2
+        dnlimit2 = self.rsilimit2
+
+        bar = bar_colors(_open, close)
+        body = np.abs(close - _open)
+        abody = self.indicator(candles, 'body_sma', lambda: sma(body, 10), 10)
+
+        with np.errstate(invalid='ignore'):
+            up1 = (bar == -1) & (rsi1 < dnlimit1) & (body > abody / 5)
+            dn1 = (bar == 1) & (rsi1 > uplimit1) & (body > abody / 5)
+            up2 = (bar == -1) & (rsi2 < dnlimit2) & (body > abody / 5)
+            dn2 = (bar == 1) & (rsi2 > uplimit2) & (body > abody / 5)
 
+            norma = (dnlimit1 < rsi1) & (rsi1 < uplimit1) & (dnlimit2 < rsi2) & (rsi2 < uplimit2)
+            exit_body = body > abody / 2
 
+        decision = np.where(up1 | up2, 1, np.where(dn1 | dn2, -1, 0))
+        exit_long = (bar == 1) & norma & exit_body
+        exit_short = (bar == -1) & norma & exit_body
+        return decision, exit_long, exit_short
@@ -1,11 +1,14 @@
+from collections import deque
+
 from Functions.data_preparation import *
+from Functions.indicators import SMA, RollingMax, RollingMin, BodyAverage, bar_color, bar_colors, sma
 from Strategies.base import Strategy
 
 class strategy_mas_extreme(Strategy):
 
     def __init__(self, logger, timeperiod, fastlen=5, slowlen=22, bars=2, openbars = 1,
-                 closebars = 1, openbody = 20, closebody = 50):
-        Strategy.__init__(self, logger=logger, timeperiod=timeperiod)
+                 closebars = 1, openbody = 20, closebody = 50, symbol='XBTUSD'):
+        Strategy.__init__(self, logger=logger, timeperiod=timeperiod, symbol=symbol)
         self.fastlen = fastlen
         self.slowlen = slowlen
         self.bars = bars
@@ -16,55 +19,77 @@ class strategy_mas_extreme(Strategy):
         self.openbody = openbody
         self.closebody = closebody
 
+        self.lasthigh = self.streaming(RollingMax, slowlen)
+        self.lastlow = self.streaming(RollingMin, slowlen)
+        self.lasthigh2 = self.streaming(RollingMax, fastlen)
+        self.lastlow2 = self.streaming(RollingMin, fastlen)
+        self.body_average = self.streaming(BodyAverage, 10, source='body')
+
+        self.opengbar = self.streaming(SMA, openbars, source='green')
+        self.openrbar = self.streaming(SMA, openbars, source='red')
+        self.closegbar = self.streaming(SMA, closebars, source='green')
+        self.closerbar = self.streaming(SMA, closebars, source='red')
+
+        # last values needed by the trend and bar count filters
+        self.center = deque([np.nan] * 2, maxlen=2)
+        self.low = deque([np.nan] * 2, maxlen=2)
+        self.high = deque([np.nan] * 2, maxlen=2)
+        self.bar = deque([0] * 3, maxlen=3)
+        self.center2 = np.nan
+
+    def update(self, bar):
+        lasthigh = self.lasthigh.update(bar.close)
+        lastlow = self.lastlow.update(bar.close)
+        self.center.append((lasthigh + lastlow) / 2)
+
+        lasthigh2 = self.lasthigh2.update(bar.close)
+        lastlow2 = self.lastlow2.update(bar.close)
+        self.center2 = (lasthigh2 + lastlow2) / 2
+
+        self.low.append(bar.low)
+        self.high.append(bar.high)
+
+        self.body_average.update(bar.open, bar.close)
+
+        color = bar_color(bar.open, bar.close)
+        self.bar.append(color)
+        gbar = float(color == 1)
+        rbar = float(color == -1)
+        self.opengbar.update(gbar)
+        self.openrbar.update(rbar)
+        self.closegbar.update(gbar)
+        self.closerbar.update(rbar)
+
     def make_prediction(self, candles):
 
         #candles = resample(candles, self.timeperiod)
 
-        lasthigh = candles.rolling(self.slowlen)['close'].max()
-        lastlow = candles.rolling(self.slowlen)['close'].min()
-        center = (lasthigh + lastlow) / 2
+        self.update_indicators(candles)
 
-        lasthigh2 = candles.rolling(self.fastlen)['close'].max()
-        lastlow2 = candles.rolling(self.fastlen)['close'].min()
-        center2 = (lasthigh2 + lastlow2) / 2
+        center = self.center
+        center2 = self.center2
+        low = self.low
+        high = self.high
+        bar = self.bar
 
-        trend = 1 if candles.low.values[-1] > center.values[-1] and candles.low.values[-2] > center.values[-2] \
-            else -1 if candles.high.values[-1] < center.values[-1] and candles.high.values[-2] < center.values[-2] \
+        trend = 1 if low[-1] > center[-1] and low[-2] > center[-2] \
+            else -1 if high[-1] < center[-1] and high[-2] < center[-2] \
             else self.prev_trend
 
         self.prev_trend = trend
 
-        bar = np.zeros_like(candles.close.values)
-
-        bar[candles.close.values > candles.open.values] = 1
-        bar[np.logical_and(candles.close.values <= candles.open.values,
-                           candles.close.values < candles.open.values)] = -1
-        bar[np.logical_and(candles.close.values <= candles.open.values,
-                           candles.close.values >= candles.open.values)] = 0
-
         #filters
-        body = np.abs(candles.close.values - candles.open.values)
-        abody = talib.SMA(body, 10)
+        body = self.body_average.body
+        abody = self.body_average.value
 
         self.openbodyok = body >= abody / 100 * self.openbody
         self.closebodyok = body >= abody / 100 * self.closebody
 
-        gbar = np.array(bar == 1, dtype=float)
-        rbar = np.array(bar == -1, dtype=float)
+        self.opengbarok = self.opengbar.value == 1
+        self.openrbarok = self.openrbar.value == 1
 
-        if self.openbars > 1:
-            self.opengbarok = talib.SMA(gbar, self.openbars) == 1
-            self.openrbarok = talib.SMA(rbar, self.openbars) == 1
-        else:
-            self.opengbarok = gbar == 1
-            self.openrbarok = rbar == 1
-
-        if self.closebars > 1:
-            self.closegbarok = talib.SMA(gbar, self.closebars) == 1
-            self.closerbarok = talib.SMA(rbar, self.closebars) == 1
-        else:
-            self.closegbarok = gbar == 1
-            self.closerbarok = rbar == 1
+        self.closegbarok = self.closegbar.value == 1
+        self.closerbarok = self.closerbar.value == 1
 
         if self.bars == 0:
             redbars = 1
@@ -88,15 +113,15 @@ class strategy_mas_extreme(Strategy):
         else:
             greenbars = 0
 
-        up = 1 if trend == 1 and (candles.low.values[-1] < center2.values[-1]) \
-                  and (redbars == 1) and self.openbodyok[-1] and self.openrbarok[-1] else 0
-        dn = 1 if trend == -1 and (candles.high.values[-1] > center2.values[-1]) \
-                  and (greenbars == 1) and self.openbodyok[-1] and self.opengbarok[-1] else 0
+        up = 1 if trend == 1 and (low[-1] < center2) \
+                  and (redbars == 1) and self.openbodyok and self.openrbarok else 0
+        dn = 1 if trend == -1 and (high[-1] > center2) \
+                  and (greenbars == 1) and self.openbodyok and self.opengbarok else 0
 
-        up2 = 1 if candles.high.values[-1] < center.values[-1] and candles.high.values[-1] < center2.values[-1] \
-                   and bar[-1] == -1 and self.openbodyok[-1] and self.openrbarok[-1] else 0
-        dn2 = 0 if candles.low.values[-1] > center.values[-1] and candles.low.values[-1] > center2.values[-1] \
-                   and bar[-1] == 1 and self.openbodyok[-1] and self.opengbarok[-1] else 0
+        up2 = 1 if high[-1] < center[-1] and high[-1] < center2 \
+                   and bar[-1] == -1 and self.openbodyok and self.openrbarok else 0
+        dn2 = 0 if low[-1] > center[-1] and low[-1] > center2 \
+                   and bar[-1] == 1 and self.openbodyok and self.opengbarok else 0
 
         if up == 1 or up2 == 1:
             self.logger.info("Need long:")
@@ -108,4 +133,55 @@ class strategy_mas_extreme(Strategy):
             self.logger.info("Do nothing")
             return 0
 
+    def signals(self, candles):
+        _open = candles.open.values.astype(float)
+        close = candles.close.values.astype(float)
+        low = candles.low.values.astype(float)
+        high = candles.high.values.astype(float)
+
+        def channel_center(period):
+            return ((candles.close.rolling(period).max() + candles.close.rolling(period).min()) / 2).values
+
+        center = self.indicator(candles, 'channel_center', lambda: channel_center(self.slowlen), self.slowlen)
+        center2 = self.indicator(candles, 'channel_center', lambda: channel_center(self.fastlen), self.fastlen)
+
+        def previous(values, fill):
+            return np.r_[fill, values[:-1]]
+
+        with np.errstate(invalid='ignore'):
+            trend_up = (low > center) & (previous(low, np.nan) > previous(center, np.nan))
+            trend_dn = (high < center) & (previous(high, np.nan) < previous(center, np.nan))
+        # trend keeps previous value until one of conditions is met, as prev_trend does
+        trend = pd.Series(np.where(trend_up, 1., np.where(trend_dn, -1., np.nan))).ffill().fillna(0).values
+
+        bar = bar_colors(_open, close)
+        body = np.abs(close - _open)
+        abody = self.indicator(candles, 'body_sma', lambda: sma(body, 10), 10)
+        gbar = (bar == 1).astype(float)
+        rbar = (bar == -1).astype(float)
+
+        with np.errstate(invalid='ignore'):
+            openbodyok = body >= abody / 100 * self.openbody
+        openrbarok = self.indicator(candles, 'red_run', lambda: sma(rbar, self.openbars), self.openbars) == 1
+        opengbarok = self.indicator(candles, 'green_run', lambda: sma(gbar, self.openbars), self.openbars) == 1
+
+        if self.bars <= 3:
+            redbars = np.ones(len(bar), dtype=bool)
+            greenbars = np.ones(len(bar), dtype=bool)
+            shifted = bar
+            for _ in range(self.bars):
+                redbars &= shifted == -1
+                greenbars &= shifted == 1
+                shifted = previous(shifted, 0)
+        else:
+            redbars = greenbars = np.zeros(len(bar), dtype=bool)
+
+        with np.errstate(invalid='ignore'):
+            up = (trend == 1) & (low < center2) & redbars & openbodyok & openrbarok
+            dn = (trend == -1) & (high > center2) & greenbars & openbodyok & opengbarok
+            up2 = (high < center) & (high < center2) & (bar == -1) & openbodyok & openrbarok
 
+        decision = np.where(up | up2, 1, np.where(dn, -1, 0))
+        # trader_mas_extreme does not use exits
+        no_exit = np.zeros(len(bar), dtype=bool)
+        return decision, no_exit, no_exit
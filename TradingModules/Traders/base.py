@@ -1,15 +1,18 @@
-import bitmex
 import time
-import ccxt
 import os
 import pandas as pd
 import json
 
+from Functions.clients import get_bitmex_client, get_ccxt_client
+from Functions.candle_store import ccxt_symbol
+from Functions.order_gateway import OrderGateway
+
 class Trader():
 
     def __init__(self, logger, strategy, bitmex_params, leverage, symbol, num_of_positions,
                  max_num_of_positions, trade_market, deposit_percent, new_trade_to_average_percent, simpleOrderQty=True):
-        self.client = bitmex.bitmex(**bitmex_params)
+        self.client = get_bitmex_client(**bitmex_params)
+        self.gateway = OrderGateway.get(self.client)
         self.strategy = strategy
         self.logger = logger
 
@@ -35,6 +38,15 @@ class Trader():
         self.executed_prices = []
         self.executed_qts = []
 
+        # unix time of the last order request and of its fill, used by BotManager for latency metrics
+        self.order_sent_at = None
+        self.order_filled_at = None
+        # last order placed by gateway, with fill from execution stream
+        self.last_order = None
+
+        # websocket data service (Functions.market_data), REST is used if None or data is not available
+        self.market_data = None
+
     def save_state(self, filename):
         with open('../states/' + filename + '.state', 'w') as f:
             json.dump(self.state_to_dict(), f)
@@ -63,28 +75,49 @@ class Trader():
         self.executed_prices = d['executed_prices']
         self.executed_qts = d['executed_qts']
 
-    def set_tradable_qty(self):
-        total, _ = self.balances_status()
+    def set_tradable_qty(self, closing=False):
+        """
+                :param closing: open position is closed in the same request as the next entry, so balance
+                                after the close (wallet and unrealised PnL of position) is used
+                """
+        if closing:
+            total = self.margin_balance()
+        else:
+            total, _ = self.balances_status()
         self.tradable_qty = float(total*self.deposit_percent*self.leverage)
         self.logger.info(f"New tradable quantity {self.tradable_qty}")
         time.sleep(0.5)
 
     def last_mark_price(self):
+        if self.market_data is not None:
+            price = self.market_data.last_price()
+            if price is not None:
+                return float(price)
         return float(self.client.Trade.Trade_getBucketed(symbol=self.symbol, binSize='1m', partial=True,
                                                          count=1, reverse=True).result()[0][0]['close'])
 
     def update_open_position(self):
+        if self.market_data is not None:
+            qty = self.market_data.position_qty()
+            if qty is not None:
+                self.open_position = int(qty)
+                return
         res = self.client.Position.Position_get().result()
         if len(res[0]) != 0:
             self.open_position = int(res[0][0]['currentQty'])
+            self.gateway.note_position(res[0][0])
         else:
             self.open_position = 0
         time.sleep(0.5)
 
     def get_last_order_info(self):
+        if self.last_order is not None:
+            price = self.last_order.get('avgPx') or self.last_order['price']
+            return self.last_order['orderQty'], price
+
         def get_info():
             result = self.client.Order.Order_getOrders(
-                symbol='XBTUSD', count=1, reverse=True
+                symbol=self.symbol, count=1, reverse=True
             ).result()[0][0]
             return result
 
@@ -106,90 +139,68 @@ class Trader():
                 self.logger.info(Exception)
 
 
-    def buy_market_with_leverage(self, quantity, leverage):
-        def make_order():
-            if self.simpleOrderQty:
-                response = self.client.Order.Order_new(
-                    symbol=self.symbol,
-                    side="Buy",
-                    simpleOrderQty=quantity,
-                ).result()
-            else:
-                response = self.client.Order.Order_new(
-                    symbol=self.symbol,
-                    side="Buy",
-                    orderQty=quantity,
-                ).result()
-            return response
-
-        done = False
-        while not done:
-            try:
-                response = make_order()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to place an order")
-                time.sleep(1)
-                self.logger.info(Exception)
-
-        def leverage_set():
-            response = self.client.Position.Position_updateLeverage(
-                symbol=self.symbol, leverage=leverage
-            ).result()
-            return response
-
-        done = False
-        while not done:
-            try:
-                response = leverage_set()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to set leverage")
-                time.sleep(1)
-                self.logger.info(Exception)
-
-
-    def sell_market_with_leverage(self, quantity, leverage):
-        def make_order():
-            if self.simpleOrderQty:
-                response = self.client.Order.Order_new(
-                    symbol=self.symbol,
-                    side="Sell",
-                    simpleOrderQty=quantity,
-                ).result()
-            else:
-                response = self.client.Order.Order_new(
-                    symbol=self.symbol,
-                    side="Sell",
-                    orderQty=quantity,
-                ).result()
-            return response
-
-        done = False
-        while not done:
-            try:
-                response = make_order()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to place an order")
-                time.sleep(1)
-                self.logger.info(Exception)
-
-        def leverage_set():
-            response = self.client.Position.Position_updateLeverage(
-                symbol=self.symbol, leverage=leverage
-            ).result()
-            return response
-
-        done = False
-        while not done:
-            try:
-                response = leverage_set()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to set leverage")
-                time.sleep(1)
-                self.logger.info(Exception)
+    def new_order(self, side, quantity, price=None):
+        """Order_new params, market order if price is None"""
+        order = {'symbol': self.symbol, 'side': side}
+        if self.simpleOrderQty:
+            order['simpleOrderQty'] = quantity
+        else:
+            order['orderQty'] = quantity
+        if price is not None:
+            order['price'] = price
+        return order
+
+    def place_order(self, side, quantity, leverage=None, price=None, close_first=False):
+        """
+                Places order and sets leverage concurrently through the account gateway
+
+                :param side: "Buy" or "Sell"
+                :param price: limit price, market order if None
+                :param leverage: None not to change leverage
+                :param close_first: close open position in the same request, so reversal is one round trip
+                :return: order with fill of execution stream
+                """
+        orders = [self.new_order(side, quantity, price)]
+        if close_first:
+            orders.insert(0, {'symbol': self.symbol, 'execInst': "Close"})
+        return self.submit(orders, leverage)
+
+    def place_bracket(self, side, quantity, leverage=None, price=None, stop_px=None, take_profit=None,
+                      close_first=False):
+        """
+                Entry with stop loss and take profit which close it, sent in one request
+
+                :param stop_px: last price which triggers market close of position, None for no stop
+                :param take_profit: limit price of reduce-only exit, None for no take profit
+                :return: entry order, see place_order()
+                """
+        exit_side = "Sell" if side == "Buy" else "Buy"
+        orders = [self.new_order(side, quantity, price)]
+        if close_first:
+            orders.insert(0, {'symbol': self.symbol, 'execInst': "Close"})
+        entry = len(orders) - 1
+        if stop_px is not None:
+            orders.append({'symbol': self.symbol, 'side': exit_side, 'ordType': "Stop", 'stopPx': stop_px,
+                           'execInst': "Close,LastPrice"})
+        if take_profit is not None:
+            orders.append(dict(self.new_order(exit_side, quantity, take_profit), execInst="ReduceOnly"))
+        return self.submit(orders, leverage, entry)
+
+    def submit(self, orders, leverage=None, entry=-1):
+        """Orders in one request, orders[entry] is remembered as last order"""
+        if self.market_data is not None:
+            self.gateway.watch(self.market_data)
+        self.order_sent_at = time.time()
+        self.last_order = self.gateway.submit_bulk(orders, leverage)[entry]
+        self.order_sent_at = self.last_order['sentAt']
+        self.order_filled_at = self.last_order['filledAt']
+        return self.last_order
+
+    def buy_market_with_leverage(self, quantity, leverage, close_first=False):
+        self.place_order("Buy", quantity, leverage, close_first=close_first)
+
+    def sell_market_with_leverage(self, quantity, leverage, close_first=False):
+        self.place_order("Sell", quantity, leverage, close_first=close_first)
 
     def balances_status(self):
         wallet_summary = self.client.User.User_getWalletSummary().result()[0]
@@ -205,110 +216,34 @@ class Trader():
 
         return float(total), float(realised_pnl)
 
-    def buy_with_leverage(self, price, quantity, leverage):
-        def make_order():
-            if self.simpleOrderQty:
-                response = self.client.Order.Order_new(
-                    price=price,
-                    symbol=self.symbol,
-                    side="Buy",
-                    simpleOrderQty=quantity,
-                ).result()
-            else:
-                response = self.client.Order.Order_new(
-                    price=price,
-                    symbol=self.symbol,
-                    side="Buy",
-                    orderQty=quantity,
-                ).result()
-            return response
+    def margin_balance(self):
+        """Wallet balance with unrealised PnL, from margin stream if it is watched"""
+        margin = self.market_data.margin() if self.market_data is not None else None
+        if not margin or margin.get('marginBalance') is None:
+            margin = self.client.User.User_getMargin().result()[0]
+        return float(margin['marginBalance'] / 100000000.)
 
+    def buy_with_leverage(self, price, quantity, leverage, close_first=False):
         self.logger.info(f"Buy sell price: {price}")
+        self.place_order("Buy", quantity, leverage, price, close_first)
 
-        done = False
-        while not done:
-            try:
-                response = make_order()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to place an order")
-                time.sleep(1)
-                self.logger.info(Exception)
-
-        def leverage_set():
-            response = self.client.Position.Position_updateLeverage(
-                symbol=self.symbol, leverage=leverage
-            ).result()
-            return response
-
-        done = False
-        while not done:
-            try:
-                response = leverage_set()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to set leverage")
-                time.sleep(1)
-                self.logger.info(Exception)
-
-    def sell_with_leverage(self, price, quantity, leverage):
-        def make_order():
-            if self.simpleOrderQty:
-                response = self.client.Order.Order_new(
-                    price=price,
-                    symbol=self.symbol,
-                    side="Sell",
-                    simpleOrderQty=quantity,
-                ).result()
-            else:
-                response = self.client.Order.Order_new(
-                    price=price,
-                    symbol=self.symbol,
-                    side="Sell",
-                    orderQty=quantity,
-                ).result()
-            return response
-
+    def sell_with_leverage(self, price, quantity, leverage, close_first=False):
         self.logger.info(f"Close sell price: {price}")
-
-        done = False
-        while not done:
-            try:
-                response = make_order()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to place an order")
-                time.sleep(1)
-                self.logger.info(Exception)
-
-        def leverage_set():
-            response = self.client.Position.Position_updateLeverage(
-                symbol=self.symbol, leverage=leverage
-            ).result()
-            return response
-
-        done = False
-        while not done:
-            try:
-                response = leverage_set()
-                done = True
-            except Exception:
-                self.logger.info("503 response, another try to set leverage")
-                time.sleep(1)
-                self.logger.info(Exception)
+        self.place_order("Sell", quantity, leverage, price, close_first)
 
     def cancel_all_orders(self):
         return self.Order.Order_cancelAll().result()
 
     def close_all_orders(self, side):
-        return self.client.Order.Order_new(
-            symbol=self.symbol,
-            execInst="Close"
-        ).result()
+        return self.submit([{'symbol': self.symbol, 'execInst': "Close"}])
 
     def get_last_close(self, timeframe):
-        bitmex_api = ccxt.bitmex({})
-        symbol = 'BTC/USD'
+        if self.market_data is not None:
+            close = self.market_data.last_close(timeframe)
+            if close is not None:
+                return close
+        bitmex_api = get_ccxt_client()
+        symbol = ccxt_symbol(self.symbol)
         limit = 1
         params = {'partial': False}
 
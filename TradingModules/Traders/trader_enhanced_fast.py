@@ -6,9 +6,9 @@ from Traders.base import Trader
 
 class trader_enhanced_fast(Trader):
 
-    def __init__(self, logger, strategy, bitmex_params, deposit_percent, leverage, new_trade_to_average_percent, max_num_of_positions=5, num_of_positions=0, trade_market=False):
+    def __init__(self, logger, strategy, bitmex_params, deposit_percent, leverage, new_trade_to_average_percent, max_num_of_positions=5, num_of_positions=0, trade_market=False, symbol='XBTUSD'):
         Trader.__init__(self, logger=logger, strategy=strategy, bitmex_params=bitmex_params,
-                        leverage=leverage, symbol='XBTUSD', deposit_percent=deposit_percent,
+                        leverage=leverage, symbol=symbol, deposit_percent=deposit_percent,
                         max_num_of_positions=max_num_of_positions, num_of_positions=num_of_positions,
                         new_trade_to_average_percent=new_trade_to_average_percent, trade_market=trade_market)
 
@@ -54,23 +54,23 @@ class trader_enhanced_fast(Trader):
 
 
         # надо закрывать позиции если открыты, а решение противоположное стороне открытых позиций
-        if self.open_position > 0 and (decision == -1):
-            self.logger.info("Selling open positions")
-            self.close_all_orders('SELL')
+        # closed in one request with the first order of the opposite side
+        flip = False
+        if self.open_position > 0 and decision == -1:
+            self.logger.info("Selling open positions with the first order")
+            flip = True
+            self.set_tradable_qty(closing=True)
             self.executed_prices = []
             self.executed_qts = []
             self.number_of_positions = 0
-            #change tradable amount
-            self.set_tradable_qty()
 
-        if self.open_position < 0 and (decision == 1):
-            self.logger.info("Buying open positions")
-            self.close_all_orders('BUY')
+        if self.open_position < 0 and decision == 1:
+            self.logger.info("Buying open positions with the first order")
+            flip = True
+            self.set_tradable_qty(closing=True)
             self.executed_prices = []
             self.executed_qts = []
             self.number_of_positions = 0
-            # change tradable amount
-            self.set_tradable_qty()
 
         # настало время закупиться!
         if decision == -1:
@@ -80,9 +80,10 @@ class trader_enhanced_fast(Trader):
                 self.logger.info("First order")
 
                 if self.trade_market:
-                    self.sell_market_with_leverage(self.tradable_qty, self.leverage)
+                    self.sell_market_with_leverage(self.tradable_qty, self.leverage, close_first=flip)
                 else:
-                    self.sell_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage)
+                    self.sell_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage,
+                                            close_first=flip)
 
                 qty, price = self.get_last_order_info()
                 self.logger.info("Executed qty {}, price {}".format(qty, price))
@@ -118,9 +119,10 @@ class trader_enhanced_fast(Trader):
                 self.logger.info("First order")
 
                 if self.trade_market:
-                    self.buy_market_with_leverage(self.tradable_qty, self.leverage)
+                    self.buy_market_with_leverage(self.tradable_qty, self.leverage, close_first=flip)
                 else:
-                    self.buy_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage)
+                    self.buy_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage,
+                                           close_first=flip)
 
                 qty, price = self.get_last_order_info()
                 self.logger.info("Executed qty {}, price {}".format(qty, price))
@@ -6,9 +6,9 @@ from Traders.base import Trader
 
 class trader_mas_extreme(Trader):
 
-    def __init__(self, logger, strategy, bitmex_params, deposit_percent, leverage, new_trade_to_average_percent, max_num_of_positions=5, num_of_positions=0, piramyding_strategy=True, trade_market=False):
+    def __init__(self, logger, strategy, bitmex_params, deposit_percent, leverage, new_trade_to_average_percent, max_num_of_positions=5, num_of_positions=0, piramyding_strategy=True, trade_market=False, symbol='XBTUSD'):
         Trader.__init__(self, logger=logger, strategy=strategy, bitmex_params=bitmex_params,
-                        leverage=leverage, symbol='XBTUSD', deposit_percent=deposit_percent,
+                        leverage=leverage, symbol=symbol, deposit_percent=deposit_percent,
                         max_num_of_positions=max_num_of_positions, num_of_positions=num_of_positions,
                         new_trade_to_average_percent=new_trade_to_average_percent, trade_market=trade_market)
 
@@ -36,23 +36,23 @@ class trader_mas_extreme(Trader):
 
         if self.piramyding_strategy:
             # надо закрывать позиции если открыты, а решение противоположное стороне открытых позиций
+            # closed in one request with the first order of the opposite side
+            flip = False
             if self.open_position > 0 and decision == -1:
-                self.logger.info("Selling open positions")
-                self.close_all_orders('SELL')
+                self.logger.info("Selling open positions with the first order")
+                flip = True
+                self.set_tradable_qty(closing=True)
                 self.executed_prices = []
                 self.executed_qts = []
                 self.number_of_positions = 0
-                # change tradable amount
-                self.set_tradable_qty()
 
             if self.open_position < 0 and decision == 1:
-                self.logger.info("Buying open positions")
-                self.close_all_orders('BUY')
+                self.logger.info("Buying open positions with the first order")
+                flip = True
+                self.set_tradable_qty(closing=True)
                 self.executed_prices = []
                 self.executed_qts = []
                 self.number_of_positions = 0
-                # change tradable amount
-                self.set_tradable_qty()
 
             # настало время закупиться!
             if decision == -1:
@@ -62,9 +62,10 @@ class trader_mas_extreme(Trader):
                     self.logger.info("First order")
 
                     if self.trade_market:
-                        self.sell_market_with_leverage(self.tradable_qty, self.leverage)
+                        self.sell_market_with_leverage(self.tradable_qty, self.leverage, close_first=flip)
                     else:
-                        self.sell_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage)
+                        self.sell_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage,
+                                                close_first=flip)
 
                     qty, price = self.get_last_order_info()
                     self.logger.info("Executed qty {}, price {}".format(qty, price))
@@ -100,9 +101,10 @@ class trader_mas_extreme(Trader):
                     self.logger.info("First order")
 
                     if self.trade_market:
-                        self.buy_market_with_leverage(self.tradable_qty, self.leverage)
+                        self.buy_market_with_leverage(self.tradable_qty, self.leverage, close_first=flip)
                     else:
-                        self.buy_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage)
+                        self.buy_with_leverage(float(self.get_last_close('1h')), self.tradable_qty, self.leverage,
+                                               close_first=flip)
 
                     qty, price = self.get_last_order_info()
                     self.logger.info("Executed qty {}, price {}".format(qty, price))
@@ -133,17 +135,19 @@ class trader_mas_extreme(Trader):
 
         else:
             # надо закрывать позиции если открыты, а решение противоположное стороне открытых позиций
+            # closed in one request with the first order of the opposite side
+            flip = False
             if self.open_position > 0 and decision == -1:
-                self.logger.info("Selling open positions")
-                self.close_all_orders('SELL')
+                self.logger.info("Selling open positions with the first order")
+                flip = True
+                self.set_tradable_qty(closing=True)
                 self.open_position = 0.0
-                self.set_tradable_qty()
 
             if self.open_position < 0 and decision == 1:
-                self.logger.info("Buying open positions")
-                self.close_all_orders('BUY')
+                self.logger.info("Buying open positions with the first order")
+                flip = True
+                self.set_tradable_qty(closing=True)
                 self.open_position = 0.0
-                self.set_tradable_qty()
 
             #self.update_open_position()
             #self.logger.info(f"Open position: {self.open_position}")
@@ -152,7 +156,7 @@ class trader_mas_extreme(Trader):
             if decision == -1 and self.open_position == 0:
                 self.logger.info("Sell market")
                 # выполненых ордеров у нас нет, значит это должен быть первый
-                self.sell_market_with_leverage(self.tradable_qty, self.leverage)
+                self.sell_market_with_leverage(self.tradable_qty, self.leverage, close_first=flip)
                 #self.sell_with_leverage(self.get_last_close('1h'), self.tradable_qty, self.leverage)
                 qty, price = self.get_last_order_info()
                 self.logger.info("Executed qty {}, price {}".format(qty, price))
@@ -160,7 +164,7 @@ class trader_mas_extreme(Trader):
             if decision == 1 and self.open_position == 0:
                 self.logger.info("Buy market")
                 # выполненых ордеров у нас нет, значит это должен быть первый
-                self.buy_market_with_leverage(self.tradable_qty, self.leverage)
+                self.buy_market_with_leverage(self.tradable_qty, self.leverage, close_first=flip)
                 #self.buy_with_leverage(self.get_last_close('1h'), self.tradable_qty, self.leverage)
                 qty, price = self.get_last_order_info()
                 self.logger.info("Executed qty {}, price {}".format(qty, price))
@@ -0,0 +1,302 @@
+"""
+        Timings of optimized code paths against the code they replaced, on synthetic data.
+
+        Run from repository root:
+            python benchmarks/benchmarks.py            all of them but clients (needs network)
+            python benchmarks/benchmarks.py replay HA  some of them
+
+        Results of the optimized paths are checked by tests/, these only print times.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# BitmexTracker is imported as package from repository root, TradingModules code imports Functions.*
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'TradingModules')]
+
+
+def random_walk(n, freq, step):
+    close = 6000 + np.cumsum(np.random.normal(0, step, n))
+    _open = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({'open': _open, 'high': np.maximum(_open, close) + step / 2,
+                         'low': np.minimum(_open, close) - step / 2, 'close': close, 'volume': 1.},
+                        index=pd.date_range('2018-01-01', periods=n, freq=freq))
+
+
+def benchmark_backtest(years=1):
+    """Backtest of random walk 1m candles, shows time spent on signals and simulation"""
+    import logging
+    from Functions.backtest import backtest, njit, summary
+    from Strategies.strategy_fast_rsi import strategy_fast_rsi
+
+    strategy = strategy_fast_rsi(logging.getLogger('benchmark'), '1m')
+    candles = random_walk(years * 365 * 24 * 60, '1min', 2)
+
+    # first call compiles simulation if numba is available
+    backtest(strategy, candles.iloc[:1000])
+
+    started = time.time()
+    equity, trades = backtest(strategy, candles)
+    print('{} bars of 1m candles backtested in {:.2f}s ({}), {}'.format(
+        len(candles), time.time() - started, 'numba' if njit is not None else 'python loop', summary(equity, trades)))
+
+
+def benchmark_clients(calls=10, test=True):
+    """Startup and per call latency of public request with new client per call and with shared one"""
+    import bitmex
+    from Functions.clients import get_bitmex_client
+
+    start = time.time()
+    for _ in range(calls):
+        client = bitmex.bitmex(test=test)
+        client.Instrument.Instrument_get(symbol='XBTUSD', count=1).result()
+    unpooled = (time.time() - start) / calls
+
+    start = time.time()
+    get_bitmex_client(test=test)
+    startup = time.time() - start
+
+    start = time.time()
+    for _ in range(calls):
+        get_bitmex_client(test=test).Instrument.Instrument_get(symbol='XBTUSD', count=1).result()
+    pooled = (time.time() - start) / calls
+
+    print('new client per call: {:.3f}s per call'.format(unpooled))
+    print('shared client: {:.3f}s startup, {:.3f}s per call'.format(startup, pooled))
+
+
+def benchmark_sweep(years=1, workers=None):
+    """Grid sweep over random walk 1h candles, sequential without cache against pool with shared candles"""
+    from Functions.indicators import IndicatorCache
+    from Functions.optimize import evaluate, grid, sweep
+    from Strategies.strategy_fast_rsi import strategy_fast_rsi
+
+    space = {'rsiperiod1': [7, 9, 14], 'rsilimit1': [19, 25], 'rsiperiod2': [14, 21], 'rsilimit2': [22, 30]}
+    candles = random_walk(years * 365 * 24, '1h', 20)
+    parameter_sets = grid(space)
+
+    started = time.time()
+    for params in parameter_sets:
+        evaluate(strategy_fast_rsi, {'timeperiod': '1h'}, params, {}, candles=candles, cache=IndicatorCache(0))
+    sequential = time.time() - started
+
+    started = time.time()
+    ranked = sweep(strategy_fast_rsi, candles, space, workers=workers)
+    parallel = time.time() - started
+
+    print('{} parameter sets: sequential {:.2f}s, pool {:.2f}s, mean cache hit rate {:.2f}'.format(
+        len(parameter_sets), sequential, parallel, ranked['cache_hit_rate'].mean()))
+
+
+def benchmark_HA(sizes=(500, 50000, 5000000)):
+    """Heiken Ashi open as python loop against lfilter"""
+    from Functions.data_preparation import ha_open_filter, ha_open_loop
+
+    for size in sizes:
+        close = 10000 + np.cumsum(np.random.randn(size))
+        _open = np.roll(close, 1)
+
+        start = time.time()
+        ha_open_loop(_open, close)
+        loop_time = time.time() - start
+
+        start = time.time()
+        ha_open_filter(_open, close)
+        filter_time = time.time() - start
+
+        print('{} bars: loop {:.4f}s, vectorized {:.4f}s, speedup x{:.1f}'.format(
+            size, loop_time, filter_time, loop_time / max(filter_time, 1e-9)))
+
+
+def benchmark_flip(reversals=20, latency=0.05):
+    """
+            Position reversals against mock exchange with `latency` per request: close, then entry
+            with leverage (three requests) against one bulk request of both with leverage cached
+            """
+    from Functions.clients import get_bitmex_client
+    from Functions.mock_exchange import MockExchange
+    from Functions.order_gateway import OrderGateway
+
+    results = {}
+    for name in ('sequential', 'bulk'):
+        exchange = MockExchange(latency=latency)
+        client = get_bitmex_client(base_url=exchange.start(), api_key='mock', api_secret='mock')
+        gateway = OrderGateway.get(client)
+        started = time.time()
+        for i in range(reversals):
+            side = 'Buy' if i % 2 == 0 else 'Sell'
+            entry = {'symbol': 'XBTUSD', 'side': side, 'orderQty': 100}
+            if name == 'sequential':
+                gateway.submit({'symbol': 'XBTUSD', 'execInst': 'Close'})
+                gateway.leverages.clear()
+                gateway.submit(entry, leverage=5)
+            else:
+                gateway.submit_bulk([{'symbol': 'XBTUSD', 'execInst': 'Close'}, entry], leverage=5)
+        results[name] = (time.time() - started, len(exchange.requests))
+        exchange.stop()
+
+    for name, (seconds, requests) in results.items():
+        print('{}: {} reversals in {:.2f}s, {} requests'.format(name, reversals, seconds, requests))
+
+
+def benchmark_service(days=30, periods=('5m', '15m', '30m', '1h', '1d')):
+    """Incremental update of higher periods from 1m bars against resampling the whole frame every minute"""
+    from Functions.candle_service import COLUMNS, MINUTE, CandleSeries, CandleService
+    from Functions.candle_store import timeperiod_seconds
+
+    n = days * 24 * 60
+    start = 1546300800000
+    close = 6000 + np.cumsum(np.random.normal(0, 2, n))
+    minutes = np.column_stack((start + np.arange(n) * MINUTE, np.r_[close[0], close[:-1]], close + 1, close - 1,
+                               close, np.ones(n))).tolist()
+
+    # series are added directly, seeding would download history
+    service = CandleService('XBTUSD')
+    for timeperiod in periods:
+        period = timeperiod_seconds(timeperiod) * 1000
+        service.series[period] = CandleSeries(period, CandleService.limit)
+        service.partial[period] = None
+
+    window = 1440
+    started = time.time()
+    for minute in minutes[-window:]:
+        service.ingest(minute)
+        for period in service.series:
+            service.series[period].frame()
+    incremental = (time.time() - started) / window
+
+    frame = pd.DataFrame(minutes, columns=['timestamp'] + COLUMNS)
+    frame.index = pd.to_datetime(frame.pop('timestamp'), unit='ms')
+    started = time.time()
+    for end in range(n - 10, n):
+        for timeperiod in periods:
+            frame.iloc[:end].resample('{}s'.format(timeperiod_seconds(timeperiod))).agg(
+                {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+    resampling = (time.time() - started) / 10
+
+    print('{} periods over {} days of 1m bars: resample {:.4f}s per minute, incremental {:.6f}s per minute'.format(
+        len(periods), days, resampling, incremental))
+
+
+def benchmark_replay(orders=10000, seconds=86400):
+    """Day of 1s random walk ticks with `orders` resting limit orders, per tick on_tick() loop against replay()"""
+    from BitmexTracker.ExchangeSimulator import ExchangeSimulator
+
+    timestamps = 1546300800 * 10 ** 9 + np.arange(seconds, dtype=np.int64) * 10 ** 9
+    last = np.round((6000 + np.cumsum(np.random.normal(0, 1, seconds))) * 2) / 2
+    bid, ask = last - 0.5, last
+    volume = np.random.exponential(1000, seconds)
+
+    def book(i):
+        return np.array([[bid[i], 100000.]]), np.array([[ask[i], 100000.]])
+
+    def prepared():
+        random = np.random.RandomState(0)
+        exchange = ExchangeSimulator(balance=10000.)
+        exchange.on_tick(timestamps[0], last[0], *book(0))
+        for _ in range(orders // 2):
+            exchange.new_order(side='Buy', orderQty=100, price=np.round(last[0] - random.uniform(1, 300)))
+            exchange.new_order(side='Sell', orderQty=100, price=np.round(last[0] + random.uniform(1, 300)))
+        return exchange
+
+    exchange = prepared()
+    started = time.time()
+    for i in range(1, seconds):
+        exchange.on_tick(timestamps[i], last[i], *book(i), volume=volume[i])
+    loop_time = time.time() - started
+
+    exchange = prepared()
+    started = time.time()
+    applied = exchange.replay(timestamps[1:], last[1:], bid[1:], ask[1:], volume[1:], lambda i: book(i + 1))
+    replay_time = time.time() - started
+
+    print('{} orders, {} ticks: on_tick loop {:.2f}s, replay {:.2f}s ({} ticks applied)'.format(
+        orders, seconds, loop_time, replay_time, applied))
+
+
+def benchmark_aggregate(levels=5000, runs=100):
+    """Order book levels binned by rounded price, pandas groupby against numpy"""
+    from BitmexTracker.OrderBook import aggregate
+
+    prices = np.arange(levels) * 0.5 + 6000
+    sizes = np.random.randint(1, 100000, levels).astype(float)
+    frame = pd.DataFrame({'price': prices, 'size': sizes})
+
+    started = time.time()
+    for _ in range(runs):
+        for decimals in (-1, -2):
+            frame.assign(price=frame['price'].round(decimals)).groupby(['price']).agg({'size': 'sum'}).reset_index()
+    pandas_time = (time.time() - started) / runs
+
+    started = time.time()
+    for _ in range(runs):
+        for decimals in (-1, -2):
+            aggregate(prices, sizes, decimals)
+    numpy_time = (time.time() - started) / runs
+
+    print('{} levels: groupby {:.6f}s, binning {:.6f}s, x{:.1f}'.format(
+        levels, pandas_time, numpy_time, pandas_time / numpy_time))
+
+
+def benchmark_cache(windows=(timedelta(hours=24), timedelta(days=7), timedelta(days=30)), levels=30):
+    """
+            Read time of CSV and columnar caches for order book batches. One hour of one-second
+            order book snapshots is written in both formats and read as many times as there are
+            hours in window, so disk usage stays small.
+            """
+    from BitmexTracker.DataManager import CACHE_SUFFIX, read_columnar, read_csv_batch, write_columnar
+
+    path = tempfile.mkdtemp()
+    index = pd.date_range('2018-01-01', periods=3600, freq='s', name='timestamp')
+    prices = 6000 + np.arange(levels) * 0.5
+    df = pd.DataFrame({
+        'asks': [[[float(p), float(np.random.randint(1, 10000))] for p in prices] for _ in index],
+        'bids': [[[float(p) + 100, float(np.random.randint(1, 10000))] for p in prices] for _ in index],
+    }, index=index)
+
+    csv_filename = os.path.join(path, 'batch.csv')
+    columnar_path = os.path.join(path, 'batch' + CACHE_SUFFIX)
+    df.to_csv(csv_filename)
+    write_columnar(columnar_path, df)
+
+    readers = [('csv', lambda: read_csv_batch(csv_filename, parse=False)),
+               ('csv + parsing levels', lambda: read_csv_batch(csv_filename)),
+               ('columnar', lambda: read_columnar(columnar_path))]
+    try:
+        for window in windows:
+            hours = int(window.total_seconds() // 3600)
+            results = []
+            for name, reader in readers:
+                started = time.time()
+                pd.concat([reader() for _ in range(hours)])
+                results.append('{} {:.2f}s'.format(name, time.time() - started))
+            print('{}: {}'.format(window, ', '.join(results)))
+    finally:
+        shutil.rmtree(path)
+
+
+BENCHMARKS = {
+    'backtest': benchmark_backtest,
+    'clients': benchmark_clients,
+    'sweep': benchmark_sweep,
+    'HA': benchmark_HA,
+    'flip': benchmark_flip,
+    'service': benchmark_service,
+    'replay': benchmark_replay,
+    'aggregate': benchmark_aggregate,
+    'cache': benchmark_cache,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or [name for name in BENCHMARKS if name != 'clients']
+    for name in names:
+        print('== {}'.format(name))
+        BENCHMARKS[name]()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# BitmexTracker is imported as package from repository root, TradingModules code imports Functions.* as
+# main_loop does when it runs from TradingModules directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'TradingModules')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from Functions.candle_service import COLUMNS, MINUTE, CandleSeries, CandleService, aggregate_bars
+from Functions.candle_store import timeperiod_seconds
+
+PERIODS = ('5m', '15m', '1h', '1d')
+
+
+def random_minutes(n, seed=0):
+    random = np.random.RandomState(seed)
+    close = 6000 + np.cumsum(random.normal(0, 2, n))
+    return np.column_stack((1546300800000 + np.arange(n) * MINUTE, np.r_[close[0], close[:-1]], close + 1,
+                            close - 1, close, random.uniform(1, 10, n))).tolist()
+
+
+def resampled(minutes, timeperiod):
+    frame = pd.DataFrame(minutes, columns=['timestamp'] + COLUMNS)
+    frame.index = pd.to_datetime(frame.pop('timestamp').astype('int64'), unit='ms')
+    period = timeperiod_seconds(timeperiod)
+    bars = frame.resample('{}s'.format(period)).agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+    # only buckets whose last minute arrived are closed
+    return bars[bars.index + pd.Timedelta(seconds=period) <= frame.index[-1] + pd.Timedelta(minutes=1)]
+
+
+def test_ingested_minutes_match_resample():
+    minutes = random_minutes(3 * 24 * 60 + 17)
+    service = CandleService('XBTUSD')
+    for timeperiod in PERIODS:
+        period = timeperiod_seconds(timeperiod) * 1000
+        service.series[period] = CandleSeries(period, 100)
+        service.partial[period] = None
+    for minute in minutes:
+        service.ingest(minute)
+    # repeated minute is ignored
+    service.ingest(minutes[-1])
+
+    for timeperiod in PERIODS:
+        period = timeperiod_seconds(timeperiod) * 1000
+        expected = resampled(minutes, timeperiod).iloc[-100:]
+        frame = service.series[period].frame()
+        assert frame.index.equals(expected.index)
+        np.testing.assert_allclose(frame.values, expected.values)
+
+
+def test_aggregate_bars_matches_resample():
+    # ten whole hours
+    minutes = random_minutes(600, seed=1)
+    for timeperiod in ('5m', '1h'):
+        bars = np.array(aggregate_bars(minutes, timeperiod_seconds(timeperiod) * 1000))
+        expected = resampled(minutes, timeperiod)
+        assert pd.to_datetime(bars[:, 0].astype('int64'), unit='ms').equals(expected.index)
+        np.testing.assert_allclose(bars[:, 1:], expected.values)
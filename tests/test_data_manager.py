@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from BitmexTracker.DataManager import CACHE_SUFFIX, DataManager, read_columnar, read_csv_batch, write_columnar
+
+
+class FakeES():
+    """Single page scroll over documents, sliced by position"""
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def search(self, index, scroll, size, body, sort=None):
+        documents = self.documents
+        if 'slice' in body:
+            documents = documents[body['slice']['id']::body['slice']['max']]
+        hits = [{'_source': document} for document in documents]
+        return {'_scroll_id': 'id', 'hits': {'hits': hits, 'total': len(hits)}}
+
+    def scroll(self, scroll_id, scroll):
+        return {'_scroll_id': scroll_id, 'hits': {'hits': [], 'total': 0}}
+
+    def clear_scroll(self, scroll_id):
+        pass
+
+
+def manager(documents):
+    data_manager = DataManager.__new__(DataManager)
+    data_manager.es = FakeES(documents)
+    data_manager.index_prefix = 'btcusd.bitmex'
+    data_manager.scroll_time = '30m'
+    return data_manager
+
+
+def download(documents, slices):
+    return manager(documents).download_data_by_time('ticker', time_from=pd.Timestamp('2019-01-01'),
+                                                    time_to=pd.Timestamp('2019-01-02'), slices=slices)
+
+
+def test_sliced_download_matches_single_scroll():
+    documents = [{'timestamp': '2019-01-01 00:00:0{}.000'.format(i % 3), 'last': float(i)} for i in range(9)]
+    single = download(documents, 1)
+    for slices in (2, 3):
+        sliced = download(documents, slices)
+        assert sliced.index.equals(single.index)
+        assert sorted(sliced['last']) == sorted(single['last'])
+        assert sliced.index.is_monotonic_increasing
+
+
+def test_empty_hour():
+    for slices in (1, 4):
+        df = download([], slices)
+        assert len(df) == 0
+        assert isinstance(df.index, pd.DatetimeIndex)
+
+
+def test_columnar_cache_reads_as_csv_cache(tmp_path):
+    index = pd.date_range('2018-01-01', periods=50, freq='s', name='timestamp')
+    random = np.random.RandomState(0)
+    df = pd.DataFrame({
+        'asks': [[[6000. + level, float(random.randint(1, 100))] for level in range(random.randint(1, 5))]
+                 for _ in index],
+        'last': random.uniform(6000, 6010, len(index)),
+    }, index=index)
+    df.to_csv(str(tmp_path / 'batch.csv'))
+    write_columnar(str(tmp_path / ('batch' + CACHE_SUFFIX)), df)
+
+    csv = read_csv_batch(str(tmp_path / 'batch.csv'))
+    columnar = read_columnar(str(tmp_path / ('batch' + CACHE_SUFFIX)))
+    assert columnar.index.equals(csv.index)
+    np.testing.assert_allclose(columnar['last'].values, csv['last'].values)
+    for expected, levels in zip(csv['asks'], columnar['asks']):
+        assert np.array_equal(np.asarray(levels), np.asarray(expected))
@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+from Functions.data_preparation import add_HA, ha_open_filter, ha_open_loop
+
+
+def test_ha_open_filter_matches_loop():
+    random = np.random.RandomState(0)
+    for size in (1, 2, 500, 50000):
+        close = 10000 + np.cumsum(random.randn(size))
+        _open = np.roll(close, 1)
+        assert np.array_equal(ha_open_loop(_open, close), ha_open_filter(_open, close))
+        previous = (9999.5, 10000.25)
+        assert np.array_equal(ha_open_loop(_open, close, previous), ha_open_filter(_open, close, previous))
+
+
+def test_incremental_HA_matches_full():
+    random = np.random.RandomState(1)
+    close = 10000 + np.cumsum(random.randn(300))
+    df = pd.DataFrame({'open': np.r_[close[0], close[:-1]], 'high': close + 1, 'low': close - 2, 'close': close})
+
+    full = add_HA(df.copy())
+    incremental = add_HA(df.iloc[:200].copy())
+    incremental = add_HA(pd.concat([incremental, df.iloc[200:]]), incremental=True)
+    pd.testing.assert_frame_equal(full, incremental, check_exact=True)
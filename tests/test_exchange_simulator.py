@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from BitmexTracker.ExchangeSimulator import ExchangeSimulator, fill_forward, last_valid
+
+
+def test_fill_forward():
+    values = np.array([np.nan, 1., np.nan, np.nan, 2., np.nan])
+    assert np.array_equal(fill_forward(values), [np.nan, 1., 1., 1., 2., 2.], equal_nan=True)
+    assert fill_forward(values, 0.5).tolist() == [0.5, 1., 1., 1., 2., 2.]
+    assert last_valid(np.array([False, True, False, True])).tolist() == [-1, 1, 1, 3]
+    assert len(fill_forward(np.array([]))) == 0
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_replay_matches_on_tick_loop(seed):
+    """
+            Ticks with resting limit and stop orders and leveraged position. Three of ten ticks have no
+            trade and no book (NaN last), replay gets them forward filled as BitmexProxy.tick() passes them.
+            """
+    ticks, orders = 4000, 400
+    random = np.random.RandomState(seed)
+    timestamps = 1546300800 * 10 ** 9 + np.arange(ticks, dtype=np.int64) * 10 ** 9
+    prices = np.round((6000 + np.cumsum(random.normal(0, 1, ticks))) * 2) / 2
+    quoted = random.uniform(size=ticks) >= 0.3
+    quoted[0] = True
+    last = np.where(quoted, prices, np.nan)
+    bid, ask = last - 0.5, last
+    volume = random.exponential(1000, ticks)
+
+    def book(i):
+        if not quoted[i]:
+            return None, None
+        return np.array([[bid[i], 100000.]]), np.array([[ask[i], 100000.]])
+
+    def prepared():
+        random = np.random.RandomState(0)
+        exchange = ExchangeSimulator(balance=10000.)
+        # deep book at start, so resting orders have queue ahead of them which later volume eats
+        levels = np.arange(300) + 1.
+        exchange.on_tick(timestamps[0], last[0], np.column_stack([last[0] - levels, np.full(300, 3000.)]),
+                         np.column_stack([last[0] + levels, np.full(300, 3000.)]))
+        exchange.set_leverage(10)
+        exchange.new_order(side='Buy', orderQty=100000)
+        for _ in range(orders // 4):
+            exchange.new_order(side='Buy', orderQty=100, price=np.round(last[0] - random.uniform(1, 300)))
+            exchange.new_order(side='Sell', orderQty=100, price=np.round(last[0] + random.uniform(1, 300)))
+            exchange.new_order(side='Buy', orderQty=100, stopPx=np.round(last[0] + random.uniform(1, 300)))
+            exchange.new_order(side='Sell', orderQty=100, stopPx=np.round(last[0] - random.uniform(1, 300)))
+        return exchange
+
+    looped = prepared()
+    for i in range(1, ticks):
+        looped.on_tick(timestamps[i], last[i], *book(i), volume=volume[i])
+
+    replayed = prepared()
+    quoted_rows = last_valid(quoted)
+    applied = replayed.replay(timestamps[1:], fill_forward(last)[1:], fill_forward(bid)[1:], fill_forward(ask)[1:],
+                              volume[1:], lambda i: book(quoted_rows[i + 1]))
+
+    assert applied < ticks - 1
+    assert len(looped.executions) > 1
+    assert replayed.contracts == looped.contracts
+    assert replayed.wallet == pytest.approx(looped.wallet, abs=1e-8)
+    assert len(replayed.executions) == len(looped.executions)
+    assert replayed.last == looped.last
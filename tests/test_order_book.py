@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from BitmexTracker.OrderBook import OrderBook, aggregate
+
+
+def test_aggregate_matches_groupby():
+    prices = np.arange(5000) * 0.5 + 6000
+    sizes = np.random.RandomState(0).randint(1, 100000, 5000).astype(float)
+    frame = pd.DataFrame({'price': prices, 'size': sizes})
+    for decimals in (-1, -2):
+        expected = frame.assign(price=frame['price'].round(decimals)).groupby('price')['size'].sum()
+        binned, summed = aggregate(prices, sizes, decimals)
+        assert np.array_equal(binned, expected.index.values)
+        assert np.array_equal(summed, expected.values)
+
+
+def test_deltas():
+    book = OrderBook()
+    book.apply('partial', [{'id': 1, 'side': 'Buy', 'price': 100., 'size': 5},
+                           {'id': 2, 'side': 'Buy', 'price': 99.5, 'size': 7},
+                           {'id': 3, 'side': 'Sell', 'price': 100.5, 'size': 3}])
+    book.apply('update', [{'id': 1, 'side': 'Buy', 'size': 6}])
+    book.apply('insert', [{'id': 4, 'side': 'Sell', 'price': 101., 'size': 1}])
+    book.apply('delete', [{'id': 2, 'side': 'Buy'}])
+
+    (buy_prices, buy_sizes), (sell_prices, sell_sizes) = book.snapshot()
+    assert buy_prices.tolist() == [100.] and buy_sizes.tolist() == [6.]
+    assert sell_prices.tolist() == [100.5, 101.] and sell_sizes.tolist() == [3., 1.]
@@ -0,0 +1,75 @@
+import pytest
+
+from Functions.clients import get_bitmex_client
+from Functions.mock_exchange import MockExchange
+from Functions.order_gateway import OrderGateway
+
+CLOSE = {'symbol': 'XBTUSD', 'execInst': 'Close'}
+
+
+@pytest.fixture
+def exchange():
+    exchange = MockExchange(price=10000.)
+    exchange.base_url = exchange.start()
+    yield exchange
+    exchange.stop()
+
+
+def gateway_of(exchange):
+    return OrderGateway.get(get_bitmex_client(base_url=exchange.base_url, api_key='mock', api_secret='mock'))
+
+
+def orders_sent(exchange):
+    return [request for request in exchange.requests if request[1].endswith(('/order', '/order/bulk'))]
+
+
+def test_flip_is_one_request(exchange):
+    gateway = gateway_of(exchange)
+    gateway.submit({'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 100}, leverage=5)
+    assert exchange.contracts == 100
+
+    sent = len(orders_sent(exchange))
+    close, entry = gateway.submit_bulk([CLOSE, {'symbol': 'XBTUSD', 'side': 'Sell', 'orderQty': 200}], leverage=5)
+    assert exchange.contracts == -200
+    assert close['ordStatus'] == entry['ordStatus'] == 'Filled'
+    assert len(orders_sent(exchange)) == sent + 1
+    # exchange confirmed leverage with the first order, so it is not sent again
+    assert gateway.stats() == {'leverage_calls': 1, 'leverage_calls_saved': 1}
+
+
+def test_bracket_stop_closes_position(exchange):
+    gateway = gateway_of(exchange)
+    entry, stop, take_profit = gateway.submit_bulk([
+        {'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 100},
+        {'symbol': 'XBTUSD', 'side': 'Sell', 'ordType': 'Stop', 'stopPx': 9900., 'execInst': 'Close,LastPrice'},
+        {'symbol': 'XBTUSD', 'side': 'Sell', 'orderQty': 100, 'price': 10100., 'execInst': 'ReduceOnly'},
+    ])
+    assert entry['ordStatus'] == 'Filled' and stop['ordStatus'] == take_profit['ordStatus'] == 'New'
+    assert exchange.contracts == 100
+
+    exchange.set_price(9800.)
+    assert exchange.contracts == 0
+    # take profit can't reduce position which is gone
+    exchange.set_price(10200.)
+    assert exchange.contracts == 0
+
+
+def test_failed_request_is_retried(exchange):
+    gateway = gateway_of(exchange)
+    exchange.fail(503)
+    order = gateway.submit({'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 100})
+    assert order['ordStatus'] == 'Filled'
+    assert exchange.contracts == 100
+    assert len(orders_sent(exchange)) == 2
+
+
+def test_duplicate_clordid_is_looked_up_and_rest_is_resent(exchange):
+    gateway = gateway_of(exchange)
+    placed = gateway.submit({'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 100, 'clOrdID': 'first'})
+
+    # bulk with order which reached exchange before is rejected as whole
+    first, second = gateway.submit_bulk([{'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 100, 'clOrdID': 'first'},
+                                         {'symbol': 'XBTUSD', 'side': 'Buy', 'orderQty': 50, 'clOrdID': 'second'}])
+    assert first['orderID'] == placed['orderID']
+    assert second['clOrdID'] == 'second' and second['ordStatus'] == 'Filled'
+    assert exchange.contracts == 150
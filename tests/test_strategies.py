@@ -0,0 +1,38 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Strategies.strategy_enhanced_fast import strategy_enhanced_fast
+from Strategies.strategy_fast_rsi import strategy_fast_rsi
+from Strategies.strategy_mas_extreme import strategy_mas_extreme
+
+# indicators of streaming and whole-history code agree once their windows are filled
+WARMUP = 50
+
+
+def random_candles(n, seed):
+    random = np.random.RandomState(seed)
+    close = np.round((6000 + np.cumsum(random.normal(0, 10, n))) * 2) / 2
+    _open = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({'open': _open, 'high': np.maximum(_open, close) + random.uniform(0, 5, n),
+                         'low': np.minimum(_open, close) - random.uniform(0, 5, n), 'close': close, 'volume': 1.},
+                        index=pd.date_range('2019-01-01', periods=n, freq='1h'))
+
+
+@pytest.mark.parametrize('strategy_class', [strategy_fast_rsi, strategy_enhanced_fast, strategy_mas_extreme])
+@pytest.mark.parametrize('seed', range(3))
+def test_streaming_prediction_matches_signals(strategy_class, seed):
+    candles = random_candles(400, seed)
+    decision, exit_long, exit_short = strategy_class(logging.getLogger('test'), '1h').signals(candles)
+
+    strategy = strategy_class(logging.getLogger('test'), '1h')
+    for i in range(len(candles)):
+        predicted = strategy.make_prediction(candles.iloc[:i + 1])
+        if i < WARMUP:
+            continue
+        assert predicted == decision[i], i
+        if strategy_class is not strategy_mas_extreme:
+            assert strategy.need_exit(1.) == exit_long[i], i
+            assert strategy.need_exit(-1.) == exit_short[i], i
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from BitmexTracker.TickStore import TickStore
+
+
+def frame(start, rows):
+    index = pd.date_range(start, periods=len(rows), freq='s')
+    return pd.DataFrame(rows, index=index)
+
+
+def test_order_book_column_with_nan_first_row(tmp_path):
+    df = frame('2019-01-01', [
+        {'last': 10.5, 'asks': np.nan},
+        {'last': 10.5, 'asks': [[10, 1], [11, 2]]},
+        {'last': np.nan, 'asks': [[10.5, 3]]},
+    ])
+    store = TickStore.build(str(tmp_path / 'store'), [df], levels=4)
+
+    assert set(store.columns) == {'last', 'asks', 'asks_depth'}
+    assert list(store.columns['asks_depth']) == [0, 2, 1]
+    assert np.isnan(store.columns['asks'][0]).all()
+    assert store.columns['asks'][1, :2].tolist() == [[10, 1], [11, 2]]
+
+
+def test_columns_first_seen_in_later_chunk(tmp_path):
+    chunks = [
+        frame('2019-01-01 00:00', [{'last': 1., 'bids': None}, {'last': 2., 'bids': None}]),
+        frame('2019-01-01 01:00', [{'last': 3., 'bids': [[2.5, 7]], 'volume': 5}]),
+    ]
+    chunks[1]['volume'] = chunks[1]['volume'].astype(object)
+    store = TickStore.build(str(tmp_path / 'store'), chunks, levels=2)
+
+    assert len(store) == 3
+    assert list(store.columns['bids_depth']) == [0, 0, 1]
+    assert store.columns['bids'][2, 0].tolist() == [2.5, 7]
+    assert np.isnan(store.columns['volume'][:2]).all() and store.columns['volume'][2] == 5
+    ticks = store.range(pd.Timestamp('2019-01-01 00:00:01'), pd.Timestamp('2019-01-02'))
+    assert list(ticks['last']) == [2., 3.]
+
+
+def test_chunks_out_of_order(tmp_path):
+    chunks = [frame('2019-01-01 01:00', [{'last': 1.}]), frame('2019-01-01 00:00', [{'last': 2.}])]
+    with pytest.raises(ValueError):
+        TickStore.build(str(tmp_path / 'store'), chunks)
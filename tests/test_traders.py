@@ -0,0 +1,43 @@
+import logging
+
+import pytest
+
+from Functions.mock_exchange import MockExchange
+from Traders.trader_fast_rsi import trader_fast_rsi
+
+
+class Decisions():
+
+    def __init__(self):
+        self.decision = 0
+
+    def make_prediction(self, candles):
+        return self.decision
+
+    def need_exit(self, position_size):
+        return False
+
+
+@pytest.fixture
+def exchange():
+    exchange = MockExchange(price=10000., balance=1.)
+    yield exchange
+    exchange.stop()
+
+
+def test_reversal_entry_is_sized_from_balance_after_close(exchange):
+    strategy = Decisions()
+    trader = trader_fast_rsi(logging.getLogger('test'), strategy,
+                             {'base_url': exchange.start(), 'api_key': 'mock', 'api_secret': 'mock'},
+                             deposit_percent=0.5, leverage=2, new_trade_to_average_percent=0.01, trade_market=True)
+
+    strategy.decision = 1
+    trader.exec_trade(None)
+    assert exchange.contracts == 10000
+
+    # long of 1 XBT loses a quarter of balance, entry of reversal is 0.75 XBT at new price
+    exchange.set_price(8000.)
+    strategy.decision = -1
+    trader.exec_trade(None)
+    assert exchange.contracts == -6000
+    assert trader.tradable_qty == pytest.approx(0.75)